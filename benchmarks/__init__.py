@@ -0,0 +1 @@
+"""Бенчмарки браузерного агента (запуск: python -m benchmarks.<модуль> из корня репозитория)"""
@@ -0,0 +1,137 @@
+"""
+Сквозной офлайн-бенчмарк цикла think_and_act.
+
+Вместо настоящей модели используется replay_llm.ScriptedLLM со сценарием поиска
+на локальной фикстуре (search.html → results.html) и заданной искусственной
+задержкой. Время каждой задачи раскладывается на «модель» (суммарная задержка
+ScriptedLLM) и «агент» (всё остальное: браузер, инструменты, промпты).
+
+Запуск (из корня репозитория):
+    python -m benchmarks.bench_agent --runs 10 --latency-ms 800 --concurrency 4
+    python -m benchmarks.bench_agent --runs 5 --profile   # + cProfile в benchmarks/results/agent.prof
+
+Без сети: сначала записать HAR (порт фиксированный — адреса в архиве должны
+совпасть), затем прогнать из архива, не поднимая сервер фикстур:
+    python -m benchmarks.bench_agent --runs 1 --port 8765 --record-har benchmarks/results/har
+    python -m benchmarks.bench_agent --runs 10 --port 8765 --replay-har benchmarks/results/har/<имя>.har
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import tempfile
+import time
+from contextlib import nullcontext
+from typing import Dict, Any, List, Optional
+
+from benchmarks.bench_tools import percentile
+from benchmarks.fixtures import write_fixtures
+from benchmarks.server import FixtureServer
+from browser_agent import AsyncBrowserAgent
+from config import Config
+from context_pool import BrowserContextPool
+from replay_llm import ScriptedLLM, search_task_policy
+
+
+async def _run_one(pool: BrowserContextPool, start_url: str, latency_ms: float, seed: int,
+                   record_har_dir: Optional[str] = None, replay_har_path: Optional[str] = None) -> Dict[str, Any]:
+    llm = ScriptedLLM(
+        policy=search_task_policy(start_url, "котики"),
+        latency_ms=latency_ms,
+        jitter_ms=latency_ms * 0.1,
+        seed=seed
+    )
+    agent = AsyncBrowserAgent(pool=pool, llm_client=llm, record_har_dir=record_har_dir,
+                              replay_har_path=replay_har_path)
+    start = time.perf_counter()
+    result = await agent.think_and_act("Найди котиков", max_steps=10)
+    wall_ms = (time.perf_counter() - start) * 1000
+    llm_ms = llm.stats["latency_ms_total"]
+    return {
+        "wall_ms": wall_ms,
+        "llm_ms": llm_ms,
+        "agent_ms": wall_ms - llm_ms,
+        "llm_calls": llm.stats["calls"],
+        "success": result.startswith("✅"),
+        "spans": agent.last_trace.summary() if agent.last_trace else {}
+    }
+
+
+async def run(runs: int, latency_ms: float, concurrency: int, port: int = 0,
+              record_har_dir: Optional[str] = None, replay_har_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    # Бенчмарк не должен зависеть от демонстрационных настроек браузера
+    Config.BROWSER_HEADLESS = True
+    Config.BROWSER_SLOW_MO = 0
+    # Каждый прогон проходит весь цикл с моделью: макросы и кэш ответов исказили бы замер
+    Config.MACROS_ENABLED = False
+    Config.LLM_CACHE_PATH = None
+
+    directory = tempfile.mkdtemp(prefix="bench_agent_")
+    write_fixtures(directory)
+    results = []
+    # При воспроизведении сервер не запускается: все ответы берутся из HAR
+    with (nullcontext() if replay_har_path else FixtureServer(directory, port)) as server:
+        start_url = server.url("search.html") if server else f"http://127.0.0.1:{port}/search.html"
+        pool = BrowserContextPool(size=concurrency, storage_path=os.path.join(directory, "no_state.json"))
+        await pool.start()
+        try:
+            for batch_start in range(0, runs, concurrency):
+                batch = range(batch_start, min(runs, batch_start + concurrency))
+                results += await asyncio.gather(*[
+                    _run_one(pool, start_url, latency_ms, seed, record_har_dir, replay_har_path)
+                    for seed in batch
+                ])
+        finally:
+            if replay_har_path:
+                print(f"📼 Промахов по HAR: {pool.stats['har_misses']}")
+            await pool.close()
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {"runs": len(results), "success": sum(r["success"] for r in results)}
+    for key in ("wall_ms", "llm_ms", "agent_ms"):
+        values = [r[key] for r in results]
+        summary[f"{key}_p50"] = round(percentile(values, 50), 1)
+        summary[f"{key}_p95"] = round(percentile(values, 95), 1)
+    summary["llm_calls_p50"] = percentile([r["llm_calls"] for r in results], 50)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--output", default="benchmarks/results/agent.json")
+    parser.add_argument("--port", type=int, default=0, help="Порт сервера фикстур; 0 — случайный")
+    parser.add_argument("--record-har", help="Каталог для HAR и трассы каждой задачи")
+    parser.add_argument("--replay-har", help="HAR, из которого отдаются все ответы (сервер не запускается)")
+    args = parser.parse_args()
+    if args.replay_har and not args.port:
+        parser.error("--replay-har требует --port, с которым архив был записан")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    results = asyncio.run(run(args.runs, args.latency_ms, args.concurrency, args.port,
+                              args.record_har, args.replay_har))
+    if profiler:
+        profiler.disable()
+        profile_path = os.path.join(os.path.dirname(args.output), "agent.prof")
+        profiler.dump_stats(profile_path)
+        print(f"📈 Профиль: {profile_path}")
+
+    summary = summarize(results)
+    for key, value in summary.items():
+        print(f"{key:<16} {value}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "runs": results}, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Результаты сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
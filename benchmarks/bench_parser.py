@@ -0,0 +1,195 @@
+"""
+Бенчмарк разбора вызовов инструментов из ответов модели.
+
+Корпус — типичные некорректные ответы LLM (собраны по образцу ошибок,
+которые встречаются в трассах: одинарные кавычки, висячие запятые, блоки
+```json```, текст вокруг JSON, оборванный ответ, апострофы в значениях,
+несколько объектов подряд). Для каждого ответа известен ожидаемый инструмент.
+
+Сравниваются прежний extract_json_from_text (подсчёт скобок + замена всех
+одинарных кавычек) и tool_parser.parse_tool_reply: доля разобранных ответов,
+доля ответов с правильными инструментом и аргументами, число сэкономленных
+корректирующих ходов «ОШИБКА ФОРМАТА» и время разбора одного ответа.
+
+Запуск (из корня репозитория):
+    python -m benchmarks.bench_parser --repeat 200
+"""
+import argparse
+import json
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import browser_agent  # noqa: F401 — регистрирует инструменты в TOOLS
+from tool_parser import parse_tool_reply
+from tool_registry import TOOLS
+
+# (ответ модели, ожидаемый инструмент, ожидаемые аргументы); None — вызова в ответе нет
+CORPUS: List[Tuple[str, Optional[str], Dict[str, Any]]] = [
+    ('{"tool": "navigate", "args": {"url": "https://yandex.ru"}}',
+     "navigate", {"url": "https://yandex.ru"}),
+    ('Открою поисковик.\n{"tool": "navigate", "args": {"url": "https://ya.ru"}}',
+     "navigate", {"url": "https://ya.ru"}),
+    ('```json\n{"tool": "click_element_by_index", "args": {"index": 12}}\n```',
+     "click_element_by_index", {"index": 12}),
+    ("{'tool': 'press_enter', 'args': {}}",
+     "press_enter", {}),
+    ("{'tool': 'fill_field_by_index', 'args': {'index': 3, 'value': 'котики'}}",
+     "fill_field_by_index", {"index": 3, "value": "котики"}),
+    ('{"tool": "fill_field_by_index", "args": {"index": 3, "value": "rock\'n\'roll"}}',
+     "fill_field_by_index", {"index": 3, "value": "rock'n'roll"}),
+    ('{"tool": "fill_field_by_index", "args": {"index": 7, "value": "McDonald\'s рядом"}}',
+     "fill_field_by_index", {"index": 7, "value": "McDonald's рядом"}),
+    ('{"tool": "scroll", "args": {"direction": "down", "amount": 800,},}',
+     "scroll", {"direction": "down", "amount": 800}),
+    ('{"tool": "extract_page_snapshot", "args": {"full": True}}',
+     "extract_page_snapshot", {"full": True}),
+    ('{tool: "navigate", args: {url: "https://hh.ru"}}',
+     "navigate", {"url": "https://hh.ru"}),
+    ('{"tool": "fill_field_by_index", "args": {"index": 2, "value": "фигурные {скобки} в тексте"}}',
+     "fill_field_by_index", {"index": 2, "value": "фигурные {скобки} в тексте"}),
+    ('Мысль: на странице {много} элементов.\n{"tool": "extract_page_snapshot", "args": {}}',
+     "extract_page_snapshot", {}),
+    ('{"thought": "сначала посмотрю страницу"}\n{"tool": "extract_page_snapshot", "args": {}}',
+     "extract_page_snapshot", {}),
+    ('{"tool": "click_element_by_index", "args": {"index": "#5"}}',
+     "click_element_by_index", {"index": 5}),
+    ('{"tool": "click_element_by_index", "args": {"index": "14"}}',
+     "click_element_by_index", {"index": 14}),
+    # Оборванный вызов, меняющий страницу, не выполняется — модель получает подсказку
+    ('{"tool": "navigate", "args": {"url": "https://market.yandex.ru/search?text=ноутбук"',
+     None, {}),
+    ('{"tool": "fill_field_by_index", "args": {"index": 2, "value": "котик',
+     None, {}),
+    ('{"tool": "extract_list_items", "args": {"max_count": 20}',
+     "extract_list_items", {"max_count": 20}),
+    ('{"tool": "fill_field_by_index", "args": {"index": 1, "value": "первая строка\nвторая строка"}}',
+     "fill_field_by_index", {"index": 1, "value": "первая строка\nвторая строка"}),
+    ('<|im_start|>{"tool": "get_current_url", "args": {}}<|im_end|>',
+     "get_current_url", {}),
+    ('Вызываю:\n```\n{\'tool\': \'wait_for_navigation\', \'args\': {},}\n```\nЖду загрузку.',
+     "wait_for_navigation", {}),
+    ('{"action": {"tool": "press_enter", "args": {}}}',
+     "press_enter", {}),
+    ('{"tool": "check_checkbox", "args": {"index": 4}} затем {"tool": "click_element_by_index", "args": {"index": 9}}',
+     "check_checkbox", {"index": 4}),
+    ('{"tool": "wait_for_element", "args": {"selector": "div[data-id=\'x\']", "timeout": 5000}}',
+     "wait_for_element", {"selector": "div[data-id='x']", "timeout": 5000}),
+    ("{'tool': 'fill_field_by_index', 'args': {'index': 0, 'value': 'don\\'t stop'}}",
+     "fill_field_by_index", {"index": 0, "value": "don't stop"}),
+    ('{"tool": "scroll", "args": {"direction": "up", "amount": 300.0}}',
+     "scroll", {"direction": "up", "amount": 300}),
+    ('{"tool": "extract_list_items", "args": {"max_count": 20}, "reason": "нужны письма"}',
+     "extract_list_items", {"max_count": 20}),
+    ('Задача выполнена: нашёл 3 вакансии.',
+     None, {}),
+    ('Не могу найти поле поиска, попробую иначе.',
+     None, {}),
+]
+
+
+def legacy_extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
+    """Прежний разбор: первая сбалансированная пара скобок, затем replace("'", '"')"""
+    text = re.sub(r'<\|[^|]+\|>', '', text)
+    start = text.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == '{':
+            depth += 1
+        elif text[i] == '}':
+            depth -= 1
+            if depth == 0:
+                json_str = text[start:i + 1]
+                try:
+                    parsed = json.loads(json_str)
+                except json.JSONDecodeError:
+                    try:
+                        parsed = json.loads(json_str.replace("'", '"'))
+                    except Exception:
+                        return None
+                if isinstance(parsed, dict) and "tool" in parsed:
+                    return parsed
+                break
+    return None
+
+
+def _correct(call: Optional[Dict[str, Any]], tool: Optional[str], args: Dict[str, Any]) -> bool:
+    if tool is None:
+        return call is None
+    if call is None:
+        return False
+    got = {k: v.strip() if isinstance(v, str) else v for k, v in (call.get("args") or {}).items()}
+    expected = {k: v.strip() if isinstance(v, str) else v for k, v in args.items()}
+    return str(call.get("tool", "")).strip() == tool and got == expected
+
+
+def run(repeat: int) -> Dict[str, Any]:
+    schemas = TOOLS.schemas()
+    strict = TOOLS.names(state_changing=True)
+    rows = []
+    for reply, tool, args in CORPUS:
+        legacy = legacy_extract_json_from_text(reply)
+        parsed = parse_tool_reply(reply, schemas, strict)
+        new_call = parsed["call"] if not parsed["errors"] else None
+        rows.append({
+            "reply": reply[:60],
+            "expected": tool,
+            "legacy_ok": _correct(legacy, tool, args),
+            "new_ok": _correct(new_call, tool, args),
+            "repairs": parsed["repairs"]
+        })
+
+    timings = {}
+    for name, parse in (("legacy", legacy_extract_json_from_text),
+                        ("new", lambda reply: parse_tool_reply(reply, schemas, strict))):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for reply, _, _ in CORPUS:
+                parse(reply)
+        timings[name] = (time.perf_counter() - started) / (repeat * len(CORPUS)) * 1e6
+
+    with_call = [row for row in rows if row["expected"] is not None]
+    legacy_parsed = sum(row["legacy_ok"] for row in with_call)
+    new_parsed = sum(row["new_ok"] for row in with_call)
+    return {
+        "corpus": len(CORPUS),
+        "with_tool_call": len(with_call),
+        "legacy_correct": legacy_parsed,
+        "new_correct": new_parsed,
+        "legacy_parse_rate": round(legacy_parsed / len(with_call), 3),
+        "new_parse_rate": round(new_parsed / len(with_call), 3),
+        # Каждый ответ, который раньше не разбирался, а теперь разбирается, — минус один ход к модели
+        "correction_turns_avoided": sum(1 for row in with_call if row["new_ok"] and not row["legacy_ok"]),
+        "regressions": [row["reply"] for row in rows if row["legacy_ok"] and not row["new_ok"]],
+        "legacy_us_per_reply": round(timings["legacy"], 1),
+        "new_us_per_reply": round(timings["new"], 1),
+        "rows": rows
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--verbose", action="store_true", help="Результат по каждому ответу")
+    args = parser.parse_args()
+
+    result = run(args.repeat)
+    if args.verbose:
+        for row in result["rows"]:
+            print(f"{'✅' if row['new_ok'] else '❌'} (было {'✅' if row['legacy_ok'] else '❌'}) "
+                  f"{row['reply']!r} {row['repairs']}")
+    print(f"\nОтветов с вызовом: {result['with_tool_call']} из {result['corpus']}")
+    print(f"Разобрано верно: {result['legacy_correct']} → {result['new_correct']} "
+          f"({result['legacy_parse_rate']:.0%} → {result['new_parse_rate']:.0%})")
+    print(f"Сэкономлено корректирующих ходов: {result['correction_turns_avoided']}")
+    print(f"Время разбора: {result['legacy_us_per_reply']} → {result['new_us_per_reply']} мкс/ответ")
+    if result["regressions"]:
+        print("❌ Регрессии:")
+        for reply in result["regressions"]:
+            print(f"   {reply!r}")
+
+
+if __name__ == "__main__":
+    main()
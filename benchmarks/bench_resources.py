@@ -0,0 +1,136 @@
+"""
+Бенчмарк политики загрузки ресурсов (resource_policy) на локальной фикстуре.
+
+Тяжёлая страница (benchmarks/fixtures.heavy_media_page): карточки с текстом
+плюс картинки, веб-шрифты, видео с preload, скрипты аналитики и рекламы.
+Страница открывается в свежем контексте без политики и с политикой; канал
+ограничивается через CDP (Network.emulateNetworkConditions), иначе локальный
+сервер отдаёт всё мгновенно и разницы во времени не видно.
+
+Для каждого варианта: p50 времени до load, байты и запросы, фактически отданные
+сервером, число интерактивных элементов (политика не должна их терять) и
+счётчики политики.
+
+Запуск (из корня репозитория):
+    python -m benchmarks.bench_resources --repeat 5 --throughput-kbps 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+
+from playwright.async_api import async_playwright, Browser
+
+from benchmarks.fixtures import heavy_media_page, write_heavy_assets
+from benchmarks.server import FixtureServer
+from config import Config
+from resource_policy import ResourcePolicy
+
+
+def fixture_rules() -> Dict[str, Dict[str, List[str]]]:
+    """Общее правило из Config плюс адреса аналитики и рекламы локальной фикстуры"""
+    base = Config.RESOURCE_POLICY.get("*", {})
+    return {"*": {
+        "block_types": list(base.get("block_types", [])),
+        "block_urls": list(base.get("block_urls", [])) + ["*/metrika/*", "*/ads/*"],
+        "allow_urls": list(base.get("allow_urls", []))
+    }}
+
+
+async def load_once(browser: Browser, url: str, policy: Optional[ResourcePolicy],
+                    throughput_kbps: int, latency_ms: int) -> Dict[str, Any]:
+    context = await browser.new_context(viewport={"width": 1920, "height": 1080})
+    try:
+        if policy is not None:
+            await policy.install(context)
+        page = await context.new_page()
+        if throughput_kbps:
+            cdp = await context.new_cdp_session(page)
+            await cdp.send("Network.enable")
+            await cdp.send("Network.emulateNetworkConditions", {
+                "offline": False,
+                "latency": latency_ms,
+                "downloadThroughput": throughput_kbps * 1024 / 8,
+                "uploadThroughput": throughput_kbps * 1024 / 8
+            })
+        started = time.perf_counter()
+        await page.goto(url, wait_until="load", timeout=120_000)
+        load_ms = (time.perf_counter() - started) * 1000
+        interactive = await page.evaluate("document.querySelectorAll('a, button, input').length")
+        return {"load_ms": load_ms, "interactive": interactive}
+    finally:
+        await context.close()
+
+
+async def run(repeat: int, throughput_kbps: int, latency_ms: int) -> List[Dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "heavy.html"), "w", encoding="utf-8") as f:
+            f.write(heavy_media_page())
+        write_heavy_assets(directory)
+
+        with FixtureServer(directory) as server:
+            url = server.url("heavy.html")
+            async with async_playwright() as playwright:
+                browser = await playwright.chromium.launch(headless=True)
+                try:
+                    for variant in ("без политики", "с политикой"):
+                        policy = ResourcePolicy(fixture_rules()) if variant == "с политикой" else None
+                        server.reset_stats()
+                        runs = [await load_once(browser, url, policy, throughput_kbps, latency_ms)
+                                for _ in range(repeat)]
+                        served = server.stats()
+                        row = {
+                            "variant": variant,
+                            "p50_load_ms": round(statistics.median(r["load_ms"] for r in runs), 1),
+                            "bytes_served": served["bytes_served"] // repeat,
+                            "requests_served": served["requests_served"] // repeat,
+                            "interactive_elements": runs[0]["interactive"]
+                        }
+                        if policy is not None:
+                            stats = policy.snapshot_stats()
+                            row.update({
+                                "blocked_requests": stats["blocked"] // repeat,
+                                "blocked_bytes_estimated": stats["blocked_bytes_estimated"] // repeat,
+                                "blocked_by_type": {k: v // repeat for k, v in stats["blocked_by_type"].items()}
+                            })
+                        results.append(row)
+                        print(f"{variant:>14}: load p50 {row['p50_load_ms']} мс, "
+                              f"{row['bytes_served'] // 1024} КБ / {row['requests_served']} запросов, "
+                              f"элементов {row['interactive_elements']}")
+                finally:
+                    await browser.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--throughput-kbps", type=int, default=20000, help="Ограничение канала; 0 — без ограничения")
+    parser.add_argument("--latency-ms", type=int, default=20)
+    parser.add_argument("--output", default="benchmarks/results/resources.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.repeat, args.throughput_kbps, args.latency_ms))
+    if len(results) == 2 and results[0]["p50_load_ms"]:
+        saved = 1 - results[1]["p50_load_ms"] / results[0]["p50_load_ms"]
+        bytes_saved = 1 - results[1]["bytes_served"] / max(results[0]["bytes_served"], 1)
+        print(f"\nЭкономия: время загрузки −{saved:.0%}, трафик −{bytes_saved:.0%}")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "throughput_kbps": args.throughput_kbps,
+            "results": results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"✅ Результаты сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
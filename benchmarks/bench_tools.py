@@ -0,0 +1,206 @@
+"""
+Микробенчмарки всех методов BrowserTools на локальных фикстурах.
+
+Фикстуры (benchmarks/fixtures.py) раздаются локальным HTTP-сервером: маленький,
+средний и огромный DOM, длинный список, большая таблица, вложенные iframe.
+Для каждой пары (фикстура, метод) считаются p50/p95 задержки, размер ответа
+инструмента (JSON, байты) и медиана settle_ms, если метод ждёт стабилизации.
+
+Запуск (из корня репозитория):
+    python -m benchmarks.bench_tools --repeat 10
+    python -m benchmarks.bench_tools --baseline benchmarks/results/tools_baseline.json
+
+С --baseline скрипт завершается с кодом 1, если p50 какого-либо замера вырос
+больше чем на --max-regression процентов. Код 1 и при любом неуспешном вызове
+инструмента: сломанный замер не должен выглядеть как время.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from playwright.async_api import async_playwright, Page
+
+from benchmarks.fixtures import write_fixtures
+from benchmarks.server import FixtureServer
+from browser_tools import AsyncBrowserTools
+
+# Замеры по id из снимка: navigate и действия пересоздают реестр элементов
+# (id не повторяются), поэтому перед каждым повтором — свежие страница и снимок
+INDEX_CASES = {"click_element_by_index", "hover_element", "fill_field_by_index",
+               "check_checkbox", "extract_element_text"}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _first_id(snapshot: Dict[str, Any], predicate: Callable[[Dict[str, Any]], bool]) -> Optional[int]:
+    for el in snapshot.get("elements", []):
+        if predicate(el):
+            return el.get("index")
+    return None
+
+
+def build_cases(tools: AsyncBrowserTools, snapshot: Dict[str, Any], url: str) -> Dict[str, Callable[[], Awaitable[Dict[str, Any]]]]:
+    """Замеры для фикстуры; id элементов берутся из предварительного снимка"""
+    button_id = _first_id(snapshot, lambda el: el.get("type") == "button")
+    field_id = _first_id(snapshot, lambda el: el.get("type") == "input" and el.get("inputType") in ("text", "search"))
+    checkbox_id = _first_id(snapshot, lambda el: el.get("inputType") == "checkbox")
+    link_id = _first_id(snapshot, lambda el: el.get("type") == "a")
+
+    cases = {
+        "navigate": lambda: tools.navigate(url),
+        "extract_page_snapshot": lambda: tools.extract_page_snapshot(full=True),
+        "extract_page_snapshot[diff]": lambda: tools.extract_page_snapshot(),
+        "extract_list_items": lambda: tools.extract_list_items(10),
+        "extract_table_data": lambda: tools.extract_table_data(10),
+        "scroll": lambda: tools.scroll("down", 500),
+        "press_enter": lambda: tools.press_enter(),
+        "get_current_url": lambda: tools.get_current_url(),
+        "wait_for_navigation": lambda: tools.wait_for_navigation(),
+        "wait_for_element": lambda: tools.wait_for_element("body", 5000),
+    }
+    if button_id is not None:
+        cases["click_element_by_index"] = lambda: tools.click_element_by_index(button_id)
+        cases["hover_element"] = lambda: tools.hover_element(button_id)
+    if field_id is not None:
+        cases["fill_field_by_index"] = lambda: tools.fill_field_by_index(field_id, "тестовый запрос")
+    if link_id is not None:
+        cases["extract_element_text"] = lambda: tools.extract_element_text(link_id)
+    if checkbox_id is not None:
+        cases["check_checkbox"] = lambda: tools.check_checkbox(checkbox_id)
+    return cases
+
+
+async def bench_fixture(page: Page, url: str, repeat: int) -> List[Dict[str, Any]]:
+    tools = AsyncBrowserTools(page)
+    await tools.navigate(url)
+    snapshot = await tools.extract_page_snapshot(full=True)
+    rows = []
+
+    for name, call in build_cases(tools, snapshot, url).items():
+        timings, sizes, settles, failures = [], [], [], 0
+        for _ in range(repeat):
+            # Действия меняют страницу — каждый замер начинается с исходного состояния
+            if name in INDEX_CASES:
+                await tools.navigate(url)
+                call = build_cases(tools, await tools.extract_page_snapshot(full=True), url)[name]
+            elif name in ("scroll", "press_enter"):
+                await page.evaluate("window.scrollTo(0, 0)")
+            start = time.perf_counter()
+            result = await call()
+            timings.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(json.dumps(result, ensure_ascii=False).encode("utf-8")))
+            if "settle_ms" in result:
+                settles.append(result["settle_ms"])
+            if not result.get("success"):
+                failures += 1
+        rows.append({
+            "method": name,
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+            "payload_bytes": int(percentile(sizes, 50)),
+            "settle_ms_p50": percentile(settles, 50) if settles else None,
+            "failures": failures
+        })
+    return rows
+
+
+async def run(repeat: int, fixtures: Optional[List[str]]) -> List[Dict[str, Any]]:
+    directory = tempfile.mkdtemp(prefix="bench_fixtures_")
+    paths = write_fixtures(directory)
+    names = [name for name in paths if not fixtures or name in fixtures]
+
+    results = []
+    with FixtureServer(directory) as server:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            for name in names:
+                context = await browser.new_context(viewport={"width": 1920, "height": 1080})
+                page = await context.new_page()
+                rows = await bench_fixture(page, server.url(name), repeat)
+                await context.close()
+                for row in rows:
+                    row["fixture"] = name
+                    results.append(row)
+                    print(f"{name:<20} {row['method']:<28} p50 {row['p50_ms']:>9.2f} мс  "
+                          f"p95 {row['p95_ms']:>9.2f} мс  {row['payload_bytes']:>8} Б")
+            await browser.close()
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> List[str]:
+    """Сравнивает p50 с сохранённым прогоном и возвращает список регрессий"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["fixture"], r["method"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for row in results:
+        old = baseline.get((row["fixture"], row["method"]))
+        if not old or old["p50_ms"] <= 0:
+            continue
+        growth = (row["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        if growth > max_regression:
+            regressions.append(f"{row['fixture']} / {row['method']}: "
+                               f"{old['p50_ms']} → {row['p50_ms']} мс (+{growth:.0f}%)")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--fixtures", nargs="*", help="Имена фикстур (по умолчанию все)")
+    parser.add_argument("--output", default="benchmarks/results/tools.json")
+    parser.add_argument("--baseline", help="Прошлый результат для поиска регрессий")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Допустимый рост p50, %%")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.repeat, args.fixtures))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "results": results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Результаты сохранены: {args.output}")
+
+    failed = [row for row in results if row["failures"]]
+    if failed:
+        print("\n❌ Неуспешные вызовы инструментов:")
+        for row in failed:
+            print(f"   {row['fixture']} / {row['method']}: {row['failures']} из {args.repeat}")
+        sys.exit(1)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        if regressions:
+            print("\n❌ Регрессии производительности:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("✅ Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
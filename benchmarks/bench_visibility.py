@@ -0,0 +1,177 @@
+"""
+Бенчмарк движка видимости (page_scripts) против прежних скриптов извлечения.
+
+Прежние скрипты вызывали getBoundingClientRect() и getComputedStyle() на каждом
+кандидате; новые используют checkVisibility(), пропускают скрытые поддеревья
+и останавливаются, как только набрано нужное число элементов.
+
+Время меряется внутри страницы (performance.now()); перед каждым замером стили
+страницы инвалидируются, чтобы оба варианта платили за пересчёт layout.
+
+Запуск (из корня репозитория):
+    python -m benchmarks.bench_visibility --sizes 10000 50000 100000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+from typing import Dict, Any, List
+
+from playwright.async_api import async_playwright, Page
+
+from benchmarks.fixtures import synthetic_page
+from page_scripts import SNAPSHOT_JS, ELEMENT_TEXT_JS, RESOLVE_STATUS_JS, with_runtime
+
+LEGACY_SNAPSHOT_JS = """() => {
+    const elements = [];
+    const selectors = 'a, button, input, textarea, select, [role="button"], [role="link"]';
+    const allElements = Array.from(document.querySelectorAll(selectors));
+    allElements.forEach((el) => {
+        try {
+            const rect = el.getBoundingClientRect();
+            const style = window.getComputedStyle(el);
+            if (
+                rect.width > 10 && rect.height > 10 &&
+                style.display !== 'none' && style.visibility !== 'hidden' &&
+                rect.top >= 0 && rect.bottom <= window.innerHeight
+            ) {
+                const type = el.tagName.toLowerCase();
+                elements.push({
+                    index: elements.length, type, inputType: el.type || '',
+                    text: el.textContent.trim().substring(0, 100), tagName: type,
+                    href: el.href || '', placeholder: el.placeholder || '', value: el.value || ''
+                });
+            }
+        } catch (e) {}
+    });
+    return {title: document.title, url: window.location.href, elements: elements.slice(0, 50)};
+}"""
+
+# Поиск элемента по индексу так, как это делал click_element_by_index (без клика)
+LEGACY_CLICK_LOOKUP_JS = """(idx) => {
+    const selectors = 'a, button, input, textarea, select, [role="button"], [role="link"]';
+    const elements = Array.from(document.querySelectorAll(selectors));
+    const visibleElements = elements.filter(el => {
+        try {
+            const rect = el.getBoundingClientRect();
+            const style = window.getComputedStyle(el);
+            return rect.width > 10 && rect.height > 10 &&
+                style.display !== 'none' && style.visibility !== 'hidden';
+        } catch (e) { return false; }
+    });
+    return idx < visibleElements.length;
+}"""
+
+LEGACY_ELEMENT_TEXT_JS = """(idx) => {
+    const selectors = 'div, article, section, p, span, li';
+    const elements = Array.from(document.querySelectorAll(selectors));
+    const visibleElements = elements.filter(el => {
+        try {
+            const rect = el.getBoundingClientRect();
+            const style = window.getComputedStyle(el);
+            return rect.width > 50 && rect.height > 20 &&
+                style.display !== 'none' && style.visibility !== 'hidden';
+        } catch (e) { return false; }
+    });
+    if (idx >= visibleElements.length) return null;
+    return visibleElements[idx].textContent.trim();
+}"""
+
+# Корректность: кнопки внутри display:contents видимы, если видима их карточка.
+# Обёртки идут в кандидатах раньше кнопок — как в реальных обходах документа.
+CONTENTS_CHECK_JS = """() => {
+    const agent = window.__browserAgent;
+    const candidates = document.querySelectorAll('.contents, .contents button');
+    const found = agent.filterVisible(candidates).filter(el => el.tagName === 'BUTTON').length;
+    const expected = Array.from(document.querySelectorAll('.contents button')).filter(el =>
+        el.getClientRects().length > 0 && window.getComputedStyle(el).visibility !== 'hidden').length;
+    return {found, expected};
+}"""
+
+# Оборачивает скрипт: инвалидирует стили, затем меряет время выполнения
+TIMED_JS = """([script, arg]) => {
+    document.body.classList.toggle('bench-invalidate');
+    const fn = eval('(' + script + ')');
+    const start = performance.now();
+    const result = fn(arg);
+    const ms = performance.now() - start;
+    return {ms, result};
+}"""
+
+CASES = [
+    # (название, прежний скрипт, новый скрипт, аргумент прежнего, аргумент нового)
+    ("snapshot", LEGACY_SNAPSHOT_JS, with_runtime(SNAPSHOT_JS),
+     None, {"startId": 0, "limit": 50, "incremental": False}),
+    # Прежний скрипт искал n-й видимый блок обходом; новый берёт элемент по id из реестра
+    ("element_text[10]", LEGACY_ELEMENT_TEXT_JS, with_runtime(ELEMENT_TEXT_JS), 10, 10),
+    ("element_text[2000]", LEGACY_ELEMENT_TEXT_JS, with_runtime(ELEMENT_TEXT_JS), 2000, 10),
+    ("click_lookup[5]", LEGACY_CLICK_LOOKUP_JS, with_runtime(RESOLVE_STATUS_JS), 5, 5),
+]
+
+
+async def _measure(page: Page, script: str, arg: Any, repeat: int) -> Dict[str, Any]:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        measured = await page.evaluate(TIMED_JS, [script, arg])
+        timings.append(measured["ms"])
+        result = measured["result"]
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "result": result
+    }
+
+
+async def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    rows = []
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page(viewport={"width": 1920, "height": 1080})
+        for size in sizes:
+            await page.set_content(synthetic_page(size))
+            node_count = await page.evaluate("document.getElementsByTagName('*').length")
+            # Реестр должен содержать элементы до поиска по id
+            await page.evaluate(with_runtime(SNAPSHOT_JS), {"startId": 0, "limit": 50, "incremental": False})
+            contents = await page.evaluate(with_runtime(CONTENTS_CHECK_JS))
+            print(f"display:contents: найдено {contents['found']} из {contents['expected']} видимых кнопок"
+                  f"{'' if contents['found'] == contents['expected'] else '  ❌'}")
+
+            for name, legacy_js, new_js, legacy_arg, new_arg in CASES:
+                legacy = await _measure(page, legacy_js, legacy_arg, repeat)
+                new = await _measure(page, new_js, new_arg, repeat)
+                row = {
+                    "case": name,
+                    "nodes": node_count,
+                    "legacy_ms": legacy["median_ms"],
+                    "engine_ms": new["median_ms"],
+                    "speedup": round(legacy["median_ms"] / max(new["median_ms"], 0.01), 1),
+                    "contents_ok": contents["found"] == contents["expected"]
+                }
+                if name.startswith("element_text"):
+                    row["found"] = bool(new["result"] and new["result"].get("found"))
+                rows.append(row)
+                print(f"{name:<20} {node_count:>8} узлов  прежний {row['legacy_ms']:>9.2f} мс  "
+                      f"движок {row['engine_ms']:>9.2f} мс  x{row['speedup']}")
+        await browser.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmarks/results/visibility.json")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args.sizes, args.repeat))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Результаты сохранены: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
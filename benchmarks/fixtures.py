@@ -0,0 +1,176 @@
+"""
+Генераторы синтетических HTML-страниц для бенчмарков.
+Все генераторы детерминированы: одинаковые параметры дают одинаковый HTML.
+"""
+import os
+import random
+from typing import Dict
+
+
+def synthetic_page(node_count: int, hidden_ratio: float = 0.2, seed: int = 0) -> str:
+    """
+    Страница примерно из node_count элементов: секции с карточками
+    (div > span, p, a, button, input), часть секций скрыта display:none,
+    часть карточек — visibility:hidden, каждая пятая карточка обёрнута в
+    display:contents (как в React/web components). Страница много длиннее viewport.
+    """
+    rng = random.Random(seed)
+    nodes_per_card = 6
+    cards_per_section = 20
+    section_count = max(1, node_count // (nodes_per_card * cards_per_section + 1))
+
+    parts = ["<!DOCTYPE html><html><head><meta charset='utf-8'><title>Synthetic</title>",
+             "<style>.card{margin:8px;padding:8px;border:1px solid #ccc}"
+             ".hidden{display:none}.invisible{visibility:hidden}.contents{display:contents}</style></head><body>"]
+    card_no = 0
+    for section in range(section_count):
+        hidden = rng.random() < hidden_ratio
+        parts.append(f"<section class='{'hidden' if hidden else ''}' id='s{section}'>")
+        for _ in range(cards_per_section):
+            invisible = rng.random() < 0.05
+            wrapped = card_no % 5 == 0
+            parts.append(
+                f"{'<div class=contents>' if wrapped else ''}"
+                f"<div class='card{' invisible' if invisible else ''}'>"
+                f"<span>Карточка {card_no}</span>"
+                f"<p>Описание карточки номер {card_no}: {'текст ' * rng.randint(3, 12)}</p>"
+                f"<a href='#card{card_no}'>Ссылка {card_no}</a>"
+                f"<button>Кнопка {card_no}</button>"
+                f"<input type='text' placeholder='Поле {card_no}'>"
+                f"</div>"
+                f"{'</div>' if wrapped else ''}"
+            )
+            card_no += 1
+        parts.append("</section>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def long_list_page(item_count: int = 500, seed: int = 0) -> str:
+    """Список писем как в почтовом клиенте: чекбокс, отправитель, тема, сниппет"""
+    rng = random.Random(seed)
+    senders = ["Яндекс", "hh.ru", "Банк", "Магазин", "noreply", "Коллега"]
+    rows = []
+    for i in range(item_count):
+        sender = rng.choice(senders)
+        rows.append(
+            f"<div class='mail' style='height:60px;width:900px'>"
+            f"<input type='checkbox' aria-label='Выбрать письмо {i}'>"
+            f"<span class='from'>{sender}</span>"
+            f"<a href='#mail{i}' class='subject'>Тема письма {i}</a>"
+            f"<span class='snippet'>{'Короткий текст письма ' * rng.randint(1, 4)}</span>"
+            f"</div>"
+        )
+    return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Почта</title></head><body>"
+            "<input type='search' placeholder='Поиск писем'><button>Удалить</button>"
+            f"<div class='mail-list'>{''.join(rows)}</div></body></html>")
+
+
+def big_table_page(row_count: int = 1000, column_count: int = 8) -> str:
+    """Большая таблица с заголовком"""
+    header = "".join(f"<th>Колонка {c}</th>" for c in range(column_count))
+    body = "".join(
+        "<tr>" + "".join(f"<td>r{r}c{c}</td>" for c in range(column_count)) + "</tr>"
+        for r in range(row_count)
+    )
+    return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Таблица</title></head><body>"
+            "<button>Экспорт</button><input type='text' placeholder='Фильтр'>"
+            f"<table><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table></body></html>")
+
+
+def nested_iframes_page(depth: int = 3, cards_per_frame: int = 50) -> str:
+    """Страница с цепочкой вложенных iframe (srcdoc), в каждом — синтетические карточки"""
+    inner = synthetic_page(cards_per_frame * 6, hidden_ratio=0.0, seed=depth)
+    for level in range(depth):
+        escaped = inner.replace("&", "&amp;").replace('"', "&quot;")
+        inner = (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Уровень {level}</title></head>"
+                 f"<body><button>Кнопка уровня {level}</button><input type='text'>"
+                 f"<iframe width='1200' height='600' srcdoc=\"{escaped}\"></iframe></body></html>")
+    return inner
+
+
+def search_home_page() -> str:
+    """Мини-поисковик: форма с полем q, Enter отправляет её на results.html"""
+    return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Поиск</title></head><body>"
+            "<a href='/'>Главная</a><a href='#about'>О сервисе</a>"
+            "<form action='results.html' method='get'>"
+            "<input type='search' name='q' placeholder='Найти'>"
+            "<button type='submit'>Найти</button></form></body></html>")
+
+
+def search_results_page(result_count: int = 20) -> str:
+    """Статическая выдача для search_home_page"""
+    results = "".join(
+        f"<li style='height:80px'><a href='#r{i}'>Результат {i}</a>"
+        f"<p>Описание найденной страницы номер {i}</p></li>"
+        for i in range(result_count)
+    )
+    return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Результаты поиска</title></head>"
+            f"<body><input type='search' name='q'><ul class='results'>{results}</ul></body></html>")
+
+
+def heavy_media_page(image_count: int = 40, card_count: int = 200) -> str:
+    """
+    Страница «как у настоящего сайта»: карточки с текстом и ссылками плюс
+    картинки, веб-шрифты, видео с preload, скрипт аналитики и рекламный скрипт
+    (файлы ресурсов пишет write_heavy_assets)
+    """
+    images = "".join(f"<img src='assets/img{i}.jpg' width='200' height='120' alt='Фото {i}'>"
+                     for i in range(image_count))
+    cards = "".join(f"<div class='card'><a href='#c{i}'>Товар {i}</a><p>Описание товара {i}</p>"
+                    f"<button>В корзину</button></div>" for i in range(card_count))
+    return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>Тяжёлая страница</title>"
+            "<style>@font-face{font-family:Brand;src:url(assets/brand.woff2) format('woff2')}"
+            "@font-face{font-family:BrandBold;src:url(assets/brand-bold.woff2) format('woff2')}"
+            "body{font-family:Brand}h1{font-family:BrandBold}.card{margin:8px}</style>"
+            "<script src='metrika/tag.js'></script><script src='ads/banner.js'></script></head><body>"
+            "<h1>Каталог</h1><video src='assets/promo.mp4' preload='auto' muted></video>"
+            f"{images}{cards}</body></html>")
+
+
+def write_heavy_assets(directory: str) -> Dict[str, int]:
+    """Бинарные ресурсы heavy_media_page (детерминированный мусор нужного размера): {путь: байт}"""
+    rng = random.Random(7)
+    sizes = {f"assets/img{i}.jpg": 60_000 for i in range(40)}
+    sizes.update({
+        "assets/brand.woff2": 80_000,
+        "assets/brand-bold.woff2": 80_000,
+        "assets/promo.mp4": 1_500_000,
+        "metrika/tag.js": 60_000,
+        "ads/banner.js": 40_000
+    })
+    for name, size in sizes.items():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            if name.endswith(".js"):
+                f.write(b"/*" + b"x" * (size - 4) + b"*/")
+            else:
+                f.write(rng.randbytes(size))
+    return sizes
+
+
+# Набор фикстур микробенчмарков: имя файла -> HTML
+def fixture_set() -> Dict[str, str]:
+    return {
+        "small.html": synthetic_page(1000, seed=1),
+        "medium.html": synthetic_page(10000, seed=2),
+        "huge.html": synthetic_page(100000, seed=3),
+        "long_list.html": long_list_page(500),
+        "big_table.html": big_table_page(1000),
+        "nested_iframes.html": nested_iframes_page(3),
+        "search.html": search_home_page(),
+        "results.html": search_results_page(),
+    }
+
+
+def write_fixtures(directory: str) -> Dict[str, str]:
+    """Записывает фикстуры в directory и возвращает {имя: путь}"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, html in fixture_set().items():
+        path = os.path.join(directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
+        paths[name] = path
+    return paths
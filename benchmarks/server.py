@@ -0,0 +1,65 @@
+"""Локальный HTTP-сервер для фикстур бенчмарков (без сети, в фоновом потоке)"""
+import functools
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import Dict
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    """Раздаёт файлы из каталога, не пишет в лог и считает отданные байты"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def copyfile(self, source, outputfile):
+        data = source.read()
+        outputfile.write(data)
+        server = self.server
+        with server.stats_lock:
+            server.bytes_served += len(data)
+            server.requests_served += 1
+            server.bytes_by_path[self.path] = server.bytes_by_path.get(self.path, 0) + len(data)
+
+
+class FixtureServer:
+    """
+    Использование:
+        with FixtureServer("/tmp/fixtures") as server:
+            page.goto(server.url("small.html"))
+    """
+
+    def __init__(self, directory: str, port: int = 0):
+        handler = functools.partial(_QuietHandler, directory=directory)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.stats_lock = threading.Lock()
+        self.reset_stats()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def reset_stats(self):
+        with self.httpd.stats_lock:
+            self.httpd.bytes_served = 0
+            self.httpd.requests_served = 0
+            self.httpd.bytes_by_path = {}
+
+    def stats(self) -> Dict[str, int]:
+        with self.httpd.stats_lock:
+            return {
+                "bytes_served": self.httpd.bytes_served,
+                "requests_served": self.httpd.requests_served
+            }
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -1,77 +1,128 @@
-import time
+import asyncio
+import json
 import logging
 import os
+import time
 from typing import Dict, Any, Optional, List
-from playwright.sync_api import sync_playwright, Browser, Page, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
 
 from config import Config
-from browser_tools import BrowserTools
+from browser_tools import AsyncBrowserTools, BrowserTools
+from context_pool import BrowserContextPool
+from history import ConversationHistory
+from llm_client import LLMClient, get_llm_client
+from macros import MacroStore, MacroRecorder, render_args, find_element
 from sub_agent import SubAgent
+from tool_parser import parse_tool_reply
+from tool_registry import TOOLS, tool
+from tracing import Tracer, set_tracer, reset_tracer, span
 from utils import (
     logger,
-    extract_json_from_text,
     is_dangerous_action,
     confirm_action,
-    truncate_text
+    truncate_text,
+    url_key,
+    EventLoopThread
 )
 
-class BrowserAgent:
+# Действия, после которых модели почти всегда нужен свежий снимок страницы
+STATE_CHANGING_TOOLS = TOOLS.names(state_changing=True)
+
+# Инструменты, адресующие элемент по id из снимка: после смены страницы id недействительны
+INDEX_TOOLS = {name for name, spec in TOOLS.specs.items() if spec.uses_index}
+
+
+class AsyncBrowserAgent:
     """
-    Основной универсальный браузерный агент (только GigaChat).
+    Основной универсальный браузерный агент, asyncio-версия.
+    Несколько экземпляров могут работать параллельно в одном event loop:
+    ожидание LLM и загрузки страниц одной сессии не блокирует остальные.
+    
+    Браузер берётся из BrowserContextPool: каждая задача получает чистый
+    контекст, поэтому cookies и состояние страниц не переходят между задачами.
+    Передайте общий pool, чтобы несколько агентов делили один процесс Chromium.
+    
+    LLM — общий клиент llm_client.LLMClient для Config.LLM_PROVIDER (тот же,
+    что у SubAgent). llm_client — готовый LLMClient или любой GigaChat-совместимый
+    клиент (chat/achat), например replay_llm.ScriptedLLM для офлайн-прогонов.
+    
+    record_har_dir — сохранять HAR каждой задачи (и её трассу) в этот каталог;
+    replay_har_path — отдавать все ответы из записанного HAR без сети. Вместе
+    со ScriptedLLM это даёт полностью повторяемый прогон.
     """
     
-    def __init__(self):
-        Config.validate()
-        
-        # Инициализация только GigaChat
-        from gigachat import GigaChat
-        self.llm_provider = "gigachat"
-        self.llm_client = GigaChat(
-            credentials=Config.GIGACHAT_CREDENTIALS,
-            model=Config.GIGACHAT_MODEL,
-            verify_ssl_certs=False
-        )
-        logger.info("✅ Инициализирован провайдер: GIGACHAT")
-        
-        # Инициализация суб-агента
-        self.sub_agent = SubAgent(self.llm_provider, self.llm_client)
-        
-        # Запуск браузера
-        self.playwright = sync_playwright().start()
-        os.makedirs("browser_data", exist_ok=True)
-        storage_path = "browser_data/storage_state.json"
-        storage_state = storage_path if os.path.exists(storage_path) else None
-        
-        self.browser: Browser = self.playwright.chromium.launch(
-            headless=Config.BROWSER_HEADLESS,
-            slow_mo=Config.BROWSER_SLOW_MO,
-            args=["--start-maximized"] if Config.BROWSER_MAXIMIZE else []
-        )
+    def __init__(self, pool: Optional[BrowserContextPool] = None, llm_client: Any = None,
+                 record_har_dir: Optional[str] = None, replay_har_path: Optional[str] = None):
+        if isinstance(llm_client, LLMClient):
+            self.llm = llm_client
+        elif llm_client is not None:
+            self.llm = LLMClient.from_client(llm_client)
+        else:
+            self.llm = get_llm_client()
+        self.llm_provider = self.llm.provider
         
-        self.context = self.browser.new_context(
-            storage_state=storage_state,
-            viewport={"width": 1920, "height": 1080},
-            locale="ru-RU"
-        )
+        # Инициализация суб-агента (на том же клиенте)
+        self.sub_agent = SubAgent(self.llm)
         
-        self.page: Page = self.context.new_page()
-        self.tools = BrowserTools(self.page)
-        self.conversation_history: List[Dict[str, str]] = []
+        self.pool = pool
+        self._owns_pool = pool is None
+        self.page: Optional[Page] = None
+        self.tools: Optional[AsyncBrowserTools] = None
+        self.history = ConversationHistory()
+        self.macros: Optional[MacroStore] = MacroStore() if Config.MACROS_ENABLED else None
+        self._macro_recorder: Optional[MacroRecorder] = None
         self.analysis_cache: Dict[str, Any] = {}
+        self.last_trace: Optional[Tracer] = None
+        self.record_har_dir = record_har_dir if record_har_dir is not None else Config.HAR_RECORD_DIR
+        self.replay_har_path = replay_har_path if replay_har_path is not None else Config.HAR_REPLAY_PATH
+        if self.replay_har_path and not os.path.exists(self.replay_har_path):
+            raise FileNotFoundError(f"HAR для воспроизведения не найден: {self.replay_har_path}")
     
-    def close(self):
-        """Закрытие браузера и ресурсов"""
-        try:
-            self.browser.close()
-        except:
-            pass
-        try:
-            self.playwright.stop()
-        except:
-            pass
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """Сообщения, которые уйдут в модель при следующем запросе"""
+        return self.history.messages()
+    
+    async def start(self) -> "AsyncBrowserAgent":
+        """Запуск (или подключение к) пулу браузерных контекстов"""
+        if self.pool is None:
+            self.pool = BrowserContextPool()
+        await self.pool.start()
+        return self
+    
+    async def close(self):
+        """Закрытие браузера и ресурсов (общий пул закрывает его владелец)"""
+        if self._owns_pool and self.pool:
+            try:
+                await self.pool.close()
+            except:
+                pass
+    
+    async def __aenter__(self) -> "AsyncBrowserAgent":
+        return await self.start()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
     
     def _build_system_prompt(self) -> str:
-        return """Ты — автономный браузерный агент. ТВОЯ ЗАДАЧА: находить информацию через поиск в Яндексе.
+        if Config.SNAPSHOT_AFTER_ACTION:
+            strategy = """1. ШАГ 1: {"tool": "navigate", "args": {"url": "https://yandex.ru"}}
+2. ШАГ 2: Найди поле поиска в снимке и используй его index → {"tool": "fill_field_by_index", "args": {"index": 0, "value": "запрос"}}
+3. ШАГ 3: {"tool": "press_enter", "args": {}}
+4. ШАГ 4: Проанализируй результаты поиска → кликни по подходящей ссылке
+
+К результату """ + ", ".join(sorted(STATE_CHANGING_TOOLS)) + """
+уже приложен снимок страницы после действия — отдельный extract_page_snapshot не нужен."""
+        else:
+            strategy = """1. ШАГ 1: {"tool": "navigate", "args": {"url": "https://yandex.ru"}}
+2. ШАГ 2: {"tool": "extract_page_snapshot", "args": {}}
+3. ШАГ 3: Найди поле поиска в снимке и используй его index → {"tool": "fill_field_by_index", "args": {"index": 0, "value": "запрос"}}
+4. ШАГ 4: {"tool": "press_enter", "args": {}}
+5. ШАГ 5: Проанализируй результаты поиска → кликни по подходящей ссылке
+
+После каждого действия, меняющего страницу, сделай extract_page_snapshot, чтобы увидеть её."""
+
+        prompt = """Ты — автономный браузерный агент. ТВОЯ ЗАДАЧА: находить информацию через поиск в Яндексе.
 
 ## 🔑 ГЛАВНОЕ ПРАВИЛО ДЛЯ ИНФОРМАЦИОННЫХ ЗАПРОСОВ:
 Если пользователь просит найти информацию («найди», «поищи», «расскажи про»):
@@ -91,104 +142,376 @@ class BrowserAgent:
 {"tool": "navigate", "args": {"url": "https://yandex.ru"}}
 
 ## СТРАТЕГИЯ РАБОТЫ:
-1. ШАГ 1: {"tool": "navigate", "args": {"url": "https://yandex.ru"}}
-2. ШАГ 2: {"tool": "extract_page_snapshot", "args": {}}
-3. ШАГ 3: Найди поле поиска (обычно индекс 0 или 1) → {"tool": "fill_field_by_index", "args": {"index": 0, "value": "запрос"}}
-4. ШАГ 4: {"tool": "press_enter", "args": {}}
-5. ШАГ 5: Проанализируй результаты поиска → кликни по подходящей ссылке
+""" + strategy + """
+
+## ИНДЕКСЫ ЭЛЕМЕНТОВ:
+index — это id элемента из последнего снимка страницы. Он стабилен, пока элемент есть на странице.
+Если инструмент сообщает, что элемент устарел или не найден, — сделай новый extract_page_snapshot.
 
 ## ДОСТУПНЫЕ ИНСТРУМЕНТЫ:
-{"tool": "navigate", "args": {"url": "https://example.com"}}
-{"tool": "extract_page_snapshot", "args": {}}
-{"tool": "click_element_by_index", "args": {"index": 0}}
-{"tool": "fill_field_by_index", "args": {"index": 0, "value": "текст"}}
-{"tool": "press_enter", "args": {}}
-{"tool": "scroll", "args": {"direction": "down", "amount": 500}}
-{"tool": "check_checkbox", "args": {"index": 0}}
-{"tool": "get_current_url", "args": {}}
-{"tool": "wait_for_navigation", "args": {}}
+""" + TOOLS.prompt_section() + """
 
 ## ФИНАЛЬНЫЙ ОТВЕТ:
 Когда найдена информация, напиши:
 ЗАДАЧА ВЫПОЛНЕНА
 Краткое содержание найденной информации
 """
+        if Config.TOOL_BATCHING:
+            prompt += f"""
+## ПАКЕТ ДЕЙСТВИЙ (исключение из правила одного инструмента):
+Если следующие действия очевидны заранее, можно прислать до {Config.TOOL_BATCH_MAX} инструментов одним JSON:
+{{"tools": [{{"tool": "fill_field_by_index", "args": {{"index": 0, "value": "запрос"}}}}, {{"tool": "press_enter", "args": {{}}}}]}}
+Действия выполняются по порядку. Пакет останавливается на первой ошибке или если страница
+сменилась, а следующие действия ссылаются на index старой страницы. Результат — один общий отчёт.
+"""
+        return prompt
 
-    def _execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
-        """Выполнение инструмента по имени"""
+    def _format_snapshot(self, snapshot: Dict[str, Any]) -> str:
+        """Текст снимка страницы для модели: полный список или только изменения"""
+        def element_line(el: Dict[str, Any]) -> str:
+            return f"{el.get('index', '?')}. [{el.get('type', '?')}] \"{el.get('text', '')[:60].strip()}\""
         
-        # Словарь доступных инструментов
-        available_tools = {
-            "navigate": lambda: self.tools.navigate(args.get("url", "")),
-            "extract_page_snapshot": lambda: self.tools.extract_page_snapshot(),
-            "extract_list_items": lambda: self.tools.extract_list_items(args.get("max_count", 10)),
-            "extract_table_data": lambda: self.tools.extract_table_data(args.get("max_rows", 10)),
-            "extract_element_text": lambda: self.tools.extract_element_text(args.get("index", 0)),
-            "click_element_by_index": lambda: self.tools.click_element_by_index(args.get("index", 0)),
-            "fill_field_by_index": lambda: self.tools.fill_field_by_index(
-                args.get("index", 0), 
-                args.get("value", "")
-            ),
-            "scroll": lambda: self.tools.scroll(
-                args.get("direction", "down"), 
-                args.get("amount", 500)
-            ),
-            "press_enter": lambda: self.tools.press_enter(),
-            "check_checkbox": lambda: self.tools.check_checkbox(args.get("index", 0)),
-            "hover_element": lambda: self.tools.hover_element(args.get("index", 0)),
-            "get_current_url": lambda: self.tools.get_current_url(),
-            "wait_for_navigation": lambda: self.tools.wait_for_navigation(),
-            "wait_for_element": lambda: self.tools.wait_for_element(
-                args.get("selector", ""),
-                args.get("timeout", Config.WAIT_TIMEOUT)
-            ),
-        }
+        text = f"\n\nТекущая страница: {snapshot.get('title', 'Без названия')}"
+        text += f"\nURL: {snapshot.get('url', 'Неизвестен')}"
+        element_count = snapshot.get("element_count", 0)
         
-        # Специальный инструмент для суб-агента
-        if tool_name == "sub_agent_analysis":
-            analysis_type = args.get("type", "spam")
-            items = args.get("items", [])
-            
-            if analysis_type == "spam":
-                result = self.sub_agent.analyze_spam(items)
-                self.analysis_cache["last_spam_analysis"] = result
-                return result
-            elif analysis_type == "jobs":
-                user_profile = args.get("user_profile", "")
-                result = self.sub_agent.analyze_job_relevance(items, user_profile)
-                self.analysis_cache["last_job_analysis"] = result
-                return result
-            else:
-                return {
-                    "success": False,
-                    "error": f"Неизвестный тип анализа: {analysis_type}"
-                }
+        if snapshot.get("mode") == "diff":
+            added = snapshot.get("added", [])
+            changed = snapshot.get("changed", [])
+            removed = snapshot.get("removed", [])
+            if not (added or changed or removed):
+                text += f"\n\nЭлементы не изменились с прошлого снимка (всего {element_count})."
+                return text
+            text += f"\n\nИзменения с прошлого снимка (всего элементов: {element_count}):"
+            if added:
+                text += "\nПоявились:\n" + "\n".join(element_line(el) for el in added[:15])
+            if changed:
+                text += "\nИзменились:\n" + "\n".join(element_line(el) for el in changed[:15])
+            if removed:
+                text += "\nИсчезли: " + ", ".join(f"#{idx}" for idx in removed[:30])
+            return text
         
-        if tool_name not in available_tools:
+        elements = snapshot.get("elements", [])[:15]
+        elements_info = "\n".join([
+            element_line(el) for el in elements if isinstance(el, dict)
+        ])
+        text += f"\n\nЭлементы на странице ({element_count}):"
+        text += f"\n{elements_info or 'Нет элементов'}"
+        if element_count > 15:
+            text += f"\n... и ещё {element_count - 15} элементов"
+        return text
+    
+    async def _execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполнение инструмента по имени (с замером в трассе)"""
+        with span("tool", tool=tool_name, args=args) as tool_span:
+            result = await self._dispatch_tool(tool_name, args)
+            tool_span.set(success=result.get("success"), error=result.get("error"), timeout=result.get("timeout"))
+            return result
+    
+    async def _dispatch_tool(self, tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Вызов инструмента по имени через реестр (tool_registry.TOOLS)"""
+        spec = TOOLS.get(tool_name)
+        if spec is None:
             return {
                 "success": False,
                 "error": f"Неизвестный инструмент: {tool_name}"
             }
         
+        if tool_name == "extract_page_snapshot" and self.history.rebase_requested:
+            # История не укладывается в бюджет из-за старой базы diff'ов — новая база
+            args = {**args, "full": True}
+        
+        if spec.target == "agent":
+            target, on_timeout = self, None
+        else:
+            target = self.tools
+            on_timeout = self.tools.abort_scripts if Config.TOOL_WATCHDOG else None
+        
         try:
-            return available_tools[tool_name]()
+            return await TOOLS.call(spec, target, args, on_timeout=on_timeout,
+                                    page_url=self.page.url if self.page is not None else "")
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Ошибка выполнения {tool_name}: {str(e)}"
             }
     
-    def _get_llm_response(self) -> str:
-        """Получение ответа от GigaChat"""
-        try:
-            from gigachat.models import Chat
-            response = self.llm_client.chat(Chat(messages=self.conversation_history))
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.error(f"Ошибка связи с LLM: {e}")
-            raise
+    @tool("sub_agent_analysis", description="анализ списка текстов суб-агентом: type spam — спам, "
+                                            "jobs — релевантность вакансий профилю user_profile",
+          schema={
+              "type": {"type": "string", "enum": ["spam", "jobs"]},
+              "items": {"type": "array", "required": True},
+              "user_profile": {"type": "string"},
+              "top_k": {"type": "integer"}
+          },
+          example={"type": "spam", "items": ["текст письма 1", "текст письма 2"]},
+          timeout=300, target="agent")
+    async def _sub_agent_analysis(self, items: List[str], type: str = "spam", user_profile: str = "",
+                                  top_k: Optional[int] = None) -> Dict[str, Any]:
+        """Специальный инструмент для суб-агента"""
+        if type == "spam":
+            result = await asyncio.to_thread(self.sub_agent.analyze_spam, items)
+            self.analysis_cache["last_spam_analysis"] = result
+        else:
+            result = await asyncio.to_thread(self.sub_agent.analyze_job_relevance, items, user_profile, top_k)
+            self.analysis_cache["last_job_analysis"] = result
+        return result
+    
+    @staticmethod
+    def _parse_tool_call(call: Dict[str, Any]) -> tuple:
+        """Имя инструмента и очищенные аргументы из JSON-вызова"""
+        tool_name = str(call.get("tool", "")).strip()
+        raw_args = call.get("args", {})
+        
+        # Глубокая очистка аргументов
+        if isinstance(raw_args, dict):
+            args = {}
+            for key, value in raw_args.items():
+                if isinstance(value, str):
+                    args[key] = value.strip()
+                else:
+                    args[key] = value
+        else:
+            args = {}
+        return tool_name, args
+    
+    async def _confirm_and_execute(self, tool_name: str, args: Dict[str, Any], task: str) -> Dict[str, Any]:
+        """Выполнение инструмента с подтверждением опасных действий"""
+        if is_dangerous_action(tool_name, args, task):
+            if not await asyncio.to_thread(confirm_action, tool_name, str(args)):
+                return {
+                    "success": False,
+                    "message": "Действие отменено пользователем"
+                }
+        return await self._execute_tool(tool_name, args)
+    
+    async def _execute_batch(self, calls: List[Dict[str, Any]], task: str) -> Dict[str, Any]:
+        """
+        Пакет действий из одного ответа модели: выполняются по порядку,
+        остановка на первой ошибке или на смене страницы, после которой
+        остались действия по index старой страницы. Возвращает общий результат.
+        """
+        steps = []
+        stop_reason = None
+        state_changed = False
+        last_snapshot = None
+        
+        for position, call in enumerate(calls):
+            tool_name, args = self._parse_tool_call(call)
+            if tool_name == "batch" or not tool_name:
+                stop_reason = f"недопустимое действие в пакете: {tool_name or 'без имени'}"
+                break
+            
+            url_before = self.page.url
+            logger.info(f"🔧 Пакет {position + 1}/{len(calls)}: {tool_name} | args: {args}")
+            result = await self._confirm_and_execute(tool_name, args, task)
+            success = bool(result.get("success"))
+            steps.append({
+                "tool": tool_name,
+                "args": args,
+                "success": success,
+                "message": result.get("message") if success else result.get("error") or result.get("message"),
+                "url": self.page.url  # Адрес после шага: по нему макрос сверяет воспроизведение
+            })
+            if tool_name in STATE_CHANGING_TOOLS:
+                state_changed = True
+            if tool_name == "extract_page_snapshot" and success:
+                last_snapshot = result
+            
+            if not success:
+                stop_reason = f"ошибка на шаге {position + 1} ({tool_name})"
+                break
+            
+            remaining = [str(c.get("tool", "")).strip() for c in calls[position + 1:]]
+            if (tool_name != "navigate" and self.page.url != url_before
+                    and any(name in INDEX_TOOLS for name in remaining)):
+                stop_reason = (f"после шага {position + 1} ({tool_name}) сменилась страница, "
+                               f"index остальных действий устарели")
+                break
+        
+        summary = "; ".join(f"{s['tool']} {'✅' if s['success'] else '❌'}" for s in steps)
+        details = "\n".join(f"{i + 1}. {s['tool']}: {s['message'] or ''}" for i, s in enumerate(steps))
+        result = {
+            "success": stop_reason is None,
+            "steps": steps,
+            "executed": len(steps),
+            "total": len(calls),
+            "state_changed": state_changed,
+            "url": self.page.url
+        }
+        if last_snapshot is not None and not state_changed:
+            result["snapshot"] = last_snapshot
+        if stop_reason is None:
+            result["message"] = f"Пакет выполнен ({len(steps)}/{len(calls)}): {summary}\n{details}"
+        else:
+            result["error"] = (f"Пакет остановлен: {stop_reason}. Выполнено {len(steps)}/{len(calls)}: "
+                               f"{summary}\n{details}")
+        return result
+    
+    async def _get_llm_response(self) -> str:
+        """Получение ответа модели через общий LLM-клиент"""
+        with span("llm") as llm_span:
+            try:
+                messages = self.history.messages()
+                llm_span.set(
+                    messages=len(messages),
+                    prompt_chars=sum(len(m["content"]) for m in messages),
+                    prompt_tokens=self.history.total_tokens()
+                )
+                reply = await self.llm.acomplete(messages, stop_at_tool_call=Config.LLM_STREAMING)
+                llm_span.set(response_chars=len(reply))
+                return reply
+            except Exception as e:
+                logger.error(f"Ошибка связи с LLM: {e}")
+                raise
 
-    def think_and_act(self, task: str, max_steps: int = None) -> str:
+    async def think_and_act(self, task: str, max_steps: int = None) -> str:
+        """Выполняет задачу в отдельном чистом контексте из пула"""
+        
+        if self.pool is None or not self.pool.started:
+            await self.start()
+        
+        tracer = Tracer()
+        token = set_tracer(tracer)
+        har_path = (os.path.join(self.record_har_dir, self._trace_name(tracer) + ".har")
+                    if self.record_har_dir else None)
+        misses_before = self.pool.stats["har_misses"]
+        try:
+            with tracer.span("task", task=task) as task_span:
+                async with self.pool.lease(record_har_path=har_path,
+                                           replay_har_path=self.replay_har_path) as page:
+                    self.page = page
+                    self.tools = AsyncBrowserTools(page)
+                    if Config.TOOL_WATCHDOG:
+                        await self.tools.start_watchdog()
+                    try:
+                        result = await self._run_task(task, max_steps)
+                    finally:
+                        self.tools = None
+                        self.page = None
+                if self.macros is not None and self._macro_recorder is not None and result.startswith("✅"):
+                    self.macros.record(self._macro_recorder)
+                task_span.set(result=result[:200])
+                return result
+        finally:
+            reset_tracer(token)
+            self.last_trace = tracer
+            if self.llm.cache is not None:
+                info = self.llm.cache.info()
+                logger.info(f"💾 Кэш LLM: попаданий {info['hits']}, промахов {info['misses']}, "
+                            f"записей {info['entries']}")
+            metrics = TOOLS.metrics()
+            if metrics:
+                logger.info("🧰 Инструменты: " + ", ".join(
+                    f"{name} ×{m['calls']} (ср. {m['avg_ms']} мс, ошибок {m['errors']}, таймаутов {m['timeouts']}, "
+                    f"повторов {m['retries']})"
+                    for name, m in metrics.items()))
+            for row in TOOLS.timeout_report(limit=5):
+                logger.info(f"⏱️ Таймауты на {row['page']}: {row['tools']}")
+            if self.pool is not None and self.pool.resource_policy is not None:
+                policy = self.pool.resource_policy.snapshot_stats()
+                logger.info(f"🚫 Заблокировано запросов: {policy['blocked']} из {policy['requests']} "
+                            f"(~{policy['blocked_bytes_estimated'] // 1024} КБ) {policy['blocked_by_type']}")
+            if self.replay_har_path:
+                misses = self.pool.stats["har_misses"] - misses_before
+                if misses:
+                    logger.warning(f"📼 Запросов без ответа в HAR: {misses} — архив неполон, прогон может отличаться")
+            if har_path:
+                logger.info(f"📼 HAR сохранён: {har_path}")
+                self._export_trace(tracer, self.record_har_dir)
+            elif Config.TRACE_DIR:
+                self._export_trace(tracer)
+    
+    @staticmethod
+    def _trace_name(tracer: Tracer) -> str:
+        """Имя файлов прогона (трасса, HAR): время начала + id трассы"""
+        return time.strftime("%Y%m%d_%H%M%S", time.localtime(tracer.started_at)) + f"_{id(tracer):x}"
+    
+    def _export_trace(self, tracer: Tracer, directory: Optional[str] = None):
+        """Сохраняет трассу прогона в directory или TRACE_DIR (JSONL + Chrome Trace)"""
+        base = os.path.join(directory or Config.TRACE_DIR, self._trace_name(tracer))
+        try:
+            tracer.export_jsonl(base + ".jsonl")
+            tracer.export_chrome_trace(base + ".trace.json")
+            logger.info(f"📈 Трасса сохранена: {base}.jsonl")
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить трассу: {e}")
+    
+    def _add_result_to_history(self, result_msg: str, tool_result: Dict[str, Any],
+                               snapshot: Optional[Dict[str, Any]]):
+        """Результат действия в историю; со снимком — как snapshot (для сжатия истории)"""
+        if snapshot is not None:
+            self.history.add("user", f"Результат действия:\n{result_msg}", kind="snapshot", meta={
+                "mode": snapshot.get("mode", "full"),
+                "title": snapshot.get("title", ""),
+                "url": snapshot.get("url", ""),
+                "element_count": snapshot.get("element_count", 0)
+            })
+        else:
+            self.history.add("user", f"Результат действия:\n{result_msg}", kind="tool_result",
+                             meta={"url": tool_result.get("url", "")})
+    
+    async def _replay_macro(self, task: str) -> int:
+        """
+        Воспроизводит записанный макрос для задачи без обращений к LLM.
+        Каждый шаг проверяется по странице: элемент ищется по признакам в свежем
+        снимке, после шага сверяется URL. При первом расхождении управление
+        возвращается модели — выполненные шаги уже лежат в истории как её ходы.
+        Возвращает число воспроизведённых шагов.
+        """
+        found = self.macros.find(task)
+        if found is None:
+            return 0
+        macro, values = found
+        logger.info(f"📼 Воспроизвожу макрос {macro['key']} ({len(macro['steps'])} шагов)")
+        
+        done = 0
+        diverged = None
+        with span("macro.replay", key=macro["key"], steps=len(macro["steps"])) as replay_span:
+            for step in macro["steps"]:
+                tool_name = step["tool"]
+                args = render_args(step["args"], values)
+                if step.get("element"):
+                    snapshot = await self._dispatch_tool("extract_page_snapshot", {"full": True})
+                    self._macro_recorder.observe_snapshot(snapshot)
+                    el = find_element(snapshot.get("elements", []), step["element"], values)
+                    if el is None:
+                        diverged = f"элемент для {tool_name} не найден на странице"
+                        break
+                    args["index"] = el["index"]
+                
+                result = await self._confirm_and_execute(tool_name, args, task)
+                if not result.get("success"):
+                    diverged = f"{tool_name}: {result.get('error') or result.get('message')}"
+                    break
+                self._macro_recorder.add(tool_name, args, result, self.page.url)
+                self.history.add("assistant", json.dumps({"tool": tool_name, "args": args}, ensure_ascii=False),
+                                 kind="assistant")
+                self.history.add("user", f"Результат действия:\n✅ Успешно (макрос): "
+                                         f"{result.get('message', 'Действие выполнено')}", kind="tool_result",
+                                 meta={"url": self.page.url})
+                done += 1
+                if step.get("url_after") and url_key(self.page.url) != step["url_after"]:
+                    diverged = f"после {tool_name} открылась другая страница ({self.page.url})"
+                    break
+            replay_span.set(replayed=done, diverged=diverged)
+        
+        self.macros.mark_replay(macro["key"], diverged is not None)
+        if diverged:
+            logger.info(f"📼 Макрос разошёлся со страницей после {done} шагов: {diverged}. Управление — модели")
+        else:
+            logger.info(f"📼 Макрос воспроизведён полностью ({done} шагов)")
+        
+        # Модель продолжает с полным снимком текущей страницы
+        if done:
+            snapshot = await self._dispatch_tool("extract_page_snapshot", {"full": True})
+            if snapshot.get("success"):
+                self._macro_recorder.observe_snapshot(snapshot)
+                note = f"Макрос выполнил {done} шагов" + (f", затем остановился: {diverged}" if diverged else "")
+                self._add_result_to_history(f"✅ {note}" + self._format_snapshot(snapshot), snapshot, snapshot)
+        return done
+    
+    async def _run_task(self, task: str, max_steps: int = None) -> str:
         """Главный цикл агента: думает → выбирает действие → получает результат"""
         
         if max_steps is None:
@@ -196,13 +519,13 @@ class BrowserAgent:
         
         logger.info(f"🎯 Начинаем выполнение задачи: {task}")
         
-        # Инициализация истории диалога для GigaChat
-        from gigachat.models import Messages, MessagesRole
-        system_prompt = self._build_system_prompt()
-        self.conversation_history = [
-            Messages(role=MessagesRole.SYSTEM, content=system_prompt),
-            Messages(role=MessagesRole.USER, content=f"ЗАДАЧА: {task}")
-        ]
+        # Инициализация истории диалога (системный промпт и задача закреплены)
+        self.history.reset(self._build_system_prompt(), task)
+        
+        # Известная последовательность для этой задачи — без обращений к модели
+        self._macro_recorder = MacroRecorder(task)
+        if self.macros is not None:
+            await self._replay_macro(task)
         
         # Счётчики для детектирования проблем
         consecutive_format_errors = 0
@@ -211,153 +534,176 @@ class BrowserAgent:
         
         # Основной цикл выполнения задачи
         for step in range(max_steps):
-            logger.info(f"\n{'='*60}")
-            logger.info(f"ШАГ {step + 1}/{max_steps}")
-            logger.info(f"{'='*60}")
-            
-            # Запрос к модели
-            assistant_reply = ""
-            try:
-                assistant_reply = self._get_llm_response()
-                from gigachat.models import Messages, MessagesRole
-                self.conversation_history.append(
-                    Messages(role=MessagesRole.ASSISTANT, content=assistant_reply)
-                )
-            except Exception as e:
-                return f"❌ Ошибка связи с LLM: {str(e)}"
-            
-            # Вывод рассуждений агента
-            print(f"\n{'─'*60}")
-            print(f"🤖 АГЕНТ ДУМАЕТ (Шаг {step + 1}):")
-            print(f"{'─'*60}")
-            print(assistant_reply[:500] + "..." if len(assistant_reply) > 500 else assistant_reply)
-            
-            # ИЗВЛЕЧЕНИЕ ИНСТРУМЕНТА ИЗ ОТВЕТА
-            tool_call = extract_json_from_text(assistant_reply)
-            
-            if tool_call and isinstance(tool_call, dict) and "tool" in tool_call:
-                tool_name = str(tool_call.get("tool", "")).strip()
-                raw_args = tool_call.get("args", {})
+            with span("step", step=step + 1) as step_span:
+                logger.info(f"\n{'='*60}")
+                logger.info(f"ШАГ {step + 1}/{max_steps}")
+                logger.info(f"{'='*60}")
                 
-                # Глубокая очистка аргументов
-                if isinstance(raw_args, dict):
-                    args = {}
-                    for key, value in raw_args.items():
-                        if isinstance(value, str):
-                            args[key] = value.strip()
-                        else:
-                            args[key] = value
-                else:
-                    args = {}
+                # Сжатие истории под бюджет токенов
+                tokens_saved = self.history.compact()
+                if tokens_saved:
+                    logger.info(f"🗜️ История сжата: −{tokens_saved} токенов "
+                                f"(осталось ~{self.history.total_tokens()})")
+                step_span.set(tokens_saved=tokens_saved, prompt_tokens=self.history.total_tokens())
                 
-                logger.info(f"🔧 Выполняю инструмент: {tool_name} | args: {args}")
-                consecutive_format_errors = 0
+                # Пока модель думает — упреждающий снимок текущей страницы
+                prefetch = None
+                if Config.SNAPSHOT_PREFETCH and self.page.url != "about:blank":
+                    prefetch = asyncio.create_task(self.tools.prefetch_snapshot())
                 
-                # ВЫПОЛНЕНИЕ ИНСТРУМЕНТА
-                if is_dangerous_action(tool_name, args, task):
-                    if not confirm_action(tool_name, str(args)):
-                        tool_result = {
-                            "success": False,
-                            "message": "Действие отменено пользователем"
-                        }
-                    else:
-                        tool_result = self._execute_tool(tool_name, args)
-                else:
-                    tool_result = self._execute_tool(tool_name, args)
-                
-                # ФОРМИРОВАНИЕ ОТВЕТА ДЛЯ МОДЕЛИ
-                if tool_result.get("success"):
-                    result_msg = f"✅ Успешно: {tool_result.get('message', 'Действие выполнено')}"
-                else:
-                    result_msg = f"❌ Ошибка: {tool_result.get('error', 'Неизвестная ошибка')}"
+                # Запрос к модели
+                assistant_reply = ""
+                try:
+                    assistant_reply = await self._get_llm_response()
+                    self.history.add("assistant", assistant_reply, kind="assistant")
+                except Exception as e:
+                    return f"❌ Ошибка связи с LLM: {str(e)}"
+                finally:
+                    # Инструменты не должны выполняться параллельно со скриптом снимка
+                    if prefetch is not None:
+                        await prefetch
                 
-                # Добавление деталей для снимка страницы
-                if tool_name == "extract_page_snapshot" and tool_result.get("success"):
-                    elements = tool_result.get("elements", [])[:15]
-                    elements_info = "\n".join([
-                        f"{el.get('index', '?')}. [{el.get('type', '?')}] \"{el.get('text', '')[:60].strip()}\""
-                        for el in elements if isinstance(el, dict)
-                    ])
-                    
-                    result_msg += f"\n\nТекущая страница: {tool_result.get('title', 'Без названия')}"
-                    result_msg += f"\nURL: {tool_result.get('url', 'Неизвестен')}"
-                    result_msg += f"\n\nЭлементы на странице ({tool_result.get('element_count', 0)}):"
-                    result_msg += f"\n{elements_info or 'Нет элементов'}"
-                    if tool_result.get("element_count", 0) > 15:
-                        result_msg += f"\n... и ещё {tool_result.get('element_count', 0) - 15} элементов"
-                    
-                    # Детектирование пустой страницы
-                    current_url = tool_result.get("url", "")
-                    if current_url == "about:blank" or tool_result.get("element_count", 0) == 0:
-                        blank_page_count += 1
-                    else:
-                        blank_page_count = 0
-                        last_url = current_url
+                # Вывод рассуждений агента
+                print(f"\n{'─'*60}")
+                print(f"🤖 АГЕНТ ДУМАЕТ (Шаг {step + 1}):")
+                print(f"{'─'*60}")
+                print(assistant_reply[:500] + "..." if len(assistant_reply) > 500 else assistant_reply)
                 
-                # Детектирование неудачной навигации
-                if tool_name == "navigate":
-                    current_url = tool_result.get("url", "")
-                    if current_url == "about:blank" or not tool_result.get("success"):
-                        blank_page_count += 1
-                    else:
-                        blank_page_count = 0
-                        last_url = current_url
+                # ИЗВЛЕЧЕНИЕ ИНСТРУМЕНТА ИЗ ОТВЕТА (с ремонтом JSON и проверкой аргументов)
+                parsed = parse_tool_reply(assistant_reply, TOOLS.schemas(), STATE_CHANGING_TOOLS)
+                tool_call = parsed["call"]
+                if parsed["repairs"]:
+                    step_span.set(json_repairs=parsed["repairs"])
                 
-                # Добавление результата в историю
-                from gigachat.models import Messages, MessagesRole
-                self.conversation_history.append(
-                    Messages(role=MessagesRole.USER, content=f"Результат действия:\n{result_msg}")
-                )
+                is_batch = (Config.TOOL_BATCHING and isinstance(tool_call, dict)
+                            and "tool" not in tool_call and isinstance(tool_call.get("tools"), list))
                 
-                logger.info(f"🔧 Результат: {result_msg.split(chr(10))[0][:100]}...")
+                if tool_call and not parsed["errors"] and ("tool" in tool_call or is_batch):
+                    consecutive_format_errors = 0
+                    
+                    # ВЫПОЛНЕНИЕ ИНСТРУМЕНТА (или пакета инструментов)
+                    if is_batch:
+                        tool_name, args = "batch", {}
+                        calls = [c for c in tool_call["tools"] if isinstance(c, dict)][:Config.TOOL_BATCH_MAX]
+                        logger.info(f"🔧 Выполняю пакет из {len(calls)} действий")
+                        step_span.set(tool=tool_name, batch_size=len(calls), response_chars=len(assistant_reply))
+                        tool_result = await self._execute_batch(calls, task)
+                        step_span.set(batch_executed=tool_result.get("executed"))
+                    else:
+                        tool_name, args = self._parse_tool_call(tool_call)
+                        logger.info(f"🔧 Выполняю инструмент: {tool_name} | args: {args}")
+                        step_span.set(tool=tool_name, response_chars=len(assistant_reply))
+                        tool_result = await self._confirm_and_execute(tool_name, args, task)
+                    
+                    # Снимок после действия, меняющего страницу, — без отдельного шага модели
+                    if Config.SNAPSHOT_AFTER_ACTION and (
+                            (tool_name in STATE_CHANGING_TOOLS and tool_result.get("success"))
+                            or tool_result.get("state_changed")):
+                        snapshot = await self._dispatch_tool("extract_page_snapshot", {})
+                        if snapshot.get("success"):
+                            tool_result["snapshot"] = snapshot
+                    
+                    # ФОРМИРОВАНИЕ ОТВЕТА ДЛЯ МОДЕЛИ
+                    with span("prompt_build"):
+                        if tool_result.get("success"):
+                            result_msg = f"✅ Успешно: {tool_result.get('message', 'Действие выполнено')}"
+                        else:
+                            result_msg = f"❌ Ошибка: {tool_result.get('error', 'Неизвестная ошибка')}"
+                        
+                        # Добавление деталей для снимка страницы
+                        snapshot = None
+                        if tool_name == "extract_page_snapshot" and tool_result.get("success"):
+                            snapshot = tool_result
+                        elif "snapshot" in tool_result:
+                            snapshot = tool_result["snapshot"]
+                        if snapshot is not None:
+                            result_msg += self._format_snapshot(snapshot)
+                    step_span.set(
+                        success=tool_result.get("success"),
+                        error=tool_result.get("error"),
+                        settle_ms=tool_result.get("settle_ms"),
+                        result_chars=len(result_msg),
+                        snapshot_attached="snapshot" in tool_result,
+                        snapshot_prefetched=bool(snapshot and snapshot.get("prefetched"))
+                    )
+                    
+                    if snapshot is not None:
+                        # Детектирование пустой страницы
+                        current_url = snapshot.get("url", "")
+                        if current_url == "about:blank" or snapshot.get("element_count", 0) == 0:
+                            blank_page_count += 1
+                        else:
+                            blank_page_count = 0
+                            last_url = current_url
+                    
+                    # Детектирование неудачной навигации
+                    if tool_name == "navigate" and snapshot is None:
+                        current_url = tool_result.get("url", "")
+                        if current_url == "about:blank" or not tool_result.get("success"):
+                            blank_page_count += 1
+                        else:
+                            blank_page_count = 0
+                            last_url = current_url
+                    
+                    # Добавление результата в историю
+                    self._add_result_to_history(result_msg, tool_result, snapshot)
+                    self._macro_recorder.add(tool_name, args, tool_result, self.page.url)
+                    
+                    logger.info(f"🔧 Результат: {result_msg.split(chr(10))[0][:100]}...")
+                    if "settle_ms" in tool_result:
+                        logger.info(f"⏱️ Стабилизация страницы: {tool_result['settle_ms']} мс")
+                    
+                    # ПРОВЕРКА ЗАВЕРШЕНИЯ ЗАДАЧИ
+                    if step > 2 and any(keyword in assistant_reply.lower() for keyword in ["задача выполнена", "готово", "успешно завершено"]):
+                        if "tool" not in assistant_reply.lower() or len(assistant_reply) < 100:
+                            for keyword in ["итог", "результат", "ответ", "вывод", "отчёт"]:
+                                pos = assistant_reply.lower().find(keyword)
+                                if pos != -1:
+                                    return f"✅ ЗАДАЧА ВЫПОЛНЕНА:\n{assistant_reply[pos:]}"
+                            return f"✅ ЗАДАЧА ВЫПОЛНЕНА:\n{assistant_reply}"
                 
-                # ПРОВЕРКА ЗАВЕРШЕНИЯ ЗАДАЧИ
-                if step > 2 and any(keyword in assistant_reply.lower() for keyword in ["задача выполнена", "готово", "успешно завершено"]):
-                    if "tool" not in assistant_reply.lower() or len(assistant_reply) < 100:
-                        for keyword in ["итог", "результат", "ответ", "вывод", "отчёт"]:
-                            pos = assistant_reply.lower().find(keyword)
-                            if pos != -1:
-                                return f"✅ ЗАДАЧА ВЫПОЛНЕНА:\n{assistant_reply[pos:]}"
+                else:
+                    # ОБРАБОТКА ОШИБКИ ФОРМАТА
+                    consecutive_format_errors += 1
+                    step_span.set(format_error=True, response_chars=len(assistant_reply))
+                    
+                    if any(keyword in assistant_reply.lower() for keyword in ["задача выполнена", "готово"]):
                         return f"✅ ЗАДАЧА ВЫПОЛНЕНА:\n{assistant_reply}"
-            
-            else:
-                # ОБРАБОТКА ОШИБКИ ФОРМАТА
-                consecutive_format_errors += 1
-                
-                if any(keyword in assistant_reply.lower() for keyword in ["задача выполнена", "готово"]):
-                    return f"✅ ЗАДАЧА ВЫПОЛНЕНА:\n{assistant_reply}"
-                
-                if consecutive_format_errors >= 3:
-                    return (f"⚠️ Агент не может сформировать корректный вызов инструмента "
-                        f"({consecutive_format_errors} попыток).\n"
-                        f"Последний ответ модели:\n{assistant_reply[:300]}... ")
-                
-                # Отправка корректирующего сообщения модели
-                correction = ("ОШИБКА ФОРМАТА! Ответ должен содержать ТОЛЬКО ОДИН инструмент в ЧИСТОМ JSON:\n"
-                            '{"tool": "название_инструмента", "args": {"параметр": "значение"}}\n'
-                            "Без текста до/после JSON, без нескольких инструментов в одном ответе.")
-                logger.warning(f"⚠️ {correction}")
+                    
+                    if consecutive_format_errors >= 3:
+                        return (f"⚠️ Агент не может сформировать корректный вызов инструмента "
+                            f"({consecutive_format_errors} попыток).\n"
+                            f"Последний ответ модели:\n{assistant_reply[:300]}... ")
+                    
+                    # Отправка корректирующего сообщения модели
+                    if parsed["truncated"]:
+                        step_span.set(truncated=True)
+                        correction = ("ОТВЕТ ОБОРВАН! " + "; ".join(parsed["errors"]) +
+                                      "\nОтветь короче: только JSON вызова, без пояснений.")
+                    elif parsed["errors"]:
+                        step_span.set(arg_errors=parsed["errors"])
+                        correction = ("ОШИБКА АРГУМЕНТОВ! " + "; ".join(parsed["errors"]) +
+                                      "\nПовтори вызов с исправленными аргументами.")
+                    else:
+                        correction = ("ОШИБКА ФОРМАТА! Ответ должен содержать ТОЛЬКО ОДИН инструмент в ЧИСТОМ JSON:\n"
+                                    '{"tool": "название_инструмента", "args": {"параметр": "значение"}}\n'
+                                    "Без текста до/после JSON, без нескольких инструментов в одном ответе.")
+                    logger.warning(f"⚠️ {correction}")
+                    
+                    self.history.add("user", correction, kind="correction")
+                    continue
                 
-                from gigachat.models import Messages, MessagesRole
-                self.conversation_history.append(
-                    Messages(role=MessagesRole.USER, content=correction)
-                )
-                continue
+                # ВОССТАНОВЛЕНИЕ ПРИ ЗАСТРЕВАНИИ НА ПУСТОЙ СТРАНИЦЕ
+                if blank_page_count >= 3:
+                    logger.warning("⚠️ Агент застрял на пустой странице. Пробую восстановление...")
+                    recovery_result = await self._dispatch_tool("navigate", {"url": "https://yandex.ru"})
+                    recovery_msg = (f"Восстановление: переход на Яндекс "
+                                f"{'успешен' if recovery_result.get('success') else 'не удался'}")
+                    logger.info(recovery_msg)
+                    
+                    self.history.add("user", f"СИСТЕМА: {recovery_msg}", kind="system_note")
+                    blank_page_count = 0
             
-            # ВОССТАНОВЛЕНИЕ ПРИ ЗАСТРЕВАНИИ НА ПУСТОЙ СТРАНИЦЕ
-            if blank_page_count >= 3:
-                logger.warning("⚠️ Агент застрял на пустой странице. Пробую восстановление...")
-                recovery_result = self.tools.navigate("https://yandex.ru")
-                recovery_msg = (f"Восстановление: переход на Яндекс "
-                            f"{'успешен' if recovery_result.get('success') else 'не удался'}")
-                logger.info(recovery_msg)
-                
-                from gigachat.models import Messages, MessagesRole
-                self.conversation_history.append(
-                    Messages(role=MessagesRole.USER, content=f"СИСТЕМА: {recovery_msg}")
-                )
-                blank_page_count = 0
-        
         # ДОСТИГНУТ ЛИМИТ ШАГОВ
         if last_url != "about:blank":
             return (f"⚠️ Достигнут лимит шагов ({max_steps}).\n"
@@ -366,4 +712,45 @@ class BrowserAgent:
         else:
             return ("⚠️ Достигнут лимит шагов ({max_steps}).\n"
                 "Агент не смог покинуть пустую страницу.\n"
-                "Возможные причины: проблемы с интернетом, блокировка сайта, ошибка в задаче.")
\ No newline at end of file
+                "Возможные причины: проблемы с интернетом, блокировка сайта, ошибка в задаче.")
+
+
+class BrowserAgent:
+    """
+    Синхронная обёртка над AsyncBrowserAgent.
+    Агент работает в собственном фоновом event loop, публичный API не изменился.
+    """
+    
+    def __init__(self, llm_client: Any = None, record_har_dir: Optional[str] = None,
+                 replay_har_path: Optional[str] = None):
+        self._loop_thread = EventLoopThread()
+        self._agent = AsyncBrowserAgent(llm_client=llm_client, record_har_dir=record_har_dir,
+                                        replay_har_path=replay_har_path)
+        try:
+            self._loop_thread.run(self._agent.start())
+        except Exception:
+            self._loop_thread.stop()
+            raise
+    
+    @property
+    def tools(self) -> Optional[BrowserTools]:
+        """Инструменты текущей задачи (существуют только во время think_and_act)"""
+        if self._agent.tools is None:
+            return None
+        return BrowserTools(self._agent.tools, self._loop_thread)
+    
+    def __getattr__(self, name: str) -> Any:
+        # conversation_history, analysis_cache, sub_agent, page и т.д.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._agent, name)
+    
+    def think_and_act(self, task: str, max_steps: int = None) -> str:
+        return self._loop_thread.run(self._agent.think_and_act(task, max_steps))
+    
+    def close(self):
+        """Закрытие браузера и остановка event loop"""
+        try:
+            self._loop_thread.run(self._agent.close())
+        finally:
+            self._loop_thread.stop()
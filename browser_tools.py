@@ -1,23 +1,112 @@
-import time
+import asyncio
 import logging
 import re
 from config import Config
 from typing import Optional, List, Dict, Any
-from playwright.sync_api import Page, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
+from page_scripts import (
+    SNAPSHOT_JS,
+    COMMIT_SNAPSHOT_JS,
+    CLICK_JS,
+    FILL_JS,
+    CHECKBOX_JS,
+    ELEMENT_TEXT_JS,
+    RESOLVE_JS,
+    RESOLVE_STATUS_JS,
+    with_runtime
+)
+from page_settle import PageSettler
+from tool_registry import tool
+from tracing import traced, span
+from utils import EventLoopThread
 
 logger = logging.getLogger(__name__)
 
-class BrowserTools:
-    """Набор универсальных инструментов для работы с браузером"""
+class AsyncBrowserTools:
+    """Набор универсальных инструментов для работы с браузером (asyncio)"""
     
     def __init__(self, page: Page):
         self.page = page
+        self.settler = PageSettler(page)
+        # Следующий свободный id реестра элементов (не повторяется между документами)
+        self._next_element_id = 0
+        # На странице лежит упреждающий снимок (prefetch_snapshot), ждущий фиксации
+        self._has_prefetched = False
+        # CDP-сессия сторожа: прерывание зависших скриптов страницы (только Chromium)
+        self._cdp = None
+    
+    async def _evaluate(self, script: str, arg: Any = None) -> Any:
+        """Выполняет скрипт на странице, предварительно установив runtime агента"""
+        with span("page.evaluate"):
+            return await self.page.evaluate(with_runtime(script), arg)
+    
+    def _element_not_found(self, index: int, status: Optional[str]) -> Dict[str, Any]:
+        """Ошибка для id, которого нет в реестре страницы или который устарел"""
+        if status == "stale":
+            error_msg = (f"Элемент #{index} устарел: он удалён со страницы. "
+                         f"Сделайте новый extract_page_snapshot")
+        else:
+            error_msg = (f"Элемент #{index} не найден на текущей странице "
+                         f"(страница сменилась?). Сделайте новый extract_page_snapshot")
+        logger.warning(f"⚠️ {error_msg}")
+        return {
+            "success": False,
+            "stale": True,
+            "error": error_msg
+        }
+    
+    async def start_watchdog(self) -> bool:
+        """
+        Открывает CDP-сессию сторожа заранее: к зависшей странице
+        подключиться уже может не получиться. Вне Chromium сторож недоступен.
+        """
+        if self._cdp is not None:
+            return True
+        try:
+            self._cdp = await self.page.context.new_cdp_session(self.page)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Сторож скриптов недоступен: {e}")
+            return False
+    
+    async def abort_scripts(self) -> bool:
+        """
+        Прерывает выполняющийся на странице JavaScript (Runtime.terminateExecution),
+        например evaluate, зациклившийся на патологической странице. Страница
+        остаётся рабочей; возвращает True, если прерывание отправлено.
+        """
+        if self._cdp is None:
+            return False
+        try:
+            await asyncio.wait_for(self._cdp.send("Runtime.terminateExecution"), 5)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прервать скрипт страницы: {e}")
+            return False
+        # Если скрипт уже завершился, прерывание достанется следующему — поглощаем его пустым вызовом
+        try:
+            await asyncio.wait_for(self.page.evaluate("0"), 2)
+        except Exception:
+            pass
+        # Прерванный снимок мог оставить незафиксированное состояние
+        self._has_prefetched = False
+        logger.warning("⏱️ Зависший скрипт страницы прерван")
+        return True
+    
+    async def _settle(self, timeout_ms: Optional[int] = None) -> int:
+        """Ждёт стабилизации страницы и возвращает время ожидания в мс"""
+        with span("page.settle") as current:
+            settle = await self.settler.wait(timeout_ms)
+            current.set(settled=settle["settled"])
+        return settle["settle_ms"]
     
     # ============================================================
     # БАЗОВЫЕ МЕТОДЫ (уже были в оригинале)
     # ============================================================
     
-    def navigate(self, url: str) -> Dict[str, Any]:
+    @tool(description="переход по адресу", schema={"url": {"type": "string", "required": True}},
+          example={"url": "https://example.com"}, timeout=45, state_changing=True, retry_safe=True)
+    @traced
+    async def navigate(self, url: str) -> Dict[str, Any]:
         """Переход по указанному URL (автоматически добавляет схему)"""
         try:
             url = url.strip()
@@ -25,11 +114,12 @@ class BrowserTools:
                 url = 'https://' + url
             
             logger.info(f"🌐 Переход на {url}")
-            self.page.goto(url, timeout=Config.TOOL_TIMEOUT * 1000)
-            time.sleep(1.5)
+            await self.page.goto(url, timeout=Config.TOOL_TIMEOUT * 1000, wait_until="domcontentloaded")
+            settle_ms = await self._settle()
             return {
                 "success": True,
                 "url": self.page.url,
+                "settle_ms": settle_ms,
                 "message": f"Перешли на {url}"
             }
         except Exception as e:
@@ -40,66 +130,65 @@ class BrowserTools:
                 "error": error_msg
             }
             
-    def extract_page_snapshot(self) -> Dict[str, Any]:
-        """Извлекает информацию о текущей странице и видимых элементах"""
+    @tool(description="снимок страницы; повторный снимок той же страницы вернёт только изменения, "
+                      "{\"full\": true} — полный список",
+          schema={"full": {"type": "boolean"}}, example={}, timeout=20, retry_safe=True)
+    @traced
+    async def extract_page_snapshot(self, full: bool = False) -> Dict[str, Any]:
+        """
+        Извлекает информацию о текущей странице и видимых элементах.
+        Каждый элемент регистрируется в in-page реестре: его index — стабильный id,
+        по которому действия находят элемент без повторного обхода DOM.
+        
+        Если включён Config.SNAPSHOT_INCREMENTAL и документ не менялся с прошлого
+        снимка, возвращается только diff (mode="diff": added/removed/changed).
+        Полный список (mode="full") — после навигации, прокрутки или при full=True.
+        
+        Если страница не менялась после prefetch_snapshot, возвращается готовый
+        упреждающий снимок (prefetched=True) без повторного обхода DOM.
+        """
         try:
             logger.info("📸 Извлечение снимка страницы")
             
-            result = self.page.evaluate("""() => {
-                const elements = [];
-                const selectors = 'a, button, input, textarea, select, [role="button"], [role="link"]';
-                const allElements = Array.from(document.querySelectorAll(selectors));
-                
-                allElements.forEach((el, idx) => {
-                    try {
-                        const rect = el.getBoundingClientRect();
-                        const style = window.getComputedStyle(el);
-                        
-                        if (
-                            rect.width > 10 &&
-                            rect.height > 10 &&
-                            style.display !== 'none' &&
-                            style.visibility !== 'hidden' &&
-                            rect.top >= 0 &&
-                            rect.bottom <= window.innerHeight
-                        ) {
-                            const text = el.textContent.trim();
-                            const type = el.tagName.toLowerCase();
-                            const inputType = el.type || '';
-                            
-                            elements.push({
-                                index: elements.length,
-                                type: type,
-                                inputType: inputType,
-                                text: text.substring(0, 100),
-                                tagName: type,
-                                href: el.href || '',
-                                placeholder: el.placeholder || '',
-                                value: el.value || ''
-                            });
-                        }
-                    } catch (e) {
-                        // Пропускаем элементы, которые вызывают ошибки
-                    }
-                });
-                
-                return {
-                    title: document.title,
-                    url: window.location.href,
-                    elements: elements.slice(0, 50)
-                };
-            }""")
-            
-            element_count = len(result.get("elements", []))
-            logger.info(f"✅ Извлечено {element_count} элементов")
+            result = None
+            if self._has_prefetched and not full:
+                self._has_prefetched = False
+                result = await self._evaluate(COMMIT_SNAPSHOT_JS)
+            prefetched = result is not None
+            if result is None:
+                result = await self._evaluate(SNAPSHOT_JS, {
+                    "startId": self._next_element_id,
+                    "limit": Config.PAGE_ELEMENTS_LIMIT,
+                    "incremental": Config.SNAPSHOT_INCREMENTAL and not full,
+                    "speculative": False
+                })
+                self._next_element_id = max(self._next_element_id, result.get("nextId", 0))
+            
+            mode = result.get("mode", "full")
+            element_count = result.get("element_count", 0)
+            if mode == "diff":
+                added = result.get("added", [])
+                removed = result.get("removed", [])
+                changed = result.get("changed", [])
+                message = (f"Изменения с прошлого снимка: +{len(added)} -{len(removed)} "
+                           f"~{len(changed)} (всего {element_count} элементов)")
+            else:
+                added, removed, changed = [], [], []
+                message = f"Извлечено {element_count} элементов со страницы"
+            logger.info(f"✅ {message}")
             
             return {
                 "success": True,
+                "mode": mode,
                 "title": result.get("title", ""),
                 "url": result.get("url", ""),
                 "elements": result.get("elements", []),
+                "added": added,
+                "removed": removed,
+                "changed": changed,
                 "element_count": element_count,
-                "message": f"Извлечено {element_count} элементов со страницы"
+                "prefetched": prefetched,
+                "message": message
             }
             
         except Exception as e:
@@ -110,53 +199,53 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def click_element_by_index(self, index: int) -> Dict[str, Any]:
-        """Кликает по элементу по индексу"""
+    async def prefetch_snapshot(self) -> bool:
+        """
+        Упреждающий снимок (пока модель думает над следующим шагом).
+        Состояние «последнего показанного снимка» не меняется: результат
+        ждёт на странице и отдаётся следующим extract_page_snapshot, только
+        если страница с тех пор не менялась. Не инструмент для модели.
+        """
+        with span("page.prefetch"):
+            try:
+                result = await asyncio.wait_for(self._evaluate(SNAPSHOT_JS, {
+                    "startId": self._next_element_id,
+                    "limit": Config.PAGE_ELEMENTS_LIMIT,
+                    "incremental": Config.SNAPSHOT_INCREMENTAL,
+                    "speculative": True
+                }), Config.TOOL_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("⏱️ Упреждающий снимок не уложился в срок")
+                if Config.TOOL_WATCHDOG:
+                    await self.abort_scripts()
+                return False
+            except Exception as e:
+                logger.debug(f"Упреждающий снимок не удался: {e}")
+                return False
+            self._next_element_id = max(self._next_element_id, result.get("nextId", 0))
+            self._has_prefetched = True
+            return True
+    
+    @tool(description="клик по элементу", schema={"index": {"type": "integer", "required": True}},
+          timeout=20, state_changing=True)
+    @traced
+    async def click_element_by_index(self, index: int) -> Dict[str, Any]:
+        """Кликает по элементу по id из снимка страницы"""
         try:
             logger.info(f"🖱️ Клик по элементу #{index}")
             
-            result = self.page.evaluate("""(idx) => {
-                const selectors = 'a, button, input, textarea, select, [role="button"], [role="link"]';
-                const elements = Array.from(document.querySelectorAll(selectors));
-                
-                const visibleElements = elements.filter(el => {
-                    try {
-                        const rect = el.getBoundingClientRect();
-                        const style = window.getComputedStyle(el);
-                        return (
-                            rect.width > 10 &&
-                            rect.height > 10 &&
-                            style.display !== 'none' &&
-                            style.visibility !== 'hidden'
-                        );
-                    } catch (e) {
-                        return false;
-                    }
-                });
-                
-                if (idx >= visibleElements.length) {
-                    return {found: false};
-                }
-                
-                const element = visibleElements[idx];
-                element.click();
-                return {found: true, text: element.textContent.trim().substring(0, 50)};
-            }""", index)
+            result = await self._evaluate(CLICK_JS, index)
             
             if result.get("found"):
                 logger.info(f"✅ Кликнули по элементу #{index}: {result.get('text', '')}")
-                time.sleep(1)
+                settle_ms = await self._settle()
                 return {
                     "success": True,
+                    "settle_ms": settle_ms,
                     "message": f"Кликнули по элементу #{index}: {result.get('text', '')}"
                 }
             else:
-                error_msg = f"Элемент #{index} не найден"
-                logger.warning(f"⚠️ {error_msg}")
-                return {
-                    "success": False,
-                    "error": error_msg
-                }
+                return self._element_not_found(index, result.get("status"))
             
         except Exception as e:
             error_msg = f"Ошибка клика: {str(e)}"
@@ -166,57 +255,36 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def fill_field_by_index(self, index: int, value: str) -> Dict[str, Any]:
-        """Заполняет поле ввода по индексу"""
+    @tool(description="ввод текста в поле",
+          schema={"index": {"type": "integer", "required": True}, "value": {"type": "string", "required": True}},
+          timeout=20, state_changing=True)
+    @traced
+    async def fill_field_by_index(self, index: int, value: str) -> Dict[str, Any]:
+        """Заполняет поле ввода по id из снимка страницы"""
         try:
             logger.info(f"✍️ Заполнение поля #{index}: {value}")
             
-            result = self.page.evaluate("""([idx, val]) => {
-                const selectors = 'input, textarea, [contenteditable]';
-                const elements = Array.from(document.querySelectorAll(selectors));
-                
-                const visibleElements = elements.filter(el => {
-                    try {
-                        const rect = el.getBoundingClientRect();
-                        const style = window.getComputedStyle(el);
-                        return (
-                            rect.width > 10 &&
-                            rect.height > 10 &&
-                            style.display !== 'none' &&
-                            style.visibility !== 'hidden'
-                        );
-                    } catch (e) {
-                        return false;
-                    }
-                });
-                
-                if (idx >= visibleElements.length) {
-                    return {found: false};
-                }
-                
-                const field = visibleElements[idx];
-                field.value = val;
-                field.dispatchEvent(new Event('input', { bubbles: true }));
-                field.dispatchEvent(new Event('change', { bubbles: true }));
-                
-                return {found: true, placeholder: field.placeholder || ''};
-            }""", [index, value])
+            result = await self._evaluate(FILL_JS, [index, value])
             
-            if result.get("found"):
-                logger.info(f"✅ Заполнили поле #{index}")
-                time.sleep(0.5)
-                return {
-                    "success": True,
-                    "message": f"Заполнили поле #{index}"
-                }
-            else:
-                error_msg = f"Поле #{index} не найдено"
+            if not result.get("found"):
+                return self._element_not_found(index, result.get("status"))
+            
+            if result.get("status") == "not_fillable":
+                error_msg = f"Элемент #{index} <{result.get('tag', '?')}> не является полем ввода"
                 logger.warning(f"⚠️ {error_msg}")
                 return {
                     "success": False,
                     "error": error_msg
                 }
             
+            logger.info(f"✅ Заполнили поле #{index}")
+            settle_ms = await self._settle()
+            return {
+                "success": True,
+                "settle_ms": settle_ms,
+                "message": f"Заполнили поле #{index}"
+            }
+            
         except Exception as e:
             error_msg = f"Ошибка заполнения поля: {str(e)}"
             logger.error(f"❌ {error_msg}")
@@ -225,19 +293,24 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def scroll(self, direction: str = "down", amount: int = 500) -> Dict[str, Any]:
+    @tool(description="прокрутка страницы (down/up)",
+          schema={"direction": {"type": "string", "enum": ["up", "down"]}, "amount": {"type": "integer"}},
+          example={"direction": "down", "amount": 500}, timeout=15)
+    @traced
+    async def scroll(self, direction: str = "down", amount: int = 500) -> Dict[str, Any]:
         """Прокручивает страницу"""
         try:
             logger.info(f"⬇️ Прокрутка {direction} на {amount}px")
             
             if direction == "down":
-                self.page.evaluate(f"window.scrollBy(0, {amount})")
+                await self.page.evaluate(f"window.scrollBy(0, {amount})")
             else:
-                self.page.evaluate(f"window.scrollBy(0, -{amount})")
+                await self.page.evaluate(f"window.scrollBy(0, -{amount})")
             
-            time.sleep(0.5)
+            settle_ms = await self._settle()
             return {
                 "success": True,
+                "settle_ms": settle_ms,
                 "message": f"Прокрутили {direction} на {amount}px"
             }
             
@@ -249,16 +322,19 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def press_enter(self) -> Dict[str, Any]:
+    @tool(description="нажатие Enter (отправка формы поиска)", timeout=20, state_changing=True)
+    @traced
+    async def press_enter(self) -> Dict[str, Any]:
         """Нажимает клавишу Enter"""
         try:
             logger.info("⏎ Нажатие Enter")
             
-            self.page.keyboard.press("Enter")
-            time.sleep(1)
+            await self.page.keyboard.press("Enter")
+            settle_ms = await self._settle()
             
             return {
                 "success": True,
+                "settle_ms": settle_ms,
                 "message": "Нажали Enter"
             }
             
@@ -270,7 +346,9 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def get_current_url(self) -> Dict[str, Any]:
+    @tool(description="текущий адрес страницы", timeout=5, retry_safe=True)
+    @traced
+    async def get_current_url(self) -> Dict[str, Any]:
         """Возвращает текущий URL"""
         try:
             url = self.page.url
@@ -288,23 +366,26 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def wait_for_navigation(self) -> Dict[str, Any]:
-        """Ждёт завершения навигации"""
+    @tool(description="ожидание загрузки после действия", timeout=30, retry_safe=True)
+    @traced
+    async def wait_for_navigation(self) -> Dict[str, Any]:
+        """Ждёт завершения навигации и стабилизации страницы"""
         try:
             logger.info("⏱️ Ожидание навигации...")
-            self.page.wait_for_load_state("networkidle", timeout=10000)
-            time.sleep(0.5)
-            logger.info("✅ Навигация завершена")
+            settle = await self.settler.wait(timeout_ms=Config.WAIT_TIMEOUT)
+            if not settle["settled"]:
+                logger.warning("⚠️ Таймаут ожидания навигации")
+                return {
+                    "success": True,
+                    "settle_ms": settle["settle_ms"],
+                    "message": "Таймаут ожидания (продолжаем работу)"
+                }
+            logger.info(f"✅ Навигация завершена за {settle['settle_ms']} мс")
             return {
                 "success": True,
+                "settle_ms": settle["settle_ms"],
                 "message": "Навигация завершена"
             }
-        except PlaywrightTimeoutError:
-            logger.warning("⚠️ Таймаут ожидания навигации")
-            return {
-                "success": True,
-                "message": "Таймаут ожидания (продолжаем работу)"
-            }
         except Exception as e:
             error_msg = f"Ошибка ожидания навигации: {str(e)}"
             logger.error(f"❌ {error_msg}")
@@ -317,7 +398,10 @@ class BrowserTools:
     # НОВЫЕ МЕТОДЫ (добавлены для сложных задач)
     # ============================================================
     
-    def extract_list_items(self, max_count: int = 10) -> Dict[str, Any]:
+    @tool(description="элементы списка (письма, результаты поиска)",
+          schema={"max_count": {"type": "integer"}}, example={"max_count": 10}, timeout=20, retry_safe=True)
+    @traced
+    async def extract_list_items(self, max_count: int = 10) -> Dict[str, Any]:
         """
         Извлекает структурированный список элементов (письма, вакансии, товары)
         
@@ -328,31 +412,36 @@ class BrowserTools:
         try:
             logger.info(f"📋 Извлечение списка элементов (максимум {max_count})")
             
-            items = self.page.evaluate("""(maxCount) => {
-                // Ищем контейнеры со списками
-                const containers = Array.from(document.querySelectorAll('div, section, article, ul, ol'));
+            items = await self._evaluate("""(maxCount) => {
+                const agent = window.__browserAgent;
+                const cardSize = {minWidth: 100, minHeight: 50};
                 
-                // Фильтруем контейнеры, которые выглядят как списки
-                const listContainers = containers.filter(container => {
-                    // Считаем "дочерние карточки"
-                    const children = Array.from(container.children).filter(child => {
-                        const rect = child.getBoundingClientRect();
-                        return rect.width > 100 && rect.height > 50;
-                    });
-                    return children.length >= 2 && children.length <= 50;
-                });
+                // Ищем первый контейнер, который выглядит как список:
+                // 2–50 "дочерних карточек". Скрытые поддеревья пропускаем целиком.
+                const containers = document.querySelectorAll('div, section, article, ul, ol');
+                let container = null;
+                let items = [];
+                let hiddenRoot = null;
+                for (const candidate of containers) {
+                    if (hiddenRoot && hiddenRoot.contains(candidate)) continue;
+                    if (agent.cssState(candidate) === 'none') {
+                        hiddenRoot = candidate;
+                        continue;
+                    }
+                    const childCount = candidate.children.length;
+                    if (childCount < 2) continue;
+                    const cards = agent.filterVisible(candidate.children, {...cardSize, limit: 51});
+                    if (cards.length >= 2 && cards.length <= 50) {
+                        container = candidate;
+                        items = cards;
+                        break;
+                    }
+                }
                 
-                if (listContainers.length === 0) {
+                if (container === null) {
                     return [];
                 }
                 
-                // Берём первый подходящий контейнер
-                const container = listContainers[0];
-                const items = Array.from(container.children).filter(child => {
-                    const rect = child.getBoundingClientRect();
-                    return rect.width > 100 && rect.height > 50;
-                });
-                
                 // Извлекаем данные из каждого элемента
                 return items.slice(0, maxCount).map((item, idx) => {
                     try {
@@ -365,7 +454,7 @@ class BrowserTools:
                         );
                         
                         let texts = [];
-                        while (walker.nextNode()) {
+                        while (texts.length < 5 && walker.nextNode()) {
                             const text = walker.currentNode.textContent.trim();
                             if (text && text.length > 2 && text.length < 200) {
                                 texts.push(text);
@@ -429,14 +518,17 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def extract_table_data(self, max_rows: int = 10) -> Dict[str, Any]:
+    @tool(description="строки таблицы", schema={"max_rows": {"type": "integer"}},
+          example={"max_rows": 10}, timeout=20, retry_safe=True)
+    @traced
+    async def extract_table_data(self, max_rows: int = 10) -> Dict[str, Any]:
         """
         Извлекает данные из таблиц (например, для почты, вакансий)
         """
         try:
             logger.info(f"📊 Извлечение данных из таблицы (максимум {max_rows} строк)")
             
-            table_data = self.page.evaluate("""(maxRows) => {
+            table_data = await self.page.evaluate("""(maxRows) => {
                 // Ищем таблицы на странице
                 const tables = Array.from(document.querySelectorAll('table'));
                 
@@ -522,42 +614,22 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def extract_element_text(self, index: int) -> Dict[str, Any]:
+    @tool(description="полный текст элемента", schema={"index": {"type": "integer", "required": True}},
+          timeout=15, retry_safe=True)
+    @traced
+    async def extract_element_text(self, index: int) -> Dict[str, Any]:
         """
-        Извлекает полный текст конкретного элемента (для чтения письма, описания вакансии)
+        Извлекает полный текст элемента по id из снимка страницы вместе с его
+        карточкой (для чтения письма, описания вакансии)
         """
         try:
             logger.info(f"📖 Извлечение текста элемента #{index}")
             
-            text = self.page.evaluate("""(idx) => {
-                const selectors = 'div, article, section, p, span, li';
-                const elements = Array.from(document.querySelectorAll(selectors));
-                
-                const visibleElements = elements.filter(el => {
-                    try {
-                        const rect = el.getBoundingClientRect();
-                        const style = window.getComputedStyle(el);
-                        return (
-                            rect.width > 50 &&
-                            rect.height > 20 &&
-                            style.display !== 'none' &&
-                            style.visibility !== 'hidden'
-                        );
-                    } catch (e) {
-                        return false;
-                    }
-                });
-                
-                if (idx >= visibleElements.length) {
-                    return null;
-                }
-                
-                const element = visibleElements[idx];
-                
-                // Извлекаем весь текст внутри элемента
-                return element.textContent.trim();
-            }""", index)
+            result = await self._evaluate(ELEMENT_TEXT_JS, index)
+            if not result.get("found"):
+                return self._element_not_found(index, result.get("status"))
             
+            text = result.get("text")
             if text:
                 logger.info(f"✅ Извлечён текст ({len(text)} символов)")
                 return {
@@ -567,7 +639,7 @@ class BrowserTools:
                     "message": f"Извлечён текст элемента #{index}"
                 }
             else:
-                error_msg = f"Элемент #{index} не найден или пустой"
+                error_msg = f"Элемент #{index} не содержит текста"
                 logger.warning(f"⚠️ {error_msg}")
                 return {
                     "success": False,
@@ -582,64 +654,39 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def check_checkbox(self, index: int) -> Dict[str, Any]:
+    @tool(description="отметить чекбокс", schema={"index": {"type": "integer", "required": True}},
+          timeout=15, state_changing=True)
+    @traced
+    async def check_checkbox(self, index: int) -> Dict[str, Any]:
         """
-        Отмечает/снимает чекбокс по индексу
+        Отмечает/снимает чекбокс по id из снимка страницы
+        (id может указывать и на контейнер, внутри которого есть чекбокс)
         """
         try:
             logger.info(f"☑️ Работа с чекбоксом #{index}")
             
-            result = self.page.evaluate("""(idx) => {
-                const selectors = 'input[type="checkbox"], [role="checkbox"]';
-                const elements = Array.from(document.querySelectorAll(selectors));
-                
-                const visibleElements = elements.filter(el => {
-                    try {
-                        const rect = el.getBoundingClientRect();
-                        const style = window.getComputedStyle(el);
-                        return (
-                            rect.width > 5 &&
-                            rect.height > 5 &&
-                            style.display !== 'none' &&
-                            style.visibility !== 'hidden'
-                        );
-                    } catch (e) {
-                        return false;
-                    }
-                });
-                
-                if (idx >= visibleElements.length) {
-                    return {found: false};
-                }
-                
-                const checkbox = visibleElements[idx];
-                const currentlyChecked = checkbox.checked;
-                checkbox.click();
-                
-                return {
-                    found: true,
-                    was_checked: currentlyChecked,
-                    now_checked: !currentlyChecked
-                };
-            }""", index)
+            result = await self._evaluate(CHECKBOX_JS, index)
             
-            if result.get("found"):
-                action = "отмечен" if result.get("now_checked") else "снят"
-                logger.info(f"✅ Чекбокс #{index} {action}")
-                return {
-                    "success": True,
-                    "message": f"Чекбокс #{index} {action}",
-                    "was_checked": result.get("was_checked"),
-                    "now_checked": result.get("now_checked")
-                }
-            else:
-                error_msg = f"Чекбокс #{index} не найден"
+            if not result.get("found"):
+                return self._element_not_found(index, result.get("status"))
+            
+            if result.get("status") == "not_checkbox":
+                error_msg = f"Элемент #{index} не является чекбоксом и не содержит его"
                 logger.warning(f"⚠️ {error_msg}")
                 return {
                     "success": False,
                     "error": error_msg
                 }
             
+            action = "отмечен" if result.get("now_checked") else "снят"
+            logger.info(f"✅ Чекбокс #{index} {action}")
+            return {
+                "success": True,
+                "message": f"Чекбокс #{index} {action}",
+                "was_checked": result.get("was_checked"),
+                "now_checked": result.get("now_checked")
+            }
+            
         except Exception as e:
             error_msg = f"Ошибка работы с чекбоксом: {str(e)}"
             logger.error(f"❌ {error_msg}")
@@ -648,52 +695,34 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def hover_element(self, index: int) -> Dict[str, Any]:
+    @tool(description="навести курсор на элемент", schema={"index": {"type": "integer", "required": True}},
+          timeout=15, retry_safe=True)
+    @traced
+    async def hover_element(self, index: int) -> Dict[str, Any]:
         """
-        Наводит курсор на элемент (для раскрытия меню, тултипов)
+        Наводит курсор на элемент по id из снимка страницы (для раскрытия меню, тултипов)
         """
         try:
             logger.info(f"👆 Наведение на элемент #{index}")
             
-            element = self.page.evaluate_handle(f"""() => {{
-                const selectors = 'a, button, div, span, li, [role]';
-                const elements = Array.from(document.querySelectorAll(selectors));
-                
-                const visibleElements = elements.filter(el => {{
-                    try {{
-                        const rect = el.getBoundingClientRect();
-                        const style = window.getComputedStyle(el);
-                        return (
-                            rect.width > 10 &&
-                            rect.height > 10 &&
-                            style.display !== 'none' &&
-                            style.visibility !== 'hidden'
-                        );
-                    }} catch (e) {{
-                        return false;
-                    }}
-                }});
-                
-                return visibleElements[{index}];
-            }}""")
+            status = await self._evaluate(RESOLVE_STATUS_JS, index)
+            if status != "ok":
+                return self._element_not_found(index, status)
             
-            if element and element.as_element():
-                element_handle = element.as_element()
-                element_handle.hover(timeout=5000)
-                time.sleep(0.5)
-                
-                logger.info(f"✅ Навели на элемент #{index}")
-                return {
-                    "success": True,
-                    "message": f"Навели на элемент #{index}"
-                }
-            else:
-                error_msg = f"Элемент #{index} не найден"
-                logger.warning(f"⚠️ {error_msg}")
-                return {
-                    "success": False,
-                    "error": error_msg
-                }
+            element = await self.page.evaluate_handle(with_runtime(RESOLVE_JS), index)
+            element_handle = element.as_element()
+            if element_handle is None:
+                return self._element_not_found(index, "stale")
+            
+            await element_handle.hover(timeout=5000)
+            settle_ms = await self._settle()
+            
+            logger.info(f"✅ Навели на элемент #{index}")
+            return {
+                "success": True,
+                "settle_ms": settle_ms,
+                "message": f"Навели на элемент #{index}"
+            }
             
         except Exception as e:
             error_msg = f"Ошибка наведения: {str(e)}"
@@ -703,19 +732,24 @@ class BrowserTools:
                 "error": error_msg
             }
     
-    def wait_for_element(self, selector: str, timeout: int = 10000) -> Dict[str, Any]:
+    @tool(description="ожидание элемента по CSS-селектору (timeout в мс)",
+          schema={"selector": {"type": "string", "required": True}, "timeout": {"type": "integer"}},
+          example={"selector": "#results"}, timeout=30, retry_safe=True, timeout_arg_ms="timeout")
+    @traced
+    async def wait_for_element(self, selector: str, timeout: int = 10000) -> Dict[str, Any]:
         """
         Ждёт появления элемента на странице
         """
         try:
             logger.info(f"⏱️ Ожидание элемента: {selector}")
             
-            self.page.wait_for_selector(selector, timeout=timeout, state="visible")
-            time.sleep(0.5)
+            await self.page.wait_for_selector(selector, timeout=timeout, state="visible")
+            settle_ms = await self._settle()
             
             logger.info(f"✅ Элемент появился: {selector}")
             return {
                 "success": True,
+                "settle_ms": settle_ms,
                 "message": f"Элемент появился: {selector}"
             }
             
@@ -732,4 +766,30 @@ class BrowserTools:
             return {
                 "success": False,
                 "error": error_msg
-            }
\ No newline at end of file
+            }
+
+class BrowserTools:
+    """
+    Синхронная обёртка над AsyncBrowserTools.
+    Каждый вызов инструмента выполняется в event loop агента (EventLoopThread).
+    """
+    
+    def __init__(self, async_tools: AsyncBrowserTools, loop_thread: EventLoopThread):
+        self.async_tools = async_tools
+        self.loop_thread = loop_thread
+    
+    @property
+    def page(self) -> Page:
+        return self.async_tools.page
+    
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name == "async_tools":
+            raise AttributeError(name)
+        attr = getattr(self.async_tools, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+        
+        def sync_call(*args, **kwargs):
+            return self.loop_thread.run(attr(*args, **kwargs))
+        
+        return sync_call
@@ -7,7 +7,7 @@ class Config:
     """Конфигурация агента"""
     
     # ===== LLM ПРОВАЙДЕР (выбрать ОДИН) =====
-    # Провайдер: "claude", "openai" или "gigachat"
+    # Провайдер: "claude", "openai", "gigachat" или "replay" (локальный, без сети)
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "claude")
     
     # Claude 3.5 Sonnet (рекомендуется)
@@ -22,22 +22,111 @@ class Config:
     GIGACHAT_CREDENTIALS = os.getenv("GIGACHAT_CREDENTIALS")
     GIGACHAT_MODEL = os.getenv("GIGACHAT_MODEL", "gigachat")
     
+    # Replay: воспроизведение записанных ответов (для офлайн-прогонов и бенчмарков)
+    LLM_REPLAY_FILE = os.getenv("LLM_REPLAY_FILE")
+    LLM_REPLAY_LATENCY_MS = float(os.getenv("LLM_REPLAY_LATENCY_MS", "0"))
+    # Если задан — ответы настоящего провайдера дописываются в этот JSONL
+    LLM_RECORD_FILE = os.getenv("LLM_RECORD_FILE")
+    
+    # Общий клиент LLM (llm_client.py)
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # секунд на запрос
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # повторов при сетевых ошибках, 429 и 5xx
+    LLM_RETRY_BACKOFF = 1.0  # секунд, удваивается с каждой попыткой
+    LLM_MAX_TOKENS = 1024  # Максимум токенов ответа (Claude)
+    # Потоковые ответы: поток обрывается, как только пришёл полный {"tool": ...}
+    LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+    
+    # Дисковый кэш ответов LLM по содержимому запроса; None — выключен
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # секунд, 0 — без срока
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "200"))
+    
     # ===== БРАУЗЕР =====
     BROWSER_HEADLESS = False
     BROWSER_SLOW_MO = 500
     BROWSER_MAXIMIZE = True
     BROWSER_USER_DATA_DIR = "./browser_data"
+    BROWSER_STORAGE_STATE = "browser_data/storage_state.json"
+    CONTEXT_POOL_SIZE = 2  # Прогретых контекстов в пуле (на один общий браузер)
+    CONTEXT_POOL_RETRIES = 3  # Попыток пересоздать контекст после задачи
+    CONTEXT_POOL_ACQUIRE_TIMEOUT = 120  # секунд ожидания свободного контекста
+    
+    # Политика загрузки ресурсов (resource_policy): агенту нужен DOM, а не картинки и реклама
+    RESOURCE_POLICY_ENABLED = os.getenv("RESOURCE_POLICY", "1") == "1"
+    # По доменам открываемой страницы: "*" — общее правило, домен переопределяет его ключи.
+    # allow_urls (всегда загружать) → block_urls → block_types (типы ресурсов Playwright)
+    RESOURCE_POLICY = {
+        "*": {
+            "block_types": ["image", "media", "font"],
+            "block_urls": [
+                "*://mc.yandex.ru/*", "*://an.yandex.ru/*", "*://yandex.ru/ads/*",
+                "*://*.google-analytics.com/*", "*://*.googletagmanager.com/*", "*://*.doubleclick.net/*",
+                "*://top-fwz1.mail.ru/*", "*://counter.yadro.ru/*", "*://vk.com/rtrg*"
+            ],
+            "allow_urls": []
+        },
+        # Капчу нужно видеть, иначе её не пройти
+        "yandex.ru": {"allow_urls": ["*captcha*"]}
+    }
+    RESOURCE_POLICY_PATH = os.getenv("RESOURCE_POLICY_PATH", "")  # JSON с правилами поверх RESOURCE_POLICY
     
     # ===== АГЕНТ =====
     MAX_STEPS = 30  # Максимум шагов на задачу
-    CONTEXT_MAX_TOKENS = 8000
+    CONTEXT_MAX_TOKENS = 8000  # Бюджет истории диалога (оценка: ~3 символа на токен)
+    HISTORY_KEEP_RECENT = 6  # Последних сообщений, которые никогда не сжимаются
     PAGE_TEXT_LIMIT = 2000  # Символов текста со страницы
     PAGE_ELEMENTS_LIMIT = 50  # Элементов на странице
+    SNAPSHOT_INCREMENTAL = True  # Снимки в пределах документа — в виде diff
+    SNAPSHOT_AFTER_ACTION = True  # Снимок прикладывается к результату navigate/click/fill/press_enter
+    SNAPSHOT_PREFETCH = True  # Упреждающий снимок, пока модель думает
+    
+    # Каталог для трасс прогонов (JSONL + Chrome Trace); None — не сохранять
+    TRACE_DIR = os.getenv("AGENT_TRACE_DIR")
+    # Запись сетевого трафика задач в HAR (каталог; рядом кладётся трасса задачи)
+    HAR_RECORD_DIR = os.getenv("AGENT_HAR_RECORD_DIR")
+    # Воспроизведение из HAR без сети: промах по архиву — сразу ошибка запроса
+    HAR_REPLAY_PATH = os.getenv("AGENT_HAR_REPLAY")
+    
+    # ===== СУБ-АГЕНТ =====
+    SUBAGENT_CHUNK_TOKENS = 3000  # Бюджет промпта одного чанка (шаблон + тексты)
+    SUBAGENT_CHUNK_MAX_ITEMS = 25  # Элементов в чанке не больше
+    SUBAGENT_MAX_WORKERS = 4  # Параллельных запросов к модели
+    SUBAGENT_CHUNK_RETRIES = 1  # Повторов для неудачных чанков
+    # Кэш вердиктов по отдельным элементам (хэш текста); пустая строка — выключен
+    SUBAGENT_CACHE_PATH = os.getenv("SUBAGENT_CACHE_PATH", "browser_data/verdicts.sqlite")
+    SUBAGENT_CACHE_TTL = 30 * 24 * 3600  # секунд
+    SUBAGENT_CACHE_TEXT_CHARS = 2000  # Текст при вердикте (для обучения spam_filter); 0 — не хранить
+    # Локальный предклассификатор спама: уверенные письма решаются без LLM
+    SPAM_FILTER_ENABLED = os.getenv("SPAM_FILTER_ENABLED", "1") == "1"
+    SPAM_FILTER_PATH = "browser_data/spam_filter.npz"
+    SPAM_FILTER_MIN_SAMPLES = 30  # Писем каждого класса до включения (и в зоне порога)
+    SPAM_FILTER_TARGET_ACCURACY = 0.98  # Минимальная точность локальных решений
+    SPAM_FILTER_AUDIT_RATE = 0.05  # Доля локальных решений, которые всё равно проверяет LLM
+    # Предварительный отбор вакансий (BM25 по профилю) перед analyze_job_relevance
+    JOB_RANKER_TOP_K = int(os.getenv("JOB_RANKER_TOP_K", "30"))  # Вакансий к LLM; 0 — без ограничения
+    JOB_RANKER_MIN_SCORE = 0.0  # Нижняя граница нормированной оценки (0..1)
     
     # ===== ИНСТРУМЕНТЫ =====
-    TOOL_TIMEOUT = 30  # секунд
+    TOOL_BATCHING = os.getenv("TOOL_BATCHING", "0") == "1"  # Пакет {"tools": [...]} в одном ответе модели
+    TOOL_BATCH_MAX = 5  # Максимум действий в пакете
+    
+    # Макросы: успешные последовательности действий воспроизводятся без LLM
+    MACROS_ENABLED = os.getenv("MACROS_ENABLED", "0") == "1"
+    MACRO_STORE_PATH = "browser_data/macros.json"
+    MACRO_MAX_STEPS = 8
+    MACRO_MIN_LITERAL_SHARE = 0.4  # Доля текста задачи, совпавшая с шаблоном буквально (не плейсхолдерами)
+    TOOL_TIMEOUT = 30  # секунд; жёсткий срок инструмента, если в @tool не задан свой
+    TOOL_TIMEOUT_RETRIES = 1  # Повторов после таймаута для инструментов с retry_safe
+    TOOL_WATCHDOG = os.getenv("TOOL_WATCHDOG", "1") == "1"  # Прерывать зависшие скрипты страницы по таймауту (CDP)
     WAIT_TIMEOUT = 10000  # мс для ожидания элементов
     
+    # ===== СТАБИЛИЗАЦИЯ СТРАНИЦЫ =====
+    SETTLE_TIMEOUT_MS = 5000  # Верхняя граница ожидания после действия
+    SETTLE_QUIET_MS = 300  # Окно тишины DOM и навигации
+    SETTLE_POLL_MS = 50  # Интервал опроса сетевой активности
+    SETTLE_LONG_REQUEST_MS = 2000  # Более долгие запросы (long-polling) не ждём
+    
     @classmethod
     def validate(cls):
         """Проверка обязательных настроек"""
@@ -50,5 +139,8 @@ class Config:
         elif cls.LLM_PROVIDER == "gigachat":
             if not cls.GIGACHAT_CREDENTIALS:
                 raise ValueError("❌ GIGACHAT_CREDENTIALS не найден в .env файле!")
+        elif cls.LLM_PROVIDER == "replay":
+            if not cls.LLM_REPLAY_FILE or not os.path.exists(cls.LLM_REPLAY_FILE):
+                raise ValueError("❌ LLM_REPLAY_FILE не задан или файл не найден!")
         
         print(f"✅ Используется {cls.LLM_PROVIDER.upper()}")
\ No newline at end of file
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Set, AsyncIterator
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright, Route, Request
+
+from config import Config
+from resource_policy import ResourcePolicy
+
+logger = logging.getLogger(__name__)
+
+class BrowserContextPool:
+    """
+    Пул заранее прогретых контекстов браузера.
+
+    Все контексты живут в ОДНОМ общем Chromium, storage_state читается с диска
+    один раз. Каждая задача получает чистый контекст (cookies/localStorage
+    только из storage_state), после задачи контекст уничтожается, а на его место
+    в фоне создаётся новый — запуск браузера и создание контекста не попадают
+    на критический путь задачи.
+    
+    На каждый контекст ставится политика ресурсов (resource_policy): картинки,
+    шрифты, видео, аналитика и реклама не загружаются; счётчики общие для пула.
+    
+    Для записи и воспроизведения HAR lease() создаёт отдельный контекст:
+    запись включается только при создании контекста, а воспроизводящий
+    контекст не должен попасть обратно в общий пул.
+    
+    Если замену создать не удалось (Config.CONTEXT_POOL_RETRIES попыток),
+    место считается потерянным: следующий lease() при пустой очереди создаёт
+    контекст сам, поэтому пул не «усыхает». Ожидание свободного контекста
+    ограничено Config.CONTEXT_POOL_ACQUIRE_TIMEOUT.
+    """
+
+    def __init__(self, size: int = None, storage_path: str = None,
+                 resource_policy: Optional[ResourcePolicy] = None):
+        self.size = max(1, size if size is not None else Config.CONTEXT_POOL_SIZE)
+        self.storage_path = storage_path or Config.BROWSER_STORAGE_STATE
+        if resource_policy is None and Config.RESOURCE_POLICY_ENABLED:
+            resource_policy = ResourcePolicy()
+        self.resource_policy = resource_policy
+
+        self.playwright: Optional[Playwright] = None
+        self.browser: Optional[Browser] = None
+        self._storage_state: Optional[Dict[str, Any]] = None
+        self._idle: "asyncio.Queue[BrowserContext]" = asyncio.Queue()
+        self._replenish_tasks: Set[asyncio.Task] = set()
+        self._lost = 0  # Мест пула, замену для которых создать не удалось
+        self._closed = False
+
+        self.stats = {
+            "contexts_created": 0,
+            "leases": 0,
+            "in_use": 0,
+            "har_misses": 0,
+            "replenish_failures": 0
+        }
+
+    @property
+    def started(self) -> bool:
+        return self.browser is not None
+
+    async def start(self) -> "BrowserContextPool":
+        """Запускает общий браузер и прогревает size контекстов"""
+        if self.started:
+            return self
+
+        self._storage_state = self._load_storage_state()
+
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(
+            headless=Config.BROWSER_HEADLESS,
+            slow_mo=Config.BROWSER_SLOW_MO,
+            args=["--start-maximized"] if Config.BROWSER_MAXIMIZE else []
+        )
+
+        contexts = await asyncio.gather(*[self._new_context() for _ in range(self.size)])
+        for context in contexts:
+            self._idle.put_nowait(context)
+
+        logger.info(f"✅ Пул контекстов готов: {self.size} шт.")
+        return self
+
+    def _load_storage_state(self) -> Optional[Dict[str, Any]]:
+        """Однократно читает сохранённую сессию (cookies, localStorage)"""
+        os.makedirs(os.path.dirname(self.storage_path) or ".", exist_ok=True)
+        if not os.path.exists(self.storage_path):
+            return None
+        try:
+            with open(self.storage_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ Не удалось прочитать {self.storage_path}: {e}")
+            return None
+
+    async def _new_context(self, record_har_path: Optional[str] = None,
+                           replay_har_path: Optional[str] = None) -> BrowserContext:
+        options: Dict[str, Any] = {}
+        if record_har_path:
+            # embed — ответы внутри одного .har, его можно сразу воспроизводить
+            options.update(record_har_path=record_har_path, record_har_content="embed")
+        context = await self.browser.new_context(
+            storage_state=self._storage_state,
+            viewport={"width": 1920, "height": 1080},
+            locale="ru-RU",
+            **options
+        )
+        if replay_har_path:
+            # Обработчики route, добавленные позже, срабатывают раньше:
+            # политика ресурсов → архив → промах (быстрый отказ вместо похода в сеть)
+            await context.route("**/*", self._har_miss)
+            await context.route_from_har(replay_har_path, not_found="fallback")
+        if self.resource_policy is not None:
+            await self.resource_policy.install(context)
+        await context.new_page()
+        self.stats["contexts_created"] += 1
+        return context
+
+    async def _har_miss(self, route: Route, request: Request):
+        """Запроса нет в архиве: сеть в режиме воспроизведения не используется"""
+        self.stats["har_misses"] += 1
+        logger.warning(f"📼 Нет в HAR: {request.method} {request.url}")
+        await route.abort("internetdisconnected")
+
+    async def _replenish(self):
+        context = None
+        for attempt in range(Config.CONTEXT_POOL_RETRIES):
+            try:
+                context = await self._new_context()
+                break
+            except Exception as e:
+                self.stats["replenish_failures"] += 1
+                logger.warning(f"⚠️ Не удалось создать контекст для пула (попытка {attempt + 1}): {e}")
+                if self._closed:
+                    return
+                if attempt + 1 < Config.CONTEXT_POOL_RETRIES:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        if context is None:
+            logger.error("❌ Контекст для пула не создан — его создаст следующая задача")
+            self._lost += 1
+            return
+        if self._closed:
+            await context.close()
+        else:
+            self._idle.put_nowait(context)
+
+    @asynccontextmanager
+    async def lease(self, record_har_path: Optional[str] = None,
+                    replay_har_path: Optional[str] = None) -> AsyncIterator[Page]:
+        """
+        Выдаёт страницу в чистом контексте на время одной задачи.
+        Если все контексты заняты — ждёт освобождения.
+        
+        record_har_path — записать трафик задачи в этот HAR (файл пишется при
+        закрытии контекста); replay_har_path — отдавать все ответы из HAR,
+        запросы, которых в нём нет, сразу завершаются ошибкой.
+        """
+        if not self.started:
+            await self.start()
+
+        if record_har_path or replay_har_path:
+            if record_har_path:
+                os.makedirs(os.path.dirname(record_har_path) or ".", exist_ok=True)
+            context = await self._new_context(record_har_path, replay_har_path)
+            self.stats["leases"] += 1
+            self.stats["in_use"] += 1
+            try:
+                yield context.pages[0]
+            finally:
+                self.stats["in_use"] -= 1
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось закрыть контекст HAR: {e}")
+            return
+
+        context = await self._acquire()
+        self.stats["leases"] += 1
+        self.stats["in_use"] += 1
+        try:
+            page = context.pages[0] if context.pages else await context.new_page()
+            yield page
+        finally:
+            self.stats["in_use"] -= 1
+            await self._release(context)
+
+    async def _acquire(self) -> BrowserContext:
+        """Свободный контекст из очереди; вместо потерянного места — новый контекст"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.CONTEXT_POOL_ACQUIRE_TIMEOUT
+        while True:
+            if self._idle.empty() and self._lost:
+                self._lost -= 1
+                try:
+                    return await self._new_context()
+                except Exception:
+                    self._lost += 1
+                    raise
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Нет свободного контекста браузера за "
+                                   f"{Config.CONTEXT_POOL_ACQUIRE_TIMEOUT} с (в работе: {self.stats['in_use']})")
+            try:
+                # Короткими интервалами: место может потеряться, пока мы ждём
+                return await asyncio.wait_for(self._idle.get(), min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                continue
+
+    async def _release(self, context: BrowserContext):
+        """Сбрасывает контекст: уничтожает его и прогревает замену в фоне"""
+        try:
+            await context.close()
+        except Exception:
+            pass
+        if self._closed:
+            return
+        task = asyncio.create_task(self._replenish())
+        self._replenish_tasks.add(task)
+        task.add_done_callback(self._replenish_tasks.discard)
+
+    async def close(self):
+        """Закрывает все контексты, браузер и playwright"""
+        self._closed = True
+        if self._replenish_tasks:
+            await asyncio.gather(*self._replenish_tasks, return_exceptions=True)
+        while not self._idle.empty():
+            try:
+                await self._idle.get_nowait().close()
+            except Exception:
+                pass
+        try:
+            if self.browser:
+                await self.browser.close()
+        except Exception:
+            pass
+        try:
+            if self.playwright:
+                await self.playwright.stop()
+        except Exception:
+            pass
+        self.browser = None
+        self.playwright = None
@@ -0,0 +1,217 @@
+import logging
+import re
+from typing import List, Dict, Any, Optional
+
+from config import Config
+from utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_TOOL_RE = re.compile(r'"tool"\s*:\s*"([^"]+)"')
+_URL_RE = re.compile(r"^URL: (\S+)", re.MULTILINE)
+
+
+class HistoryEntry:
+    """Сообщение истории с типом и оценкой токенов"""
+
+    def __init__(self, role: str, content: str, kind: str, pinned: bool = False, meta: Optional[Dict[str, Any]] = None):
+        self.role = role
+        self.content = content
+        self.kind = kind
+        self.pinned = pinned
+        self.meta = meta or {}
+        self.tokens = estimate_tokens(content)
+
+    def replace_content(self, content: str):
+        self.content = content
+        self.tokens = estimate_tokens(content)
+
+
+class ConversationHistory:
+    """
+    История диалога агента с бюджетом токенов (Config.CONTEXT_MAX_TOKENS).
+
+    Системный промпт и задача закреплены. Перед каждым запросом к модели
+    compact():
+    1. сворачивает устаревшие снимки страницы (всё до последнего полного снимка)
+       в однострочные сводки — последний полный снимок и diff'ы после него
+       остаются целиком, иначе модель не сможет сопоставить индексы;
+    2. если бюджет всё ещё превышен — вытесняет самые старые ходы, заменяя их
+       одной сводкой (какие инструменты вызывались, последний URL), но не трогает
+       последние Config.HISTORY_KEEP_RECENT сообщений, а также последний полный
+       снимок с вызвавшим его ходом и всё после него (база для diff'ов);
+    3. если и этого мало (одностраничное приложение: полный снимок давно, дальше
+       только diff'ы) — сворачивает объёмные результаты инструментов вне
+       последних сообщений (текст элемента, списки, ответ суб-агента) и
+       выставляет rebase_requested: следующий снимок агент берёт полным, после
+       чего старая база и её diff'ы сворачиваются и вытесняются обычным путём.
+    """
+
+    # Результаты инструментов короче этого (токенов) не сворачиваются
+    COLLAPSE_MIN_TOKENS = 60
+
+    def __init__(self, max_tokens: int = None, keep_recent: int = None):
+        self.max_tokens = max_tokens if max_tokens is not None else Config.CONTEXT_MAX_TOKENS
+        self.keep_recent = keep_recent if keep_recent is not None else Config.HISTORY_KEEP_RECENT
+        self.entries: List[HistoryEntry] = []
+        self.tokens_saved_total = 0
+        self.rebase_requested = False
+
+    def reset(self, system_prompt: str, task: str):
+        self.entries = [
+            HistoryEntry("system", system_prompt, "system", pinned=True),
+            HistoryEntry("user", f"ЗАДАЧА: {task}", "task", pinned=True)
+        ]
+        self.tokens_saved_total = 0
+        self.rebase_requested = False
+
+    def add(self, role: str, content: str, kind: str = "message", meta: Optional[Dict[str, Any]] = None):
+        """
+        kind: "assistant", "tool_result", "snapshot" (meta: mode, title, url,
+        element_count), "correction", "system_note" или "message"
+        """
+        self.entries.append(HistoryEntry(role, content, kind, meta=meta))
+        if kind == "snapshot" and (meta or {}).get("mode") != "diff":
+            self.rebase_requested = False
+
+    def messages(self) -> List[Dict[str, str]]:
+        return [{"role": e.role, "content": e.content} for e in self.entries]
+
+    def total_tokens(self) -> int:
+        return sum(e.tokens for e in self.entries)
+
+    def compact(self) -> int:
+        """Сжимает историю и возвращает число сэкономленных токенов"""
+        before = self.total_tokens()
+        self._collapse_stale_snapshots()
+        if self.total_tokens() > self.max_tokens:
+            self._evict_old_turns()
+        if self.total_tokens() > self.max_tokens:
+            self._collapse_bulky_results()
+        if self.total_tokens() > self.max_tokens and self._has_diffs_after_baseline():
+            self.rebase_requested = True
+        saved = before - self.total_tokens()
+        self.tokens_saved_total += saved
+        return saved
+
+    def _last_full_snapshot(self) -> Optional[int]:
+        last_full = None
+        for i, entry in enumerate(self.entries):
+            if entry.kind == "snapshot" and entry.meta.get("mode") != "diff":
+                last_full = i
+        return last_full
+
+    def _has_diffs_after_baseline(self) -> bool:
+        last_full = self._last_full_snapshot()
+        return last_full is not None and any(
+            e.kind == "snapshot" and e.meta.get("mode") == "diff" for e in self.entries[last_full + 1:])
+
+    def _collapse_stale_snapshots(self):
+        last_full = self._last_full_snapshot()
+        if last_full is None:
+            return
+
+        for entry in self.entries[:last_full]:
+            if entry.kind != "snapshot" or entry.meta.get("collapsed"):
+                continue
+            meta = entry.meta
+            status = "✅ " if "✅" in entry.content else ""
+            if meta.get("mode") == "diff":
+                summary = f"Результат действия: {status}[устаревшие изменения страницы свёрнуты]"
+            else:
+                summary = (f"Результат действия: {status}[устаревший снимок свёрнут] "
+                           f"{meta.get('title', '')} ({meta.get('url', '')}), "
+                           f"элементов: {meta.get('element_count', 0)}")
+            entry.replace_content(summary)
+            meta["collapsed"] = True
+
+    def _collapse_bulky_results(self):
+        """Объёмные результаты инструментов (не снимки) вне последних сообщений — в одну строку"""
+        for entry in self.entries[:max(0, len(self.entries) - self.keep_recent)]:
+            if (entry.pinned or entry.kind != "tool_result" or entry.meta.get("collapsed")
+                    or entry.tokens < self.COLLAPSE_MIN_TOKENS):
+                continue
+            status = "✅ " if "✅" in entry.content else "❌ " if "❌" in entry.content else ""
+            summary = f"Результат действия: {status}[свёрнут, {len(entry.content)} символов]"
+            if entry.meta.get("url"):
+                summary += f" URL: {entry.meta['url']}"
+            entry.replace_content(summary)
+            entry.meta["collapsed"] = True
+
+    def _evict_old_turns(self):
+        first = next((i for i, e in enumerate(self.entries) if not e.pinned), len(self.entries))
+        # Предыдущая сводка вытесненных ходов сливается с новой
+        previous_summary = None
+        if first < len(self.entries) and self.entries[first].kind == "evicted_summary":
+            previous_summary = self.entries.pop(first)
+
+        protected_from = max(first, len(self.entries) - self.keep_recent)
+        # Последний полный снимок — база для diff'ов после него: без него
+        # модель видит изменения списка, которого у неё уже нет
+        baseline = self._last_full_snapshot()
+        if baseline is not None:
+            if baseline > first and self.entries[baseline - 1].role == "assistant":
+                baseline -= 1
+            protected_from = min(protected_from, max(first, baseline))
+        evicted: List[HistoryEntry] = []
+        while first < protected_from and self.total_tokens() > self.max_tokens:
+            evicted.append(self.entries.pop(first))
+            protected_from -= 1
+            # Результат инструмента вытесняется вместе с вызвавшим его ответом
+            if (evicted[-1].role == "assistant" and first < protected_from
+                    and self.entries[first].role == "user"):
+                evicted.append(self.entries.pop(first))
+                protected_from -= 1
+
+        if not evicted:
+            # Вытеснять нечего — прежняя сводка возвращается на место без изменений
+            if previous_summary is not None:
+                self.entries.insert(first, previous_summary)
+            return
+        newly_evicted = len(evicted)
+        if previous_summary is not None:
+            evicted.insert(0, previous_summary)
+        text, meta = self._summarize(evicted)
+        summary = HistoryEntry("user", text, "evicted_summary", meta=meta)
+        self.entries.insert(first, summary)
+        logger.info(f"🗜️ Из истории вытеснено сообщений: {newly_evicted} (всего {summary.meta['count']})")
+
+    @staticmethod
+    def _evicted_count(evicted: List[HistoryEntry]) -> int:
+        return sum(e.meta.get("count", 0) if e.kind == "evicted_summary" else 1 for e in evicted)
+
+    def _summarize(self, evicted: List[HistoryEntry]):
+        """Текст сводки и агрегаты, которые продолжит следующая сводка"""
+        tools: List[str] = []
+        ok = failed = 0
+        last_url = ""
+        for entry in evicted:
+            if entry.kind == "evicted_summary":
+                tools.extend(entry.meta.get("tools", []))
+                ok += entry.meta.get("ok", 0)
+                failed += entry.meta.get("failed", 0)
+                last_url = entry.meta.get("last_url", last_url)
+                continue
+            if entry.role == "assistant":
+                tools.extend(_TOOL_RE.findall(entry.content))
+            elif entry.content.startswith("Результат действия"):
+                if "✅" in entry.content:
+                    ok += 1
+                elif "❌" in entry.content:
+                    failed += 1
+                url = _URL_RE.search(entry.content)
+                if url:
+                    last_url = url.group(1)
+                elif entry.meta.get("url"):
+                    last_url = entry.meta["url"]
+
+        chain = " → ".join(tools[-12:])
+        if len(tools) > 12:
+            chain = "… → " + chain
+        count = self._evicted_count(evicted)
+        text = (f"СИСТЕМА: ранние шаги свёрнуты ({count} сообщений). "
+                f"Вызванные инструменты: {chain or 'нет'}. Успешно: {ok}, с ошибкой: {failed}.")
+        if last_url:
+            text += f" Последний известный URL: {last_url}"
+        meta = {"count": count, "tools": tools, "ok": ok, "failed": failed, "last_url": last_url}
+        return text, meta
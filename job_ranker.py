@@ -0,0 +1,98 @@
+import re
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from config import Config
+
+_WORD_RE = re.compile(r"\w+")
+
+# Обрезка слова до префикса — грубый стемминг: «разработчик»/«разработка»,
+# «python»/«python3» дают один термин без морфологического словаря
+STEM_CHARS = 6
+
+
+def tokenize(text: str) -> List[str]:
+    return [word[:STEM_CHARS] for word in _WORD_RE.findall(str(text).lower()) if len(word) > 1]
+
+
+class JobRanker:
+    """
+    Предварительное ранжирование вакансий по профилю кандидата (BM25, NumPy).
+    Все вакансии оцениваются одной матричной операцией: матрица весов BM25
+    «вакансия × термин» умножается на вектор терминов профиля. Оценки
+    нормируются на лучшую (0..1), поэтому порог не зависит от длины профиля.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, documents: List[str], query: str) -> np.ndarray:
+        """Нормированные оценки BM25 документов по запросу (в порядке документов)"""
+        if not documents:
+            return np.zeros(0, dtype=np.float32)
+        docs_tokens = [tokenize(doc) for doc in documents]
+        query_tokens = tokenize(query)
+
+        # Словарь — только термины профиля: остальные на оценку не влияют
+        vocabulary: Dict[str, int] = {}
+        for token in query_tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+        if not vocabulary:
+            return np.zeros(len(documents), dtype=np.float32)
+        query_vector = np.zeros(len(vocabulary), dtype=np.float32)
+        np.add.at(query_vector, [vocabulary[token] for token in query_tokens], 1.0)
+
+        tf = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+        rows, cols = [], []
+        for row, tokens in enumerate(docs_tokens):
+            for token in tokens:
+                col = vocabulary.get(token)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+        np.add.at(tf, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), 1.0)
+
+        lengths = np.array([len(tokens) for tokens in docs_tokens], dtype=np.float32)
+        avg_length = max(float(lengths.mean()), 1.0)
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((len(documents) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+        weights = tf * (self.k1 + 1.0) / (tf + norm[:, None]) * idf
+
+        scores = weights @ query_vector
+        best = float(scores.max())
+        return scores / best if best > 0 else scores
+
+    def select(
+        self,
+        documents: List[str],
+        query: str,
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Индексы вакансий для LLM (top_k лучших с оценкой не ниже min_score,
+        по умолчанию из Config) и оценки всех вакансий. Если профиль не дал
+        ни одного совпавшего термина (пустой, только короткие слова), ранжировать
+        нечем: выбираются все вакансии, ranked=False.
+        """
+        top_k = Config.JOB_RANKER_TOP_K if top_k is None else top_k
+        min_score = Config.JOB_RANKER_MIN_SCORE if min_score is None else min_score
+        scores = self.score(documents, query)
+        if not scores.any():
+            return {
+                "selected": list(range(len(documents))),
+                "scores": [0.0] * len(documents),
+                "ranked": False
+            }
+        order = np.argsort(-scores, kind="stable")
+        if top_k:
+            order = order[:top_k]
+        selected = sorted(int(idx) for idx in order if scores[idx] >= min_score)
+        return {
+            "selected": selected,
+            "scores": [round(float(score), 4) for score in scores],
+            "ranked": True
+        }
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def provider_model(provider: str) -> str:
+    """Имя модели провайдера — часть ключа, чтобы смена модели не давала старых ответов"""
+    return {
+        "claude": Config.CLAUDE_MODEL,
+        "openai": Config.OPENAI_MODEL,
+        "gigachat": Config.GIGACHAT_MODEL
+    }.get(provider, provider)
+
+
+def cache_key(provider: str, model: str, messages: List[Dict[str, str]], **params) -> str:
+    """
+    Адрес ответа по содержимому запроса: провайдер, модель, все сообщения
+    (системный промпт, задача, результаты инструментов) и параметры вызова.
+    """
+    payload = json.dumps(
+        {"provider": provider, "model": model, "messages": messages, "params": params},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Дисковый кэш ответов LLM (SQLite, один файл).
+
+    Повторный прогон задачи с тем же префиксом диалога и повторный разбор
+    неизменившегося профиля отвечаются из кэша без обращения к модели.
+    Вытеснение: записи старше ttl_seconds удаляются, при превышении
+    max_entries или max_bytes удаляются давно не читавшиеся (LRU).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.LLM_CACHE_TTL
+        self.max_entries = max_entries if max_entries is not None else Config.LLM_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else Config.LLM_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+        self._db.commit()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0
+        }
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.stats["evictions"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now)
+            )
+            self.stats["writes"] += 1
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now: float):
+        removed = 0
+        if self.ttl_seconds:
+            removed += self._db.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if (self.max_entries and count > self.max_entries) or (self.max_bytes and total > self.max_bytes):
+            # Самые давно читавшиеся записи — до тех пор, пока не уложимся в лимиты
+            for key, size in self._db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+            ).fetchall():
+                if not ((self.max_entries and count > self.max_entries) or (self.max_bytes and total > self.max_bytes)):
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                count -= 1
+                total -= size
+                removed += 1
+        self.stats["evictions"] += removed
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def info(self) -> Dict[str, Any]:
+        """Статистика попаданий и текущий размер кэша"""
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": count,
+            "bytes": total
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_shared_cache: Optional[LLMResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Общий для всех агентов процесса кэш; None, если Config.LLM_CACHE_PATH не задан"""
+    global _shared_cache
+    if not Config.LLM_CACHE_PATH:
+        return None
+    with _shared_lock:
+        if _shared_cache is None or _shared_cache.path != Config.LLM_CACHE_PATH:
+            _shared_cache = LLMResponseCache(Config.LLM_CACHE_PATH)
+            logger.info(f"💾 Кэш ответов LLM: {Config.LLM_CACHE_PATH}")
+        return _shared_cache
@@ -0,0 +1,353 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+from config import Config
+from llm_cache import LLMResponseCache, get_llm_cache, cache_key, provider_model
+from tracing import span
+from utils import ToolCallStreamParser
+
+logger = logging.getLogger(__name__)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Сетевые ошибки, таймауты, 429 и 5xx повторяем; прочие 4xx — нет"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 429:
+        return False
+    return not isinstance(error, (ValueError, TypeError, KeyError))
+
+
+def _merge_same_role(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Claude требует чередования ролей — подряд идущие сообщения одной роли склеиваются"""
+    merged: List[Dict[str, str]] = []
+    for message in messages:
+        if merged and merged[-1]["role"] == message["role"]:
+            merged[-1] = {"role": message["role"], "content": merged[-1]["content"] + "\n\n" + message["content"]}
+        else:
+            merged.append(dict(message))
+    return merged
+
+
+class LLMClient:
+    """
+    Единый слой доступа к LLM для BrowserAgent и SubAgent.
+
+    Клиенты SDK (Claude, OpenAI, GigaChat) создаются лениво и переиспользуют
+    HTTP-соединения (keep-alive), поэтому повторные запросы не платят за
+    установку TLS. Синхронный клиент один на процесс; асинхронный — один на
+    event loop: пул соединений httpx привязан к циклу, в котором создан, а у
+    каждого BrowserAgent (EventLoopThread) и каждого asyncio.run свой цикл. Здесь же — таймаут, повторы с экспоненциальной
+    задержкой, дисковый кэш ответов (llm_cache) и счётчики вызовов.
+
+    complete() — синхронный вызов (SubAgent, потоки), acomplete() — асинхронный
+    (цикл AsyncBrowserAgent). Сообщения — список {"role": ..., "content": ...}.
+    """
+
+    def __init__(
+        self,
+        provider: Optional[str] = None,
+        client: Any = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        cache: Optional[LLMResponseCache] = None
+    ):
+        self.provider = provider or Config.LLM_PROVIDER
+        self.model = provider_model(self.provider)
+        self.timeout = timeout if timeout is not None else Config.LLM_TIMEOUT
+        self.max_retries = max_retries if max_retries is not None else Config.LLM_MAX_RETRIES
+        if self.provider == "replay":
+            # Записанные ответы детерминированы — повтор ничего не изменит
+            self.max_retries = 0
+        self.cache = cache if cache is not None else get_llm_cache()
+
+        # Готовый GigaChat-совместимый клиент (chat/achat), например ScriptedLLM
+        self._client = client
+        # Клиент, не привязанный к циклу (готовый или replay), — общий для всех циклов
+        self._shared_async_client = client
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "retries": 0,
+            "errors": 0,
+            "latency_ms_total": 0.0,
+            "streams": 0,
+            "streams_cut": 0  # Поток прерван сразу после вызова инструмента
+        }
+
+    @classmethod
+    def from_client(cls, client: Any, provider: str = "scripted") -> "LLMClient":
+        """Обёртка над готовым GigaChat-совместимым клиентом; повторы выключены"""
+        return cls(provider=provider, client=client, max_retries=0)
+
+    # ----- Клиенты провайдеров (создаются лениво: синхронный — один, асинхронные — по циклу) -----
+
+    def _sync_client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                self._client = self._create_client(is_async=False)
+            return self._client
+
+    def _get_async_client(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._shared_async_client is not None:
+                return self._shared_async_client
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._create_client(is_async=True)
+                if self._shared_async_client is not None:
+                    return self._shared_async_client
+                # Запись удаляется вместе с циклом; соединения закрытого цикла не переиспользуются
+                self._async_clients[loop] = client
+            return client
+
+    def _create_client(self, is_async: bool) -> Any:
+        if self.provider == "claude":
+            from anthropic import Anthropic, AsyncAnthropic
+            cls = AsyncAnthropic if is_async else Anthropic
+            return cls(api_key=Config.CLAUDE_API_KEY, timeout=self.timeout, max_retries=0)
+
+        if self.provider == "openai":
+            from openai import OpenAI, AsyncOpenAI
+            cls = AsyncOpenAI if is_async else OpenAI
+            return cls(api_key=Config.OPENAI_API_KEY, timeout=self.timeout, max_retries=0)
+
+        if self.provider == "replay":
+            from replay_llm import ScriptedLLM
+            client = ScriptedLLM.from_file(Config.LLM_REPLAY_FILE, latency_ms=Config.LLM_REPLAY_LATENCY_MS)
+            # Одна последовательность ответов на оба режима вызова и все циклы
+            self._client = self._shared_async_client = client
+            return client
+
+        from gigachat import GigaChat
+        # Объект GigaChat обслуживает и chat, и achat, но его асинхронный
+        # HTTP-клиент тоже привязан к циклу — поэтому отдельный объект на цикл
+        client = GigaChat(
+            credentials=Config.GIGACHAT_CREDENTIALS,
+            model=Config.GIGACHAT_MODEL,
+            verify_ssl_certs=False,
+            timeout=self.timeout
+        )
+        if Config.LLM_RECORD_FILE:
+            from replay_llm import RecordingLLM
+            client = RecordingLLM(client, Config.LLM_RECORD_FILE)
+        return client
+
+    # ----- Запрос к провайдеру -----
+
+    def _request_kwargs(self, messages: List[Dict[str, str]], json_mode: bool) -> Dict[str, Any]:
+        if self.provider == "claude":
+            system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+            kwargs = {
+                "model": self.model,
+                "max_tokens": Config.LLM_MAX_TOKENS,
+                "messages": _merge_same_role([m for m in messages if m["role"] != "system"])
+            }
+            if system:
+                kwargs["system"] = system
+            return kwargs
+        if self.provider == "openai":
+            kwargs = {"model": self.model, "messages": messages}
+            if json_mode:
+                kwargs["response_format"] = {"type": "json_object"}
+            return kwargs
+        return {"messages": messages}
+
+    def _reply_text(self, response: Any) -> str:
+        if self.provider == "claude":
+            return response.content[0].text
+        return response.choices[0].message.content or ""
+
+    def _call_sync(self, messages: List[Dict[str, str]], json_mode: bool) -> str:
+        client = self._sync_client()
+        kwargs = self._request_kwargs(messages, json_mode)
+        if self.provider == "claude":
+            return self._reply_text(client.messages.create(**kwargs))
+        if self.provider == "openai":
+            return self._reply_text(client.chat.completions.create(**kwargs))
+        return self._reply_text(client.chat(kwargs))
+
+    async def _call_async(self, messages: List[Dict[str, str]], json_mode: bool) -> str:
+        client = self._get_async_client()
+        kwargs = self._request_kwargs(messages, json_mode)
+        if self.provider == "claude":
+            request = client.messages.create(**kwargs)
+        elif self.provider == "openai":
+            request = client.chat.completions.create(**kwargs)
+        else:
+            request = client.achat(kwargs)
+        return self._reply_text(await asyncio.wait_for(request, self.timeout))
+
+    async def astream(self, messages: List[Dict[str, str]], json_mode: bool = False) -> AsyncIterator[str]:
+        """
+        Текст ответа по мере генерации. Если генератор закрыть раньше
+        (aclose), HTTP-поток провайдера закрывается и генерация прекращается.
+        Клиент без потокового API отдаёт ответ одним фрагментом.
+        """
+        client = self._get_async_client()
+        kwargs = self._request_kwargs(messages, json_mode)
+
+        if self.provider == "claude":
+            async with client.messages.stream(**kwargs) as stream:
+                async for text in stream.text_stream:
+                    yield text
+            return
+
+        if self.provider == "openai":
+            stream = await client.chat.completions.create(**kwargs, stream=True)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+            return
+
+        if not hasattr(client, "astream"):
+            yield self._reply_text(await client.achat(kwargs))
+            return
+        chunks = client.astream(kwargs)
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await chunks.aclose()
+
+    async def _stream_until_tool_call(self, messages: List[Dict[str, str]], json_mode: bool) -> Dict[str, Any]:
+        """Читает поток, пока не закроется первый JSON-вызов инструмента"""
+        parser = ToolCallStreamParser()
+        started = time.perf_counter()
+        first_chunk_ms = None
+        stream = self.astream(messages, json_mode)
+        try:
+            async for chunk in stream:
+                if first_chunk_ms is None:
+                    first_chunk_ms = round((time.perf_counter() - started) * 1000, 1)
+                if parser.feed(chunk):
+                    break
+        finally:
+            await stream.aclose()
+        return {"reply": parser.result(), "cut": parser.done, "first_chunk_ms": first_chunk_ms}
+
+    def _backoff(self, attempt: int) -> float:
+        return min(Config.LLM_RETRY_BACKOFF * (2 ** attempt), 30) * random.uniform(0.5, 1.0)
+
+    def _cache_lookup(self, messages: List[Dict[str, str]], json_mode: bool, use_cache: bool):
+        if self.cache is None or not use_cache:
+            return None, None
+        key = cache_key(self.provider, self.model, messages, json_mode=json_mode)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._lock:
+                self.stats["cache_hits"] += 1
+        return key, cached
+
+    def _record(self, started: float, error: bool = False):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["latency_ms_total"] += (time.perf_counter() - started) * 1000
+            if error:
+                self.stats["errors"] += 1
+
+    def complete(self, messages: List[Dict[str, str]], json_mode: bool = False, use_cache: bool = True) -> str:
+        """Синхронный запрос: кэш → провайдер с повторами"""
+        key, cached = self._cache_lookup(messages, json_mode, use_cache)
+        if cached is not None:
+            return cached
+
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                reply = self._call_sync(messages, json_mode)
+                self._record(started)
+                break
+            except Exception as e:
+                self._record(started, error=True)
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                with self._lock:
+                    self.stats["retries"] += 1
+                logger.warning(f"⚠️ Ошибка LLM ({e}), повтор через {delay:.1f} с")
+                time.sleep(delay)
+
+        if key is not None and reply:
+            self.cache.put(key, reply)
+        return reply
+
+    async def acomplete(
+        self,
+        messages: List[Dict[str, str]],
+        json_mode: bool = False,
+        use_cache: bool = True,
+        stop_at_tool_call: bool = False
+    ) -> str:
+        """
+        Асинхронный запрос: кэш → провайдер с повторами и таймаутом.
+        stop_at_tool_call — потоковый режим: как только в ответе закрылся первый
+        {"tool": ...}, поток прерывается и возвращается текст до конца вызова
+        (хвостовые пояснения модели не ждём и не оплачиваем).
+        """
+        with span("llm.request", provider=self.provider, streaming=stop_at_tool_call) as request_span:
+            key, cached = self._cache_lookup(messages, json_mode, use_cache)
+            if cached is not None:
+                request_span.set(cache_hit=True)
+                return cached
+
+            for attempt in range(self.max_retries + 1):
+                started = time.perf_counter()
+                try:
+                    if stop_at_tool_call:
+                        streamed = await asyncio.wait_for(
+                            self._stream_until_tool_call(messages, json_mode), self.timeout
+                        )
+                        reply = streamed["reply"]
+                        with self._lock:
+                            self.stats["streams"] += 1
+                            self.stats["streams_cut"] += int(streamed["cut"])
+                        request_span.set(cut_early=streamed["cut"], first_chunk_ms=streamed["first_chunk_ms"])
+                    else:
+                        reply = await self._call_async(messages, json_mode)
+                    self._record(started)
+                    break
+                except Exception as e:
+                    self._record(started, error=True)
+                    if attempt >= self.max_retries or not _is_retryable(e):
+                        raise
+                    delay = self._backoff(attempt)
+                    with self._lock:
+                        self.stats["retries"] += 1
+                    logger.warning(f"⚠️ Ошибка LLM ({e}), повтор через {delay:.1f} с")
+                    await asyncio.sleep(delay)
+
+            request_span.set(cache_hit=False, attempts=attempt + 1)
+            if key is not None and reply:
+                self.cache.put(key, reply)
+            return reply
+
+
+_shared_client: Optional[LLMClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Общий клиент процесса для провайдера из Config (создаётся при первом обращении)"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None or _shared_client.provider != Config.LLM_PROVIDER:
+            Config.validate()
+            _shared_client = LLMClient()
+            logger.info(f"✅ Инициализирован провайдер: {Config.LLM_PROVIDER.upper()}")
+        return _shared_client
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+from config import Config
+from utils import url_key
+
+logger = logging.getLogger(__name__)
+
+# Действия, которые попадают в макрос (чтение страницы макросу не нужно)
+MACRO_TOOLS = {
+    "navigate", "click_element_by_index", "fill_field_by_index", "press_enter",
+    "check_checkbox", "scroll", "wait_for_navigation"
+}
+
+# Признаки элемента, по которым он находится заново при воспроизведении
+SIGNATURE_FIELDS = ("type", "inputType", "placeholder", "text")
+
+_PLACEHOLDER_RE = re.compile(r"\{\d+\}")
+# Домены, упомянутые в тексте задачи: hh.ru, mail.yandex.ru, https://example.com/...
+_DOMAIN_RE = re.compile(r"\b((?:[a-zа-яё0-9-]+\.)+(?:[a-z]{2,}|рф))\b", re.IGNORECASE)
+
+
+def normalize_task(task: str) -> str:
+    return " ".join(task.split()).strip(" .!?")
+
+
+def _template(text: str, values: List[str]) -> str:
+    """Подставляет плейсхолдеры {0}, {1}... вместо значений из текста задачи"""
+    for position, value in enumerate(values):
+        text = re.sub(re.escape(value), "{%d}" % position, text, flags=re.IGNORECASE)
+    return text
+
+
+def _render(text: str, values: List[str]) -> str:
+    for position, value in enumerate(values):
+        text = text.replace("{%d}" % position, value)
+    return text
+
+
+def task_pattern(task: str, values: List[str]) -> str:
+    return _template(normalize_task(task), values).lower()
+
+
+def literal_share(pattern: str, task: str) -> float:
+    """Доля текста задачи, которую шаблон задаёт буквально, а не плейсхолдерами"""
+    literal = len(_PLACEHOLDER_RE.sub("", pattern).strip())
+    return literal / max(len(normalize_task(task)), 1)
+
+
+def task_domains(task: str) -> List[str]:
+    """Домены, явно названные в задаче (без www.)"""
+    return [domain.lower().removeprefix("www.") for domain in _DOMAIN_RE.findall(task)]
+
+
+def domain_fits(domain: str, task: str) -> bool:
+    """Если задача называет сайты, макрос должен быть записан на одном из них (или поддомене)"""
+    mentioned = task_domains(task)
+    if not mentioned:
+        return True
+    domain = domain.lower().removeprefix("www.")
+    return any(domain == m or domain.endswith("." + m) or m.endswith("." + domain) for m in mentioned)
+
+
+def match_task(pattern: str, task: str) -> Optional[List[str]]:
+    """
+    Значения плейсхолдеров, если задача подходит под шаблон, иначе None.
+    Шаблон, у которого плейсхолдеры покрывают большую часть задачи
+    (меньше Config.MACRO_MIN_LITERAL_SHARE буквального текста), не подходит:
+    иначе «найди {0}» совпал бы с любой задачей, начинающейся с «найди».
+    """
+    if literal_share(pattern, task) < Config.MACRO_MIN_LITERAL_SHARE:
+        return None
+    parts = re.split(r"\{(\d+)\}", pattern)
+    regex = ""
+    order = []
+    for position, part in enumerate(parts):
+        if position % 2:
+            regex += "(.+?)"
+            order.append(int(part))
+        else:
+            regex += re.escape(part)
+    match = re.fullmatch(regex, normalize_task(task), flags=re.IGNORECASE)
+    if not match:
+        return None
+    values = [""] * (max(order) + 1 if order else 0)
+    for group, slot in enumerate(order):
+        values[slot] = match.group(group + 1)
+    return values
+
+
+def render_args(args: Dict[str, Any], values: List[str]) -> Dict[str, Any]:
+    return {k: _render(v, values) if isinstance(v, str) else v for k, v in args.items()}
+
+
+def find_element(elements: List[Dict[str, Any]], signature: Dict[str, str], values: List[str]) -> Optional[Dict[str, Any]]:
+    """Первый элемент снимка с теми же признаками, что у записанного"""
+    expected = {field: _render(signature.get(field, ""), values).strip().lower() for field in SIGNATURE_FIELDS}
+    for el in elements:
+        if all(str(el.get(field, "")).strip().lower() == expected[field] for field in SIGNATURE_FIELDS):
+            return el
+    return None
+
+
+class MacroRecorder:
+    """
+    Собирает успешные действия одного прогона think_and_act.
+    Для действий по index запоминается не id (он одноразовый), а признаки
+    элемента из последнего снимка, в котором он встречался.
+    """
+
+    def __init__(self, task: str):
+        self.task = task
+        self.steps: List[Dict[str, Any]] = []
+        self._elements: Dict[int, Dict[str, Any]] = {}
+
+    def observe_snapshot(self, snapshot: Dict[str, Any]):
+        # id в реестре не переиспользуются, поэтому достаточно дополнять словарь
+        for key in ("elements", "added", "changed"):
+            for el in snapshot.get(key, []):
+                if isinstance(el, dict) and "index" in el:
+                    self._elements[el["index"]] = el
+
+    def add(self, tool_name: str, args: Dict[str, Any], result: Dict[str, Any], url: str = ""):
+        if tool_name == "batch":
+            for step in result.get("steps", []):
+                if step.get("success"):
+                    # Адрес после каждого шага пакета, а не после всего пакета
+                    self._add_step(step["tool"], step.get("args", {}), step.get("url", url))
+        elif result.get("success"):
+            self._add_step(tool_name, args, url)
+
+        if tool_name == "extract_page_snapshot" and result.get("success"):
+            self.observe_snapshot(result)
+        if "snapshot" in result:
+            self.observe_snapshot(result["snapshot"])
+
+    def _add_step(self, tool_name: str, args: Dict[str, Any], url: str):
+        if tool_name not in MACRO_TOOLS:
+            return
+        step = {"tool": tool_name, "args": dict(args), "element": None, "url_after": url_key(url) if url else ""}
+        if "index" in args:
+            el = self._elements.get(args.get("index"))
+            if el is None:
+                return
+            step["element"] = {field: str(el.get(field, "")) for field in SIGNATURE_FIELDS}
+            step["args"].pop("index")
+        self.steps.append(step)
+
+
+class MacroStore:
+    """
+    Макросы по сайтам: успешные последовательности действий, ключ — домен
+    первого перехода и шаблон задачи. Значения, которые модель вводила в поля
+    и которые встречаются в тексте задачи, заменяются плейсхолдерами, поэтому
+    «Найди вакансии python на hh.ru» и «Найди вакансии golang на hh.ru»
+    воспроизводят один и тот же макрос. Слишком общие шаблоны («найди {0}»)
+    не сохраняются и не сопоставляются, а задача, называющая другой сайт,
+    не получает макрос чужого домена. Включается MACROS_ENABLED=1.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Config.MACRO_STORE_PATH
+        self._lock = threading.Lock()
+        self.macros: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.macros = json.load(f).get("macros", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Не удалось загрузить макросы из {self.path}: {e}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"macros": self.macros}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def find(self, task: str) -> Optional[Tuple[Dict[str, Any], List[str]]]:
+        """Самый надёжный макрос, под шаблон и сайт которого подходит задача"""
+        best = None
+        with self._lock:
+            for macro in self.macros.values():
+                if not domain_fits(macro.get("domain", ""), task):
+                    continue
+                values = match_task(macro["pattern"], task)
+                if values is None:
+                    continue
+                score = macro.get("successes", 0) - macro.get("diverged", 0)
+                if best is None or score > best[0]:
+                    best = (score, macro, values)
+        return (best[1], best[2]) if best else None
+
+    def record(self, recorder: MacroRecorder) -> Optional[Dict[str, Any]]:
+        """Сохраняет последовательность успешно завершённой задачи"""
+        steps = recorder.steps[:Config.MACRO_MAX_STEPS]
+        if len(steps) < 2 or steps[0]["tool"] != "navigate":
+            return None
+
+        task_text = normalize_task(recorder.task)
+        values = []
+        for step in steps:
+            value = step["args"].get("value")
+            if (step["tool"] == "fill_field_by_index" and isinstance(value, str) and value
+                    and value.lower() in task_text.lower() and value not in values):
+                values.append(value)
+        # Сначала длинные значения, чтобы короткие не разрезали их при шаблонизации
+        values.sort(key=len, reverse=True)
+
+        templated = []
+        for step in steps:
+            templated.append({
+                "tool": step["tool"],
+                "args": {k: _template(v, values) if isinstance(v, str) else v for k, v in step["args"].items()},
+                "element": ({k: _template(v, values) for k, v in step["element"].items()}
+                            if step["element"] else None),
+                "url_after": step["url_after"]
+            })
+
+        domain = urlparse(str(steps[0]["args"].get("url", ""))).netloc.lower()
+        pattern = task_pattern(recorder.task, values)
+        if literal_share(pattern, recorder.task) < Config.MACRO_MIN_LITERAL_SHARE:
+            logger.info(f"📼 Макрос не сохранён: шаблон «{pattern}» почти целиком из плейсхолдеров")
+            return None
+        key = f"{domain}|{pattern}"
+        with self._lock:
+            previous = self.macros.get(key, {})
+            macro = {
+                "key": key,
+                "domain": domain,
+                "pattern": pattern,
+                "steps": templated,
+                "successes": previous.get("successes", 0) + 1,
+                "replays": previous.get("replays", 0),
+                "diverged": previous.get("diverged", 0),
+                "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            }
+            self.macros[key] = macro
+            self._save()
+        logger.info(f"📼 Макрос сохранён: {key} ({len(templated)} шагов)")
+        return macro
+
+    def mark_replay(self, key: str, diverged: bool):
+        with self._lock:
+            macro = self.macros.get(key)
+            if macro is None:
+                return
+            macro["replays"] = macro.get("replays", 0) + 1
+            if diverged:
+                macro["diverged"] = macro.get("diverged", 0) + 1
+                # Макрос, который расходится со страницей чаще, чем помогает, удаляется
+                if macro["diverged"] >= 3 and macro["diverged"] > macro.get("successes", 0):
+                    del self.macros[key]
+                    logger.info(f"🗑️ Макрос удалён как ненадёжный: {key}")
+            self._save()
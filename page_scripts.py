@@ -0,0 +1,363 @@
+"""
+JavaScript, исполняемый на странице инструментами BrowserTools.
+
+AGENT_RUNTIME_JS идемпотентно устанавливает window.__browserAgent — общий
+in-page runtime: реестр элементов со стабильными id, который разделяют снимок
+страницы и все действия по индексу, MutationObserver, по которому снимок
+считает инкрементальный diff вместо полного обхода документа, и движок
+видимости, общий для всех скриптов извлечения.
+"""
+
+AGENT_RUNTIME_JS = """
+if (!window.__browserAgent) {
+    window.__browserAgent = (() => {
+        const byId = new Map();      // id -> WeakRef(element)
+        const ids = new WeakMap();   // element -> id
+
+        const agent = {
+            INTERACTIVE_SELECTOR: 'a, button, input, textarea, select, ' +
+                '[role="button"], [role="link"], [role="checkbox"], [contenteditable="true"]',
+            nextId: 0,
+
+            // id не должны повторяться между документами одной вкладки:
+            // Python передаёт следующий свободный id при каждом снимке
+            ensureNextId(startId) {
+                if (typeof startId === 'number' && startId > this.nextId) {
+                    this.nextId = startId;
+                }
+            },
+
+            register(el) {
+                let id = ids.get(el);
+                if (id === undefined) {
+                    id = this.nextId++;
+                    ids.set(el, id);
+                    byId.set(id, new WeakRef(el));
+                }
+                return id;
+            },
+
+            // O(1) поиск по id. status: ok | unknown | stale
+            resolve(id) {
+                const ref = byId.get(id);
+                if (!ref) return {status: 'unknown', el: null};
+                const el = ref.deref();
+                if (!el || !el.isConnected) return {status: 'stale', el: null};
+                return {status: 'ok', el};
+            },
+
+            // ----- Отслеживание изменений для инкрементальных снимков -----
+            observer: null,
+            dirtyRoots: new Set(),
+            lastSnapshot: null,   // Map id -> JSON описания элемента
+            lastViewport: '',
+            lastUrl: '',
+            lastTruncated: false,
+            mutationSeq: 0,       // Растёт с каждой записью MutationObserver
+            pending: null,        // Упреждающий снимок, ещё не показанный модели
+
+            record(records) {
+                for (const record of records) {
+                    const node = record.target.nodeType === 1
+                        ? record.target
+                        : record.target.parentElement;
+                    if (node) this.dirtyRoots.add(node);
+                }
+                this.mutationSeq += records.length;
+            },
+
+            observe() {
+                if (this.observer) return;
+                this.observer = new MutationObserver(records => this.record(records));
+                this.observer.observe(document.documentElement || document, {
+                    subtree: true,
+                    childList: true,
+                    attributes: true,
+                    characterData: true
+                });
+            },
+
+            // Забирает изменённые поддеревья, отбрасывая вложенные в другие.
+            // consume=false — только посмотреть (для упреждающего снимка)
+            takeDirtyRoots(consume = true) {
+                const roots = this.dirtyRoots;
+                if (consume) this.dirtyRoots = new Set();
+                const result = [];
+                for (const root of roots) {
+                    if (!root.isConnected) continue;
+                    let parent = root.parentElement;
+                    let nested = false;
+                    while (parent) {
+                        if (roots.has(parent)) { nested = true; break; }
+                        parent = parent.parentElement;
+                    }
+                    if (!nested) result.push(root);
+                }
+                return result;
+            },
+
+            // ----- Движок видимости -----
+            // Проверки только читают DOM (никаких записей между ними), поэтому
+            // layout пересчитывается не более одного раза на вызов скрипта.
+            // CSS-видимость проверяется нативным checkVisibility() без создания
+            // CSSStyleDeclaration, геометрия читается только у CSS-видимых
+            // элементов, а поддеревья с display:none пропускаются целиком.
+
+            // 'rendered' | 'invisible' (visibility:hidden, потомки могут быть видимы)
+            // | 'contents' (display:contents: своего бокса нет, потомки отрисовываются)
+            // | 'none' (не отрисовывается вместе со всем поддеревом)
+            cssState(el) {
+                if (el.checkVisibility) {
+                    if (!el.checkVisibility()) {
+                        // checkVisibility() ложен и для display:contents — стиль читаем только здесь
+                        return window.getComputedStyle(el).display === 'contents' ? 'contents' : 'none';
+                    }
+                    return el.checkVisibility({visibilityProperty: true}) ? 'rendered' : 'invisible';
+                }
+                const style = window.getComputedStyle(el);
+                if (style.display === 'none') return 'none';
+                if (style.display === 'contents') return 'contents';
+                return style.visibility === 'hidden' ? 'invisible' : 'rendered';
+            },
+
+            // Отбирает видимых кандидатов в порядке документа.
+            // options: minWidth, minHeight, inViewport, limit
+            filterVisible(candidates, options) {
+                const {minWidth = 0, minHeight = 0, inViewport = false, limit = Infinity} = options || {};
+                const viewportHeight = window.innerHeight;
+                const visible = [];
+                let hiddenRoot = null;
+
+                for (const el of candidates) {
+                    if (visible.length >= limit) break;
+                    // Потомок уже скрытого поддерева — проверки не нужны
+                    if (hiddenRoot && hiddenRoot.contains(el)) continue;
+                    try {
+                        const state = this.cssState(el);
+                        if (state === 'none') { hiddenRoot = el; continue; }
+                        if (state === 'invisible' || state === 'contents') continue;
+
+                        const rect = el.getBoundingClientRect();
+                        if (rect.width <= minWidth || rect.height <= minHeight) continue;
+                        if (inViewport && (rect.top < 0 || rect.bottom > viewportHeight)) continue;
+                        visible.push(el);
+                    } catch (e) {
+                        // Пропускаем элементы, которые вызывают ошибки
+                    }
+                }
+                return visible;
+            },
+
+            isVisible(el, options) {
+                return this.filterVisible([el], options).length === 1;
+            },
+
+            viewportKey() {
+                return [window.scrollX, window.scrollY, window.innerWidth, window.innerHeight].join(',');
+            },
+
+            describe(el, id) {
+                const type = el.tagName.toLowerCase();
+                return {
+                    index: id,
+                    type: type,
+                    inputType: el.type || '',
+                    text: (el.textContent || '').trim().substring(0, 100),
+                    tagName: type,
+                    href: el.href || '',
+                    placeholder: el.placeholder || '',
+                    value: el.value || ''
+                };
+            }
+        };
+        return agent;
+    })();
+}
+"""
+
+# Снимок: регистрирует видимые в viewport интерактивные элементы.
+# В инкрементальном режиме (есть предыдущий снимок того же документа, viewport
+# не сдвигался) перепроверяются только элементы прошлого снимка и кандидаты
+# внутри изменившихся поддеревьев, а наружу уходит diff: added/removed/changed.
+# speculative=true: снимок считается, но не фиксируется как «последний
+# показанный» — он сохраняется в agent.pending до COMMIT_SNAPSHOT_JS.
+SNAPSHOT_JS = """({startId, limit, incremental, speculative}) => {
+    const agent = window.__browserAgent;
+    agent.ensureNextId(startId);
+    agent.observe();
+
+    const visibility = {minWidth: 10, minHeight: 10, inViewport: true};
+    const fullScan = () => agent.filterVisible(
+        document.querySelectorAll(agent.INTERACTIVE_SELECTOR),
+        {...visibility, limit}
+    );
+
+    const viewport = agent.viewportKey();
+    const url = window.location.href;
+    const canDiff = incremental && agent.lastSnapshot !== null &&
+        agent.lastViewport === viewport && agent.lastUrl === url;
+
+    let current = null;
+    const roots = agent.takeDirtyRoots(!speculative);
+    if (canDiff && !roots.some(r => r === document.documentElement || r === document.body)) {
+        const candidates = new Set();
+        for (const id of agent.lastSnapshot.keys()) {
+            const {status, el} = agent.resolve(id);
+            if (status === 'ok') candidates.add(el);
+        }
+        for (const root of roots) {
+            if (root.matches(agent.INTERACTIVE_SELECTOR)) candidates.add(root);
+            for (const el of root.querySelectorAll(agent.INTERACTIVE_SELECTOR)) candidates.add(el);
+        }
+        const ordered = Array.from(candidates)
+            .sort((a, b) => a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1);
+        current = agent.filterVisible(ordered, {...visibility, limit});
+        // Освободилось место в усечённом списке — его мог занять элемент вне
+        // изменённых поддеревьев, поэтому пересобираем полностью
+        if (agent.lastTruncated && current.length < limit) current = null;
+    }
+    if (current === null) current = fullScan();
+    const mode = canDiff ? 'diff' : 'full';
+
+    const snapshot = new Map();
+    const elements = current.map(el => {
+        const id = agent.register(el);
+        const described = agent.describe(el, id);
+        snapshot.set(id, JSON.stringify(described));
+        return described;
+    });
+
+    const result = {
+        mode,
+        title: document.title,
+        url,
+        elements: [],
+        added: [],
+        removed: [],
+        changed: [],
+        element_count: elements.length,
+        nextId: agent.nextId
+    };
+
+    if (mode === 'full') {
+        result.elements = elements;
+    } else {
+        for (const described of elements) {
+            const previous = agent.lastSnapshot.get(described.index);
+            if (previous === undefined) result.added.push(described);
+            else if (previous !== snapshot.get(described.index)) result.changed.push(described);
+        }
+        for (const id of agent.lastSnapshot.keys()) {
+            if (!snapshot.has(id)) result.removed.push(id);
+        }
+    }
+
+    const state = {snapshot, viewport, url, truncated: elements.length >= limit};
+    if (speculative) {
+        agent.pending = {...state, result, seq: agent.mutationSeq};
+        return result;
+    }
+    agent.pending = null;
+    agent.lastSnapshot = snapshot;
+    agent.lastViewport = viewport;
+    agent.lastUrl = url;
+    agent.lastTruncated = state.truncated;
+    return result;
+}"""
+
+# Фиксирует упреждающий снимок, если с момента его расчёта страница не
+# менялась (ни одной мутации, тот же URL и viewport). Иначе возвращает null.
+COMMIT_SNAPSHOT_JS = """() => {
+    const agent = window.__browserAgent;
+    const pending = agent.pending;
+    agent.pending = null;
+    if (!pending || !agent.observer) return null;
+    agent.record(agent.observer.takeRecords());
+    if (pending.seq !== agent.mutationSeq || pending.url !== window.location.href ||
+        pending.viewport !== agent.viewportKey()) {
+        return null;
+    }
+    agent.dirtyRoots = new Set();
+    agent.lastSnapshot = pending.snapshot;
+    agent.lastViewport = pending.viewport;
+    agent.lastUrl = pending.url;
+    agent.lastTruncated = pending.truncated;
+    return pending.result;
+}"""
+
+CLICK_JS = """(id) => {
+    const {status, el} = window.__browserAgent.resolve(id);
+    if (status !== 'ok') return {found: false, status};
+    el.click();
+    return {found: true, status, text: (el.textContent || '').trim().substring(0, 50)};
+}"""
+
+FILL_JS = """([id, val]) => {
+    const {status, el} = window.__browserAgent.resolve(id);
+    if (status !== 'ok') return {found: false, status};
+
+    const tag = el.tagName.toLowerCase();
+    if (el.isContentEditable) {
+        el.focus();
+        el.textContent = val;
+    } else if (tag === 'input' || tag === 'textarea' || tag === 'select') {
+        el.focus();
+        el.value = val;
+    } else {
+        return {found: true, status: 'not_fillable', tag};
+    }
+    el.dispatchEvent(new Event('input', { bubbles: true }));
+    el.dispatchEvent(new Event('change', { bubbles: true }));
+
+    return {found: true, status, placeholder: el.placeholder || ''};
+}"""
+
+CHECKBOX_JS = """(id) => {
+    const {status, el} = window.__browserAgent.resolve(id);
+    if (status !== 'ok') return {found: false, status};
+
+    const selector = 'input[type="checkbox"], [role="checkbox"]';
+    const checkbox = el.matches(selector) ? el : el.querySelector(selector);
+    if (!checkbox) return {found: true, status: 'not_checkbox'};
+
+    const isChecked = () => checkbox.type === 'checkbox'
+        ? checkbox.checked
+        : checkbox.getAttribute('aria-checked') === 'true';
+    const wasChecked = isChecked();
+    checkbox.click();
+
+    return {
+        found: true,
+        status,
+        was_checked: wasChecked,
+        now_checked: !wasChecked
+    };
+}"""
+
+# Полный текст элемента по id из снимка. Снимок содержит интерактивные
+# элементы (ссылка на письмо, кнопка вакансии), поэтому текст берётся из
+# карточки, в которой элемент лежит: ближайший article/li/tr (или роли), а
+# если такой нет и у самого элемента текста мало — из его родителя.
+ELEMENT_TEXT_JS = """(id) => {
+    const {status, el} = window.__browserAgent.resolve(id);
+    if (status !== 'ok') return {found: false, status};
+
+    let block = el.closest('article, li, tr, [role="article"], [role="listitem"], [role="row"]');
+    if (!block) {
+        block = el;
+        const parent = el.parentElement;
+        if ((el.textContent || '').trim().length < 200 && parent && parent !== document.body) {
+            block = parent;
+        }
+    }
+    return {found: true, status, text: (block.innerText || block.textContent || '').trim()};
+}"""
+
+RESOLVE_JS = """(id) => window.__browserAgent.resolve(id).el"""
+
+RESOLVE_STATUS_JS = """(id) => window.__browserAgent.resolve(id).status"""
+
+
+def with_runtime(script: str) -> str:
+    """Оборачивает функцию-скрипт так, чтобы перед ней был установлен runtime"""
+    return f"(arg) => {{\n{AGENT_RUNTIME_JS}\nreturn ({script})(arg);\n}}"
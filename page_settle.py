@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any
+from playwright.async_api import Page, Request, Frame, Error as PlaywrightError
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Ждёт, пока в DOM не будет мутаций quietMs подряд (но не дольше maxMs).
+# Возвращает false, если документ ещё грузится или окно тишины так и не наступило.
+DOM_QUIET_JS = """({quietMs, maxMs}) => new Promise(resolve => {
+    if (document.readyState === 'loading') {
+        resolve(false);
+        return;
+    }
+    let quietTimer = null;
+    let hardTimer = null;
+    let observer = null;
+    const done = (value) => {
+        if (observer) observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(hardTimer);
+        resolve(value);
+    };
+    observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => done(true), quietMs);
+    });
+    observer.observe(document, {
+        subtree: true,
+        childList: true,
+        attributes: true,
+        characterData: true
+    });
+    quietTimer = setTimeout(() => done(true), quietMs);
+    hardTimer = setTimeout(() => done(false), maxMs);
+})"""
+
+
+class PageSettler:
+    """
+    Адаптивное ожидание стабилизации страницы вместо фиксированных sleep.
+
+    Страница считается стабильной, когда одновременно:
+    - нет незавершённых сетевых запросов (кроме долгих — long-polling, стримы);
+    - с последней навигации главного фрейма прошло не меньше окна тишины;
+    - в DOM не было мутаций в течение окна тишины.
+    Ожидание ограничено сверху Config.SETTLE_TIMEOUT_MS.
+    """
+
+    def __init__(self, page: Page):
+        self.page = page
+        self._pending: Dict[Request, float] = {}
+        self._last_navigation = 0.0
+
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_request_done)
+        page.on("requestfailed", self._on_request_done)
+        page.on("framenavigated", self._on_frame_navigated)
+
+    def _on_request(self, request: Request):
+        self._pending[request] = time.monotonic()
+
+    def _on_request_done(self, request: Request):
+        self._pending.pop(request, None)
+
+    def _on_frame_navigated(self, frame: Frame):
+        if frame == self.page.main_frame:
+            self._last_navigation = time.monotonic()
+
+    def _network_busy(self) -> bool:
+        """Есть ли «короткие» незавершённые запросы"""
+        now = time.monotonic()
+        long_request = Config.SETTLE_LONG_REQUEST_MS / 1000
+        return any(now - started < long_request for started in self._pending.values())
+
+    async def wait(self, timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Ждёт стабилизации страницы.
+
+        Returns:
+            {"settled": bool, "settle_ms": int} — стабилизировалась ли страница
+            до истечения лимита и сколько миллисекунд заняло ожидание
+        """
+        if timeout_ms is None:
+            timeout_ms = Config.SETTLE_TIMEOUT_MS
+        quiet_ms = Config.SETTLE_QUIET_MS
+        poll = Config.SETTLE_POLL_MS / 1000
+
+        start = time.monotonic()
+        deadline = start + timeout_ms / 1000
+        settled = False
+
+        while True:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                break
+
+            since_navigation_ms = (time.monotonic() - self._last_navigation) * 1000
+            if self._network_busy() or since_navigation_ms < quiet_ms:
+                await asyncio.sleep(poll)
+                continue
+
+            try:
+                dom_quiet = await self.page.evaluate(
+                    DOM_QUIET_JS, {"quietMs": quiet_ms, "maxMs": remaining_ms}
+                )
+            except PlaywrightError:
+                # Контекст выполнения уничтожен навигацией — ждём новый документ
+                await asyncio.sleep(poll)
+                continue
+
+            # За время ожидания DOM могла начаться навигация или новые запросы
+            since_navigation_ms = (time.monotonic() - self._last_navigation) * 1000
+            if dom_quiet and not self._network_busy() and since_navigation_ms >= quiet_ms:
+                settled = True
+                break
+            if not dom_quiet:
+                await asyncio.sleep(poll)
+
+        settle_ms = int((time.monotonic() - start) * 1000)
+        if not settled:
+            logger.warning(f"⚠️ Страница не стабилизировалась за {timeout_ms} мс")
+        return {"settled": settled, "settle_ms": settle_ms}
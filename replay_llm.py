@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Политика: по истории диалога возвращает следующий ответ ассистента
+Policy = Callable[[List[Dict[str, str]]], str]
+
+
+class _Message:
+    def __init__(self, content: str):
+        self.role = "assistant"
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content: str):
+        self.message = _Message(content)
+        self.finish_reason = "stop"
+
+
+class _Delta:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _ChunkChoice:
+    def __init__(self, content: str):
+        self.delta = _Delta(content)
+
+
+class _Chunk:
+    """Минимальный аналог gigachat.models.ChatCompletionChunk"""
+
+    def __init__(self, content: str):
+        self.choices = [_ChunkChoice(content)]
+
+
+class _Completion:
+    """Минимальный аналог gigachat.models.ChatCompletion"""
+
+    def __init__(self, content: str):
+        self.choices = [_Choice(content)]
+
+
+def messages_as_dicts(payload: Any) -> List[Dict[str, str]]:
+    """Приводит Chat / dict / список сообщений к [{"role": ..., "content": ...}]"""
+    if isinstance(payload, dict):
+        messages = payload.get("messages", [])
+    elif hasattr(payload, "messages"):
+        messages = payload.messages
+    else:
+        messages = payload or []
+
+    result = []
+    for message in messages:
+        if isinstance(message, dict):
+            role, content = message.get("role", ""), message.get("content", "")
+        else:
+            role, content = getattr(message, "role", ""), getattr(message, "content", "")
+        role = getattr(role, "value", role)
+        result.append({"role": str(role), "content": content or ""})
+    return result
+
+
+class ScriptedLLM:
+    """
+    Локальный детерминированный LLM-провайдер (совместим с клиентом GigaChat:
+    chat/achat возвращают объект с choices[0].message.content).
+
+    Ответы берутся либо из записанной последовательности (replies), либо из
+    политики policy(messages). Искусственная задержка latency_ms ± jitter_ms
+    (с фиксированным seed) позволяет отделить собственные накладные расходы
+    агента от времени ответа модели.
+    """
+
+    def __init__(
+        self,
+        replies: Optional[List[str]] = None,
+        policy: Optional[Policy] = None,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        seed: int = 0,
+        chunk_chars: int = 16
+    ):
+        if replies is None and policy is None:
+            raise ValueError("Нужно задать replies или policy")
+        self.replies = list(replies) if replies is not None else None
+        self.policy = policy
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_chars = max(1, chunk_chars)
+        self._rng = random.Random(seed)
+        self._position = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "calls": 0,
+            "chunks": 0,
+            "latency_ms_total": 0.0
+        }
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ScriptedLLM":
+        """Загружает ответы, записанные RecordingLLM (JSONL с полем reply)"""
+        replies = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    replies.append(json.loads(line)["reply"])
+        logger.info(f"✅ Загружено {len(replies)} записанных ответов из {path}")
+        return cls(replies=replies, **kwargs)
+
+    def _next_reply(self, payload: Any) -> str:
+        with self._lock:
+            self.stats["calls"] += 1
+            if self.policy is not None:
+                return self.policy(messages_as_dicts(payload))
+            if self._position >= len(self.replies):
+                raise RuntimeError(f"Записанные ответы закончились ({len(self.replies)} шт.)")
+            reply = self.replies[self._position]
+            self._position += 1
+            return reply
+
+    def _delay(self) -> float:
+        with self._lock:
+            delay_ms = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+            self.stats["latency_ms_total"] += delay_ms
+        return delay_ms / 1000
+
+    def chat(self, payload: Any) -> _Completion:
+        time.sleep(self._delay())
+        return _Completion(self._next_reply(payload))
+
+    async def achat(self, payload: Any) -> _Completion:
+        await asyncio.sleep(self._delay())
+        return _Completion(self._next_reply(payload))
+
+    async def astream(self, payload: Any) -> AsyncIterator[_Chunk]:
+        """Ответ фрагментами по chunk_chars символов; задержка делится между ними"""
+        reply = self._next_reply(payload)
+        pieces = [reply[i:i + self.chunk_chars] for i in range(0, len(reply), self.chunk_chars)] or [""]
+        delay = self._delay() / len(pieces)
+        for piece in pieces:
+            await asyncio.sleep(delay)
+            self.stats["chunks"] += 1
+            yield _Chunk(piece)
+
+
+class RecordingLLM:
+    """
+    Обёртка над настоящим клиентом: пропускает вызовы chat/achat и дописывает
+    каждую пару (сообщения, ответ) в JSONL, пригодный для ScriptedLLM.from_file.
+    """
+
+    # Общая блокировка: в один файл могут писать обёртки клиентов разных циклов
+    _lock = threading.Lock()
+
+    def __init__(self, client: Any, path: str):
+        self.client = client
+        self.path = path
+
+    def _record(self, payload: Any, response: Any):
+        entry = {
+            "messages": messages_as_dicts(payload),
+            "reply": response.choices[0].message.content
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def chat(self, payload: Any) -> Any:
+        response = self.client.chat(payload)
+        self._record(payload, response)
+        return response
+
+    async def achat(self, payload: Any) -> Any:
+        response = await self.client.achat(payload)
+        self._record(payload, response)
+        return response
+
+    async def astream(self, payload: Any) -> AsyncIterator[Any]:
+        """Записывается то, что модель успела сгенерировать до закрытия потока"""
+        parts = []
+        chunks = self.client.astream(payload)
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                yield chunk
+        finally:
+            await chunks.aclose()
+            self._record(payload, _Completion("".join(parts)))
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+
+def search_task_policy(start_url: str, query: str) -> Policy:
+    """
+    Сценарий «открыть сайт → ввести запрос → Enter → готово».
+    Следующий шаг определяется по уже вызванным инструментам, id поля — по
+    последнему снимку в истории (приложенному к результату действия или
+    полученному отдельным extract_page_snapshot).
+    """
+    def policy(messages: List[Dict[str, str]]) -> str:
+        called = [match.group(1) for m in messages if m["role"] == "assistant"
+                  for match in [re.search(r'"tool"\s*:\s*"(\w+)"', m["content"])] if match]
+
+        if "navigate" not in called:
+            return json.dumps({"tool": "navigate", "args": {"url": start_url}}, ensure_ascii=False)
+        if "fill_field_by_index" not in called:
+            for message in reversed(messages):
+                match = re.search(r"^(\d+)\. \[input\]", message["content"], re.MULTILINE)
+                if message["role"] == "user" and match:
+                    return json.dumps({"tool": "fill_field_by_index",
+                                       "args": {"index": int(match.group(1)), "value": query}},
+                                      ensure_ascii=False)
+            return json.dumps({"tool": "extract_page_snapshot", "args": {}}, ensure_ascii=False)
+        if "press_enter" not in called:
+            return json.dumps({"tool": "press_enter", "args": {}}, ensure_ascii=False)
+        return f"ЗАДАЧА ВЫПОЛНЕНА\nИтог: выполнен поиск «{query}»"
+
+    return policy
@@ -0,0 +1,129 @@
+import fnmatch
+import json
+import logging
+import os
+import threading
+from typing import Dict, Any, Optional, List
+from urllib.parse import urlparse
+
+from playwright.async_api import BrowserContext, Route, Request
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Оценка размера заблокированного ответа по типу ресурса, байт: сам ответ не
+# скачивается, поэтому точный размер неизвестен (порядок величин — медианы
+# HTTP Archive для соответствующих типов)
+ESTIMATED_BYTES = {
+    "image": 25_000,
+    "media": 500_000,
+    "font": 30_000,
+    "script": 20_000,
+    "stylesheet": 10_000,
+    "document": 30_000,
+    "xhr": 3_000,
+    "fetch": 3_000,
+    "other": 5_000
+}
+
+_RULE_KEYS = ("block_types", "block_urls", "allow_urls")
+
+
+def _host(url: str) -> str:
+    return urlparse(url).hostname or ""
+
+
+class ResourcePolicy:
+    """
+    Политика загрузки ресурсов для контекста браузера (context.route).
+    Агенту нужны текст DOM и интерактивные элементы, поэтому по умолчанию
+    картинки, видео, шрифты, аналитика и реклама не загружаются.
+
+    Правила задаются по доменам открытой страницы (Config.RESOURCE_POLICY,
+    плюс JSON из Config.RESOURCE_POLICY_PATH): "*" — общие, правило домена
+    (и его поддоменов) переопределяет отдельные ключи общего. Порядок проверки:
+    allow_urls (всегда загружать) → block_urls → block_types. Переход главного
+    фрейма не блокируется никогда.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        self.rules = rules if rules is not None else self._load_rules()
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "blocked": 0,
+            "blocked_bytes_estimated": 0,
+            "blocked_by_type": {}
+        }
+
+    @staticmethod
+    def _load_rules() -> Dict[str, Dict[str, List[str]]]:
+        rules = {domain: dict(rule) for domain, rule in Config.RESOURCE_POLICY.items()}
+        path = Config.RESOURCE_POLICY_PATH
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for domain, rule in json.load(f).items():
+                        rules.setdefault(domain, {}).update(rule)
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Не удалось прочитать политику ресурсов {path}: {e}")
+        return rules
+
+    def rule_for(self, page_host: str) -> Dict[str, List[str]]:
+        """Правило для домена страницы: общее "*" + самое точное совпадение домена"""
+        rule = {key: list(self.rules.get("*", {}).get(key, [])) for key in _RULE_KEYS}
+        matches = [domain for domain in self.rules
+                   if domain != "*" and (page_host == domain or page_host.endswith("." + domain))]
+        if matches:
+            specific = self.rules[max(matches, key=len)]
+            for key in _RULE_KEYS:
+                if key in specific:
+                    rule[key] = list(specific[key])
+        return rule
+
+    def decide(self, url: str, resource_type: str, page_url: str = "") -> Optional[str]:
+        """Причина блокировки или None, если ресурс нужно загрузить"""
+        rule = self.rule_for(_host(page_url) or _host(url))
+        if any(fnmatch.fnmatchcase(url, pattern) for pattern in rule["allow_urls"]):
+            return None
+        for pattern in rule["block_urls"]:
+            if fnmatch.fnmatchcase(url, pattern):
+                return f"url:{pattern}"
+        if resource_type in rule["block_types"]:
+            return f"type:{resource_type}"
+        return None
+
+    async def install(self, context: BrowserContext):
+        """Подключает политику ко всем запросам контекста"""
+        await context.route("**/*", self._handle)
+
+    async def _handle(self, route: Route, request: Request):
+        resource_type = request.resource_type
+        reason = None
+        try:
+            frame = request.frame
+            main_navigation = request.is_navigation_request() and frame.parent_frame is None
+            if not main_navigation:
+                reason = self.decide(request.url, resource_type, frame.page.url)
+        except Exception:
+            # У запросов service worker нет фрейма — решаем по адресу самого запроса
+            reason = self.decide(request.url, resource_type)
+
+        with self._lock:
+            self.stats["requests"] += 1
+            if reason:
+                self.stats["blocked"] += 1
+                self.stats["blocked_bytes_estimated"] += ESTIMATED_BYTES.get(resource_type, ESTIMATED_BYTES["other"])
+                by_type = self.stats["blocked_by_type"]
+                by_type[resource_type] = by_type.get(resource_type, 0) + 1
+
+        if reason:
+            await route.abort("blockedbyclient")
+        else:
+            # fallback, а не continue_: другие обработчики (например, HAR) тоже получают запрос
+            await route.fallback()
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "blocked_by_type": dict(self.stats["blocked_by_type"])}
@@ -0,0 +1,342 @@
+import io
+import logging
+import os
+import re
+import threading
+import zlib
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from verdict_cache import normalize_text, get_verdict_cache
+
+logger = logging.getLogger(__name__)
+
+# Размер пространства хэшированных признаков (степень двойки — маска вместо деления)
+N_FEATURES = 2 ** 18
+
+_WORD_RE = re.compile(r"\w+")
+_DOC_TOKEN = "\x00doc"  # Есть в каждом тексте: у пустого письма тоже ненулевой набор признаков
+
+
+def hashed_features(text: str) -> np.ndarray:
+    """
+    Индексы признаков текста: слова, пары соседних слов и символьные триграммы
+    (ловят «к@зино», «кр3дит» и прочие искажения), захэшированные crc32.
+    Повторяющиеся признаки повторяются и в массиве — это мультиномиальные счётчики.
+    """
+    text = normalize_text(text)
+    words = _WORD_RE.findall(text)
+    tokens = [_DOC_TOKEN]
+    tokens += words
+    tokens += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    tokens += ["\x01" + text[i:i + 3] for i in range(len(text) - 2)]
+    return np.fromiter(
+        (zlib.crc32(token.encode("utf-8")) & (N_FEATURES - 1) for token in tokens),
+        dtype=np.int64, count=len(tokens)
+    )
+
+
+def _is_audit(text: str, rate: float) -> bool:
+    """Детерминированная выборка: одно и то же письмо всегда либо в аудите, либо нет"""
+    return rate > 0 and zlib.crc32(normalize_text(text).encode("utf-8")) % 10000 < rate * 10000
+
+
+class SpamFilter:
+    """
+    Локальный предклассификатор спама: мультиномиальный наивный Байес по
+    хэшированным n-граммам (NumPy), обучается онлайн на вердиктах LLM.
+
+    Уверенные письма (P(спам) ≥ spam_threshold или ≤ ham_threshold) решаются
+    локально, к модели уходит только неуверенная середина. Пороги подбираются
+    по истории предсказаний, сделанных ДО обучения на соответствующем письме
+    (prequential), так, чтобы точность в зонах локального решения была не ниже
+    Config.SPAM_FILTER_TARGET_ACCURACY. Доля Config.SPAM_FILTER_AUDIT_RATE
+    локальных решений всё равно отправляется в LLM — по ней оценивается
+    фактическая точность фильтра.
+    """
+
+    HISTORY_LIMIT = 5000  # Последних пар (вероятность, метка) для калибровки
+    ALPHA = 0.1  # Сглаживание Лапласа
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else Config.SPAM_FILTER_PATH
+        self._lock = threading.Lock()
+        self.target_accuracy = Config.SPAM_FILTER_TARGET_ACCURACY
+        self.reset()
+        if self.path and os.path.exists(self.path):
+            try:
+                self._load()
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"⚠️ Не удалось загрузить фильтр спама из {self.path}: {e}")
+                self.reset()
+
+    def reset(self):
+        self.feature_counts = np.zeros((2, N_FEATURES), dtype=np.float32)  # [не спам, спам]
+        self.class_counts = np.zeros(2, dtype=np.int64)
+        self.history_p = np.zeros(0, dtype=np.float32)
+        self.history_y = np.zeros(0, dtype=np.int8)
+        # Без калибровки локально не решается ничего
+        self.spam_threshold = 1.01
+        self.ham_threshold = -0.01
+        self._log_prob: Optional[np.ndarray] = None
+        self.stats = {
+            "local": 0,
+            "sent_to_llm": 0,
+            "audited": 0,
+            "audit_agree": 0
+        }
+
+    # ============================================================
+    # МОДЕЛЬ
+    # ============================================================
+
+    @property
+    def active(self) -> bool:
+        return bool(self.class_counts.min() >= Config.SPAM_FILTER_MIN_SAMPLES)
+
+    def _log_probabilities(self) -> np.ndarray:
+        if self._log_prob is None:
+            smoothed = self.feature_counts + self.ALPHA
+            self._log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        return self._log_prob
+
+    def _predict(self, features: List[np.ndarray]) -> np.ndarray:
+        """P(спам) для уже посчитанных признаков; вся пачка — одна операция над матрицей"""
+        if not features:
+            return np.zeros(0, dtype=np.float32)
+        if self.class_counts.min() == 0:
+            return np.full(len(features), 0.5, dtype=np.float32)
+        offsets = np.cumsum([0] + [len(f) for f in features[:-1]])
+        all_features = np.concatenate(features)
+        log_likelihood = np.add.reduceat(self._log_probabilities()[:, all_features], offsets, axis=1)
+        log_prior = np.log(self.class_counts / self.class_counts.sum())
+        scores = log_likelihood + log_prior[:, None]
+        # P(спам) = 1 / (1 + exp(ham - spam)); clip спасает от переполнения exp
+        return (1.0 / (1.0 + np.exp(np.clip(scores[0] - scores[1], -50, 50)))).astype(np.float32)
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            return self._predict([hashed_features(text) for text in texts])
+
+    def partial_fit(self, texts: List[str], labels: List[bool]):
+        """
+        Дообучение на вердиктах LLM. Перед обновлением счётчиков запоминается
+        предсказание текущей модели — из этих пар подбираются пороги.
+        """
+        if not texts:
+            return
+        features = [hashed_features(text) for text in texts]
+        y = np.asarray(labels, dtype=np.int8)
+        with self._lock:
+            p = self._predict(features)
+            if self.class_counts.min() > 0:
+                self.history_p = np.concatenate([self.history_p, p])[-self.HISTORY_LIMIT:]
+                self.history_y = np.concatenate([self.history_y, y])[-self.HISTORY_LIMIT:]
+            for feats, label in zip(features, y):
+                np.add.at(self.feature_counts[label], feats, 1.0)
+            self.class_counts += np.bincount(y, minlength=2)
+            self._log_prob = None
+            self._calibrate()
+
+    # ============================================================
+    # ПОРОГИ
+    # ============================================================
+
+    def _zone_accuracy(self, spam_threshold: float, ham_threshold: float) -> Tuple[int, float]:
+        """(число писем в зонах локального решения, точность на них) по истории"""
+        p, y = self.history_p, self.history_y
+        spam_zone = p >= spam_threshold
+        ham_zone = p <= ham_threshold
+        covered = int(spam_zone.sum() + ham_zone.sum())
+        if not covered:
+            return 0, 1.0
+        correct = int((y[spam_zone] == 1).sum() + (y[ham_zone] == 0).sum())
+        return covered, correct / covered
+
+    def _calibrate(self):
+        """
+        Для каждой стороны — самый мягкий порог, при котором точность в его
+        зоне не ниже целевой (и зона содержит хотя бы MIN_SAMPLES писем истории).
+        """
+        p, y = self.history_p, self.history_y
+        self.spam_threshold, self.ham_threshold = 1.01, -0.01
+        if not self.active or len(p) < Config.SPAM_FILTER_MIN_SAMPLES:
+            return
+        for threshold in (0.6, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.999):
+            zone = p >= threshold
+            if zone.sum() >= Config.SPAM_FILTER_MIN_SAMPLES and (y[zone] == 1).mean() >= self.target_accuracy:
+                self.spam_threshold = threshold
+                break
+        for threshold in (0.4, 0.3, 0.2, 0.1, 0.05, 0.02, 0.01, 0.005, 0.001):
+            zone = p <= threshold
+            if zone.sum() >= Config.SPAM_FILTER_MIN_SAMPLES and (y[zone] == 0).mean() >= self.target_accuracy:
+                self.ham_threshold = threshold
+                break
+
+    # ============================================================
+    # РЕШЕНИЯ
+    # ============================================================
+
+    def triage(self, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Вердикт для уверенных писем (в формате analysis суб-агента без index)
+        и None для тех, что нужно отправить в LLM.
+        """
+        if not texts or not self.active:
+            return [None] * len(texts)
+        probabilities = self.predict_proba(texts)
+        verdicts: List[Optional[Dict[str, Any]]] = []
+        with self._lock:
+            for text, p in zip(texts, probabilities):
+                p = float(p)
+                if p >= self.spam_threshold or p <= self.ham_threshold:
+                    if _is_audit(text, Config.SPAM_FILTER_AUDIT_RATE):
+                        self.stats["audited"] += 1
+                        verdicts.append(None)
+                        continue
+                    is_spam = p >= self.spam_threshold
+                    self.stats["local"] += 1
+                    verdicts.append({
+                        "is_spam": is_spam,
+                        "confidence": round(p if is_spam else 1.0 - p, 4),
+                        "reason": "локальный классификатор",
+                        "source": "local"
+                    })
+                else:
+                    self.stats["sent_to_llm"] += 1
+                    verdicts.append(None)
+        return verdicts
+
+    def learn(self, texts: List[str], verdicts: List[Dict[str, Any]]):
+        """Обучение на ответах LLM; письма из аудита дополнительно сверяются с фильтром"""
+        if not texts:
+            return
+        if self.active:
+            probabilities = self.predict_proba(texts)
+            with self._lock:
+                for text, p, verdict in zip(texts, probabilities, verdicts):
+                    local = p >= self.spam_threshold or p <= self.ham_threshold
+                    if local and _is_audit(text, Config.SPAM_FILTER_AUDIT_RATE):
+                        self.stats["audit_agree"] += int(bool(p >= self.spam_threshold) == bool(verdict.get("is_spam")))
+        self.partial_fit(texts, [bool(v.get("is_spam")) for v in verdicts])
+        if self.path:
+            self.save()
+
+    def threshold_table(self) -> List[Dict[str, Any]]:
+        """Покрытие и точность локальных решений для разных симметричных порогов"""
+        table = []
+        with self._lock:
+            for threshold in (0.8, 0.9, 0.95, 0.99, 0.999):
+                covered, accuracy = self._zone_accuracy(threshold, 1.0 - threshold)
+                table.append({
+                    "spam_threshold": threshold,
+                    "ham_threshold": round(1.0 - threshold, 3),
+                    "local_share": round(covered / len(self.history_p), 3) if len(self.history_p) else 0.0,
+                    "accuracy": round(accuracy, 4)
+                })
+        return table
+
+    def report(self) -> Dict[str, Any]:
+        """Точность и пороги — для подбора баланса стоимость/качество"""
+        with self._lock:
+            decided = self.stats["local"] + self.stats["sent_to_llm"] + self.stats["audited"]
+            covered, zone_accuracy = self._zone_accuracy(self.spam_threshold, self.ham_threshold)
+            overall = (float(((self.history_p >= 0.5) == (self.history_y == 1)).mean())
+                       if len(self.history_p) else None)
+            return {
+                "active": self.active,
+                "samples": {"spam": int(self.class_counts[1]), "not_spam": int(self.class_counts[0])},
+                "spam_threshold": self.spam_threshold,
+                "ham_threshold": self.ham_threshold,
+                "target_accuracy": self.target_accuracy,
+                # Оценка по истории (prequential) и по аудиту локальных решений
+                "local_accuracy": round(zone_accuracy, 4) if covered else None,
+                "overall_accuracy": round(overall, 4) if overall is not None else None,
+                "audit_accuracy": (round(self.stats["audit_agree"] / self.stats["audited"], 4)
+                                   if self.stats["audited"] else None),
+                "local_share": round(self.stats["local"] / decided, 3) if decided else 0.0,
+                **self.stats
+            }
+
+    # ============================================================
+    # ХРАНЕНИЕ
+    # ============================================================
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        buffer = io.BytesIO()
+        with self._lock:
+            np.savez_compressed(
+                buffer,
+                feature_counts=self.feature_counts,
+                class_counts=self.class_counts,
+                history_p=self.history_p,
+                history_y=self.history_y,
+                thresholds=np.array([self.spam_threshold, self.ham_threshold])
+            )
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        with np.load(self.path) as data:
+            if data["feature_counts"].shape != (2, N_FEATURES):
+                raise ValueError("другой размер пространства признаков")
+            self.feature_counts = data["feature_counts"].astype(np.float32)
+            self.class_counts = data["class_counts"].astype(np.int64)
+            self.history_p = data["history_p"].astype(np.float32)
+            self.history_y = data["history_y"].astype(np.int8)
+            self.spam_threshold, self.ham_threshold = (float(v) for v in data["thresholds"])
+
+    def train_from_verdicts(self) -> int:
+        """Обучение с нуля на вердиктах LLM из кэша суб-агента; возвращает число писем"""
+        cache = get_verdict_cache()
+        if cache is None:
+            return 0
+        samples = list(cache.training_samples("spam"))
+        self.reset()
+        # Небольшими порциями: предсказания до обучения на каждой порции наполняют историю для порогов
+        for start in range(0, len(samples), 50):
+            part = samples[start:start + 50]
+            self.partial_fit([text for text, _ in part], [bool(v.get("is_spam")) for _, v in part])
+        return len(samples)
+
+
+_shared_filter: Optional[SpamFilter] = None
+_shared_lock = threading.Lock()
+
+
+def get_spam_filter() -> Optional[SpamFilter]:
+    """Общий фильтр процесса; None, если Config.SPAM_FILTER_ENABLED выключен"""
+    global _shared_filter
+    if not Config.SPAM_FILTER_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_filter is None or _shared_filter.path != Config.SPAM_FILTER_PATH:
+            _shared_filter = SpamFilter(Config.SPAM_FILTER_PATH)
+            # Первый запуск: обучаемся на уже накопленных вердиктах
+            if not _shared_filter.class_counts.any():
+                trained = _shared_filter.train_from_verdicts()
+                if trained:
+                    logger.info(f"🧮 Фильтр спама обучен на {trained} вердиктах из кэша")
+                    if _shared_filter.path:
+                        _shared_filter.save()
+        return _shared_filter
+
+
+if __name__ == "__main__":
+    # Переобучение на вердиктах из кэша и отчёт о порогах: python spam_filter.py
+    import json
+
+    spam_filter = SpamFilter(Config.SPAM_FILTER_PATH)
+    count = spam_filter.train_from_verdicts()
+    if spam_filter.path:
+        spam_filter.save()
+    print(f"Обучено на {count} вердиктах")
+    print(json.dumps(spam_filter.report(), ensure_ascii=False, indent=2))
+    for row in spam_filter.threshold_table():
+        print(f"  P ≥ {row['spam_threshold']} / ≤ {row['ham_threshold']}: "
+              f"локально {row['local_share']:.0%}, точность {row['accuracy']:.2%}")
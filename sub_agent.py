@@ -1,6 +1,14 @@
+import json
 import logging
-from typing import List, Dict, Any, Optional
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from config import Config
+from llm_client import LLMClient, get_llm_client
+from job_ranker import JobRanker
+from spam_filter import SpamFilter, get_spam_filter
+from utils import estimate_tokens
+from verdict_cache import VerdictCache, get_verdict_cache, verdict_key
 
 logger = logging.getLogger(__name__)
 
@@ -11,53 +19,181 @@ class SubAgent:
     - Определение спама в письмах
     - Анализ вакансий
     - Классификация контента
+    
+    Большие списки делятся на чанки по бюджету токенов
+    (Config.SUBAGENT_CHUNK_TOKENS) и отправляются параллельно; индексы в
+    ответах модели переводятся обратно в порядок исходного списка.
+    Вердикты по уже виденным текстам берутся из постоянного кэша (verdict_cache),
+    очевидный спам и очевидно нормальные письма решает локальный классификатор
+    (spam_filter).
     """
     
-    def __init__(self, provider: str, client: Any):
-        self.provider = provider
-        self.client = client
+    def __init__(
+        self,
+        llm: Optional[LLMClient] = None,
+        verdicts: Optional[VerdictCache] = None,
+        spam_filter: Optional[SpamFilter] = None
+    ):
+        # По умолчанию — общий клиент процесса (тот же, что у BrowserAgent)
+        self.llm = llm or get_llm_client()
+        self.verdicts = verdicts if verdicts is not None else get_verdict_cache()
+        self.spam_filter = spam_filter if spam_filter is not None else get_spam_filter()
+        self.job_ranker = JobRanker()
     
-    def _get_llm_response(self, prompt: str, json_mode: bool = True) -> str:
+    def _get_llm_response(self, prompt: str, json_mode: bool = True, use_cache: bool = True) -> str:
         """Универсальный метод для получения ответа от LLM"""
         try:
-            if self.provider == "claude":
-                from anthropic import Anthropic
-                response = self.client.messages.create(
-                    model=Config.CLAUDE_MODEL,
-                    max_tokens=1024,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return response.content[0].text
-            
-            elif self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=Config.OPENAI_MODEL,
-                    messages=[{"role": "user", "content": prompt}],
-                    response_format={"type": "json_object"} if json_mode else None
-                )
-                return response.choices[0].message.content
-            
-            else:  # gigachat
-                from gigachat.models import Chat, Messages
-                response = self.client.chat(Chat(messages=[
-                    Messages(role="user", content=prompt)
-                ]))
-                return response.choices[0].message.content
+            return self.llm.complete([{"role": "user", "content": prompt}], json_mode=json_mode,
+                                     use_cache=use_cache)
                 
         except Exception as e:
             logger.error(f"Ошибка связи с LLM в суб-агенте: {e}")
             raise
     
-    def analyze_spam(self, items: List[str]) -> Dict[str, Any]:
+    # ============================================================
+    # ЧАНКИ
+    # ============================================================
+    
+    @staticmethod
+    def _make_chunks(items: List[str], overhead_tokens: int) -> List[List[int]]:
         """
-        Анализирует список элементов (писем) на спам
-        
-        Args:
-            items: Список текстов для анализа
-            
-        Returns:
-            Результат анализа с классификацией
+        Делит индексы элементов на чанки: промпт чанка (шаблон + тексты)
+        укладывается в Config.SUBAGENT_CHUNK_TOKENS, элементов не больше
+        Config.SUBAGENT_CHUNK_MAX_ITEMS. Слишком длинный элемент идёт отдельным чанком.
         """
+        budget = max(Config.SUBAGENT_CHUNK_TOKENS - overhead_tokens, 1)
+        chunks: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for idx, item in enumerate(items):
+            cost = estimate_tokens(item) + 5  # + заголовок «ТЕКСТ N:»
+            if current and (used + cost > budget or len(current) >= Config.SUBAGENT_CHUNK_MAX_ITEMS):
+                chunks.append(current)
+                current, used = [], 0
+            current.append(idx)
+            used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    @staticmethod
+    def _parse_analysis(result_text: str, size: int) -> List[Dict[str, Any]]:
+        """Список analysis из ответа; ошибка, если покрыты не все индексы 0..size-1"""
+        # Claude иногда оборачивает JSON в ```json ... ```
+        json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
+        if not json_match:
+            raise ValueError("Не удалось распарсить ответ")
+        analysis = json.loads(json_match.group(0)).get("analysis", [])
+        by_index = {}
+        for entry in analysis:
+            if isinstance(entry, dict) and isinstance(entry.get("index"), int) and 0 <= entry["index"] < size:
+                by_index.setdefault(entry["index"], entry)
+        missing = [idx for idx in range(size) if idx not in by_index]
+        if missing:
+            raise ValueError(f"В ответе нет элементов {missing}")
+        return [by_index[idx] for idx in range(size)]
+    
+    def _analyze_in_chunks(
+        self,
+        items: List[str],
+        build_prompt: Callable[[List[str]], str],
+        label: str,
+        kind: str,
+        context: str = "",
+        local: Optional[SpamFilter] = None
+    ) -> Tuple[List[Dict[str, Any]], List[int], List[str]]:
+        """
+        Общий механизм для analyze_spam / analyze_job_relevance.
+        Сначала вердикты ищутся в кэше по хэшу текста (kind + context), одинаковые
+        тексты отправляются один раз. Затем уверенные решения принимает локальный
+        классификатор local (в кэш они не пишутся — иначе фильтр учился бы на
+        собственных ответах), а ответы модели его дообучают. Остальное делится на чанки, которые
+        обрабатываются пулом из Config.SUBAGENT_MAX_WORKERS потоков; повторно
+        отправляются только неудачные чанки (без кэша ответов).
+        Возвращает (analysis в исходном порядке, индексы без результата, ошибки).
+        """
+        results: Dict[int, Dict[str, Any]] = {}
+        errors: List[str] = []
+        
+        keys = [verdict_key(kind, item, context) for item in items]
+        cached = self.verdicts.get_many(keys) if self.verdicts is not None else {}
+        first_by_key: Dict[str, int] = {}
+        for idx, key in enumerate(keys):
+            if key in cached:
+                results[idx] = {**cached[key], "index": idx, "cached": True}
+            else:
+                first_by_key.setdefault(key, idx)
+        unseen = sorted(first_by_key.values())
+        if cached:
+            logger.info(f"💾 {label}: из кэша {len(items) - len(unseen)} из {len(items)}, "
+                        f"к модели {len(unseen)}")
+        
+        decided: Dict[str, Dict[str, Any]] = {}
+        if local is not None and unseen:
+            for idx, verdict in zip(unseen, local.triage([items[idx] for idx in unseen])):
+                if verdict is not None:
+                    decided[keys[idx]] = verdict
+            if decided:
+                unseen = [idx for idx in unseen if keys[idx] not in decided]
+                logger.info(f"🧮 {label}: локально решено {len(decided)}, к модели {len(unseen)}")
+        
+        chunks = [[unseen[pos] for pos in chunk]
+                  for chunk in self._make_chunks([items[idx] for idx in unseen], estimate_tokens(build_prompt([])))]
+        
+        def run_chunk(chunk: List[int], use_cache: bool) -> List[Dict[str, Any]]:
+            reply = self._get_llm_response(build_prompt([items[idx] for idx in chunk]), json_mode=True,
+                                           use_cache=use_cache)
+            analysis = self._parse_analysis(reply, len(chunk))
+            # Локальный индекс чанка → индекс в исходном списке
+            return [{**entry, "index": chunk[local]} for local, entry in enumerate(analysis)]
+        
+        if len(chunks) > 1:
+            logger.info(f"🧩 {label}: {len(items)} элементов → {len(chunks)} чанков")
+        
+        pending = chunks
+        fresh: Dict[str, Dict[str, Any]] = {}
+        workers = max(1, min(Config.SUBAGENT_MAX_WORKERS, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for attempt in range(Config.SUBAGENT_CHUNK_RETRIES + 1):
+                futures = [(chunk, executor.submit(run_chunk, chunk, attempt == 0)) for chunk in pending]
+                failed = []
+                for chunk, future in futures:
+                    try:
+                        for entry in future.result():
+                            results[entry["index"]] = entry
+                            fresh[keys[entry["index"]]] = {k: v for k, v in entry.items() if k != "index"}
+                    except Exception as e:
+                        failed.append(chunk)
+                        errors.append(f"элементы {chunk[0]}–{chunk[-1]}: {e}")
+                if not failed:
+                    break
+                if attempt < Config.SUBAGENT_CHUNK_RETRIES:
+                    logger.warning(f"⚠️ {label}: повтор {len(failed)} неудачных чанков из {len(chunks)}")
+                pending = failed
+        
+        if fresh:
+            texts = {keys[idx]: items[idx] for idx in unseen if keys[idx] in fresh}
+            if self.verdicts is not None:
+                self.verdicts.put_many(kind, fresh, texts)
+            if local is not None:
+                local.learn(list(texts.values()), [fresh[key] for key in texts])
+        
+        # Повторы одного и того же текста получают вердикт первого вхождения
+        for idx, key in enumerate(keys):
+            if idx not in results and (key in fresh or key in decided):
+                results[idx] = {**fresh.get(key, decided.get(key)), "index": idx}
+        
+        failed_indexes = [idx for idx in range(len(items)) if idx not in results]
+        if not failed_indexes:
+            errors = []
+        return [results[idx] for idx in sorted(results)], failed_indexes, errors
+    
+    # ============================================================
+    # АНАЛИЗ
+    # ============================================================
+    
+    @staticmethod
+    def _spam_prompt(items: List[str]) -> str:
         prompt = f"""Ты — эксперт по анализу спама. Твоя задача — проанализировать предоставленные тексты и определить, являются ли они спамом.
 
 КРИТЕРИИ СПАМА:
@@ -90,33 +226,46 @@ class SubAgent:
 """
         for idx, item in enumerate(items):
             prompt += f"\nТЕКСТ {idx}:\n{item}\n"
+        return prompt
+    
+    def analyze_spam(self, items: List[str]) -> Dict[str, Any]:
+        """
+        Анализирует список элементов (писем) на спам
         
-        try:
-            result_text = self._get_llm_response(prompt, json_mode=True)
+        Args:
+            items: Список текстов для анализа
             
-            # Извлекаем JSON из ответа
-            import json
-            import re
+        Returns:
+            Результат анализа с классификацией. Если часть чанков так и не
+            удалось обработать, их элементы перечислены в failed_indexes.
+            Решения локального классификатора помечены source="local",
+            в local — его пороги и оценка точности.
+        """
+        try:
+            analysis, failed_indexes, errors = self._analyze_in_chunks(
+                items, self._spam_prompt, "Анализ спама", kind="spam", local=self.spam_filter
+            )
+            if items and not analysis:
+                return {
+                    "error": "; ".join(errors) or "Не удалось распарсить ответ"
+                }
             
-            # Claude иногда оборачивает JSON в ```json ... ```
-            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group(0))
-                
-                # Вычисляем итоговые значения
-                spam_count = sum(1 for item in parsed.get("analysis", []) if item.get("is_spam"))
-                parsed["summary"] = {
+            # Вычисляем итоговые значения
+            spam_count = sum(1 for item in analysis if item.get("is_spam"))
+            result = {
+                "analysis": analysis,
+                "summary": {
                     "total": len(items),
                     "spam_count": spam_count,
-                    "not_spam_count": len(items) - spam_count
+                    "not_spam_count": len(analysis) - spam_count
                 }
-                
-                return parsed
-            
-            return {
-                "error": "Не удалось распарсить ответ",
-                "raw_response": result_text
             }
+            if self.spam_filter is not None:
+                result["local"] = self.spam_filter.report()
+            if failed_indexes:
+                result["failed_indexes"] = failed_indexes
+                result["errors"] = errors
+            return result
             
         except Exception as e:
             logger.error(f"Ошибка анализа спама: {e}")
@@ -124,17 +273,8 @@ class SubAgent:
                 "error": str(e)
             }
     
-    def analyze_job_relevance(self, job_descriptions: List[str], user_profile: str) -> Dict[str, Any]:
-        """
-        Анализирует релевантность вакансий профилю пользователя
-        
-        Args:
-            job_descriptions: Список описаний вакансий
-            user_profile: Профиль пользователя (навыки, опыт)
-            
-        Returns:
-            Результат анализа с рейтингом релевантности
-        """
+    @staticmethod
+    def _jobs_prompt(job_descriptions: List[str], user_profile: str) -> str:
         prompt = f"""Ты — эксперт по подбору персонала. Твоя задача — проанализировать вакансии и определить их релевантность профилю кандидата.
 
 ПРОФИЛЬ КАНДИДАТА:
@@ -169,38 +309,82 @@ class SubAgent:
 """
         for idx, desc in enumerate(job_descriptions):
             prompt += f"\nВАКАНСИЯ {idx}:\n{desc}\n"
+        return prompt
+    
+    def analyze_job_relevance(
+        self,
+        job_descriptions: List[str],
+        user_profile: str,
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Анализирует релевантность вакансий профилю пользователя
         
+        Args:
+            job_descriptions: Список описаний вакансий
+            user_profile: Профиль пользователя (навыки, опыт)
+            top_k: Сколько лучших по BM25 вакансий отправить в LLM
+                (по умолчанию Config.JOB_RANKER_TOP_K, 0 — все)
+            min_score: Порог нормированной оценки BM25 (Config.JOB_RANKER_MIN_SCORE)
+            
+        Returns:
+            Результат анализа с рейтингом релевантности (failed_indexes —
+            вакансии, которые не удалось оценить). У каждой вакансии в analysis
+            есть ranker_score (BM25) и relevance_score (LLM); отсеянные
+            ранжировщиком перечислены в skipped со своей ranker_score.
+        """
         try:
-            result_text = self._get_llm_response(prompt, json_mode=True)
+            ranking = self.job_ranker.select(job_descriptions, user_profile, top_k, min_score)
+            selected, scores = ranking["selected"], ranking["scores"]
+            if not ranking["ranked"] and job_descriptions:
+                logger.info("📊 Профиль не совпал ни с одной вакансией — предотбор пропущен")
+            elif len(selected) < len(job_descriptions):
+                logger.info(f"📊 Предотбор вакансий: к модели {len(selected)} из {len(job_descriptions)}")
             
-            import json
-            import re
+            analysis, failed_indexes, errors = self._analyze_in_chunks(
+                [job_descriptions[idx] for idx in selected],
+                lambda chunk: self._jobs_prompt(chunk, user_profile),
+                "Анализ вакансий",
+                kind="jobs",
+                context=user_profile
+            )
+            if selected and not analysis:
+                return {
+                    "error": "; ".join(errors) or "Не удалось распарсить ответ"
+                }
+            # Индексы подмножества → индексы исходного списка
+            analysis = [{**entry, "index": selected[entry["index"]], "ranker_score": scores[selected[entry["index"]]]}
+                        for entry in analysis]
+            failed_indexes = [selected[idx] for idx in failed_indexes]
+            chosen = set(selected)
+            skipped = [{"index": idx, "ranker_score": score}
+                       for idx, score in enumerate(scores) if idx not in chosen]
             
-            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group(0))
-                
-                # Вычисляем итоговые значения
-                high = sum(1 for item in parsed.get("analysis", []) 
-                          if item.get("relevance_score", 0) >= 0.7)
-                medium = sum(1 for item in parsed.get("analysis", []) 
-                            if 0.4 <= item.get("relevance_score", 0) < 0.7)
-                low = sum(1 for item in parsed.get("analysis", []) 
-                         if item.get("relevance_score", 0) < 0.4)
-                
-                parsed["summary"] = {
+            # Вычисляем итоговые значения
+            high = sum(1 for item in analysis 
+                      if item.get("relevance_score", 0) >= 0.7)
+            medium = sum(1 for item in analysis 
+                        if 0.4 <= item.get("relevance_score", 0) < 0.7)
+            low = sum(1 for item in analysis 
+                     if item.get("relevance_score", 0) < 0.4)
+            
+            result = {
+                "analysis": analysis,
+                "summary": {
                     "total": len(job_descriptions),
                     "high_relevance": high,
                     "medium_relevance": medium,
-                    "low_relevance": low
+                    "low_relevance": low,
+                    "skipped_by_ranker": len(skipped)
                 }
-                
-                return parsed
-            
-            return {
-                "error": "Не удалось распарсить ответ",
-                "raw_response": result_text
             }
+            if skipped:
+                result["skipped"] = skipped
+            if failed_indexes:
+                result["failed_indexes"] = failed_indexes
+                result["errors"] = errors
+            return result
             
         except Exception as e:
             logger.error(f"Ошибка анализа вакансий: {e}")
@@ -0,0 +1,71 @@
+from history import ConversationHistory
+
+
+def make_history(max_tokens=300, keep_recent=2):
+    history = ConversationHistory(max_tokens=max_tokens, keep_recent=keep_recent)
+    history.reset("system", "задача")
+    return history
+
+
+def add_snapshot(history, mode, size=300):
+    history.add("assistant", '{"tool": "extract_page_snapshot", "args": {}}', kind="assistant")
+    history.add("user", "Результат действия: ✅ снимок " + "x" * size, kind="snapshot",
+                meta={"mode": mode, "title": "Почта", "url": "https://mail.example/inbox", "element_count": 40})
+
+
+def add_result(history, text):
+    history.add("assistant", '{"tool": "extract_element_text", "args": {"index": 1}}', kind="assistant")
+    history.add("user", "Результат действия: ✅ " + text, kind="tool_result", meta={"url": "https://mail.example/1"})
+
+
+def test_stale_snapshots_are_collapsed():
+    history = make_history(max_tokens=10_000)
+    add_snapshot(history, "full")
+    add_snapshot(history, "diff", 50)
+    add_snapshot(history, "full")
+    saved = history.compact()
+    kinds = [(e.kind, e.meta.get("collapsed", False)) for e in history.entries if e.kind == "snapshot"]
+    assert kinds == [("snapshot", True), ("snapshot", True), ("snapshot", False)]
+    assert saved > 0
+
+
+def test_eviction_keeps_baseline_and_recent():
+    history = make_history()
+    for _ in range(5):
+        add_result(history, "y" * 60)
+    add_snapshot(history, "full")
+    add_snapshot(history, "diff", 20)
+    history.compact()
+    kinds = [e.kind for e in history.entries]
+    assert kinds[:3] == ["system", "task", "evicted_summary"]
+    assert any(e.kind == "snapshot" and e.meta["mode"] == "full" and not e.meta.get("collapsed")
+               for e in history.entries)
+    assert history.entries[-1].meta["mode"] == "diff"
+
+
+def test_budget_enforced_after_baseline():
+    history = make_history()
+    add_snapshot(history, "full")
+    for _ in range(4):
+        add_result(history, "t" * 300)
+        add_snapshot(history, "diff", 40)
+    history.compact()
+    collapsed = [e for e in history.entries if e.kind == "tool_result" and e.meta.get("collapsed")]
+    assert collapsed
+    assert history.rebase_requested
+
+    add_snapshot(history, "full")
+    assert not history.rebase_requested
+    history.compact()
+    assert history.total_tokens() < 400
+
+
+def test_summary_is_not_rebuilt_without_new_evictions():
+    history = make_history(max_tokens=100, keep_recent=2)
+    for _ in range(4):
+        add_result(history, "z" * 30)
+    history.compact()
+    summary = history.entries[2]
+    assert summary.kind == "evicted_summary"
+    history.compact()
+    assert history.entries[2] is summary
@@ -0,0 +1,26 @@
+from job_ranker import JobRanker
+
+JOBS = [
+    "Python-разработчик: Django, PostgreSQL, Docker",
+    "Бухгалтер на первичную документацию",
+    "Водитель категории B, график 5/2",
+]
+
+
+def test_profile_ranks_and_cuts_to_top_k():
+    ranking = JobRanker().select(JOBS, "Python разработчик, Django", top_k=1, min_score=0.0)
+    assert ranking["ranked"] is True
+    assert ranking["selected"] == [0]
+
+
+def test_empty_profile_selects_all_vacancies():
+    ranking = JobRanker().select(JOBS, "", top_k=1, min_score=0.0)
+    assert ranking["ranked"] is False
+    assert ranking["selected"] == [0, 1, 2]
+
+
+def test_unmatched_profile_selects_all_vacancies():
+    # Нет общих терминов с вакансиями, плюс однобуквенные слова, которые отбрасываются
+    ranking = JobRanker().select(JOBS, "я и Haskell, OCaml", top_k=1, min_score=0.0)
+    assert ranking["ranked"] is False
+    assert ranking["selected"] == [0, 1, 2]
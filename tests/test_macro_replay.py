@@ -0,0 +1,80 @@
+import asyncio
+
+from browser_agent import AsyncBrowserAgent
+from history import ConversationHistory
+from macros import MacroRecorder, MacroStore
+
+SEARCH_FIELD = {"type": "input", "inputType": "text", "placeholder": "Профессия", "text": ""}
+
+
+class FakePage:
+    def __init__(self):
+        self.url = "about:blank"
+
+
+def record_search_macro(store: MacroStore):
+    recorder = MacroRecorder("Найди вакансии python на hh.ru")
+    recorder.add("navigate", {"url": "https://hh.ru"}, {"success": True}, "https://hh.ru/")
+    recorder.observe_snapshot({"elements": [{"index": 3, **SEARCH_FIELD}]})
+    recorder.add("fill_field_by_index", {"index": 3, "value": "python"}, {"success": True}, "https://hh.ru/")
+    recorder.add("press_enter", {}, {"success": True}, "https://hh.ru/search/vacancy?text=python")
+    return store.record(recorder)
+
+
+def make_agent(store: MacroStore, task: str):
+    """Агент без браузера и LLM: инструменты подменены, страница — FakePage"""
+    agent = AsyncBrowserAgent.__new__(AsyncBrowserAgent)
+    agent.macros = store
+    agent.history = ConversationHistory()
+    agent.history.reset("system", task)
+    agent.page = FakePage()
+    agent._macro_recorder = MacroRecorder(task)
+    executed = []
+
+    async def dispatch(tool_name, args):
+        assert tool_name == "extract_page_snapshot"
+        return {"success": True, "mode": "full", "url": agent.page.url, "title": "hh.ru",
+                "elements": [{"index": 17, **SEARCH_FIELD}], "element_count": 1}
+
+    async def execute(tool_name, args, task):
+        executed.append((tool_name, dict(args)))
+        if tool_name == "navigate":
+            agent.page.url = args["url"] + "/"
+        elif tool_name == "press_enter":
+            agent.page.url = "https://hh.ru/search/vacancy?text=golang"
+        return {"success": True, "message": "ok"}
+
+    agent._dispatch_tool = dispatch
+    agent._confirm_and_execute = execute
+    return agent, executed
+
+
+def test_macro_replays_with_new_value(tmp_path):
+    store = MacroStore(str(tmp_path / "macros.json"))
+    macro = record_search_macro(store)
+    assert macro["pattern"] == "найди вакансии {0} на hh.ru"
+
+    task = "Найди вакансии golang на hh.ru"
+    agent, executed = make_agent(store, task)
+    done = asyncio.run(agent._replay_macro(task))
+
+    assert done == 3
+    assert executed == [
+        ("navigate", {"url": "https://hh.ru"}),
+        ("fill_field_by_index", {"value": "golang", "index": 17}),
+        ("press_enter", {}),
+    ]
+    assert store.macros[macro["key"]]["diverged"] == 0
+    assert store.macros[macro["key"]]["replays"] == 1
+
+
+def test_batch_steps_keep_their_own_url():
+    recorder = MacroRecorder("Найди вакансии python на hh.ru")
+    recorder.observe_snapshot({"elements": [{"index": 3, **SEARCH_FIELD}]})
+    recorder.add("batch", {}, {"success": True, "steps": [
+        {"tool": "fill_field_by_index", "args": {"index": 3, "value": "python"}, "success": True,
+         "url": "https://hh.ru/"},
+        {"tool": "press_enter", "args": {}, "success": True,
+         "url": "https://hh.ru/search/vacancy?text=python"},
+    ]}, "https://hh.ru/search/vacancy?text=python")
+    assert [step["url_after"] for step in recorder.steps] == ["hh.ru", "hh.ru/search/vacancy"]
@@ -0,0 +1,45 @@
+from macros import MacroRecorder, MacroStore, domain_fits, find_element, match_task, render_args, task_pattern
+
+
+def test_task_pattern_and_match():
+    pattern = task_pattern("Найди вакансии Python на hh.ru", ["Python"])
+    assert pattern == "найди вакансии {0} на hh.ru"
+    assert match_task(pattern, "найди вакансии golang на hh.ru!") == ["golang"]
+    assert match_task(pattern, "найди письма на mail.ru") is None
+
+
+def test_generic_pattern_does_not_match():
+    pattern = task_pattern("Найди котиков", ["котиков"])
+    assert match_task(pattern, "найди спам в почте и удали") is None
+
+
+def test_domain_fits():
+    assert domain_fits("hh.ru", "Найди вакансии на hh.ru")
+    assert domain_fits("spb.hh.ru", "Найди вакансии на hh.ru")
+    assert not domain_fits("yandex.ru", "Найди вакансии на hh.ru")
+    assert domain_fits("yandex.ru", "Найди погоду в Москве")
+
+
+def test_render_and_find_element():
+    args = render_args({"value": "{0} удалённо", "index": 3}, ["python"])
+    assert args == {"value": "python удалённо", "index": 3}
+    elements = [{"index": 1, "type": "a", "text": "Войти"},
+                {"index": 2, "type": "input", "inputType": "text", "placeholder": "Профессия", "text": ""}]
+    signature = {"type": "input", "inputType": "text", "placeholder": "Профессия", "text": ""}
+    assert find_element(elements, signature, [])["index"] == 2
+
+
+def test_store_finds_macro_for_matching_task_only(tmp_path):
+    store = MacroStore(str(tmp_path / "macros.json"))
+    recorder = MacroRecorder("Найди вакансии python на hh.ru")
+    recorder.add("navigate", {"url": "https://hh.ru"}, {"success": True}, "https://hh.ru/")
+    recorder.observe_snapshot({"elements": [{"index": 4, "type": "input", "inputType": "text",
+                                             "placeholder": "Профессия", "text": ""}]})
+    recorder.add("fill_field_by_index", {"index": 4, "value": "python"}, {"success": True}, "https://hh.ru/")
+    assert store.record(recorder) is not None
+
+    found = store.find("Найди вакансии java на hh.ru")
+    assert found is not None and found[1] == ["java"]
+    assert store.find("Найди вакансии java на superjob.ru") is None
+    # Хранилище переживает перезапуск
+    assert MacroStore(str(tmp_path / "macros.json")).find("Найди вакансии go на hh.ru") is not None
@@ -0,0 +1,52 @@
+import pytest
+
+import browser_agent  # noqa: F401 — регистрирует инструменты в TOOLS
+from benchmarks.bench_parser import CORPUS, _correct
+from tool_parser import extract_tool_call, parse_tool_reply, repair_json
+from tool_registry import TOOLS
+
+SCHEMAS = TOOLS.schemas()
+STRICT = TOOLS.names(state_changing=True)
+
+
+@pytest.mark.parametrize("reply, tool, args", CORPUS)
+def test_corpus(reply, tool, args):
+    parsed = parse_tool_reply(reply, SCHEMAS, STRICT)
+    call = parsed["call"] if not parsed["errors"] else None
+    assert _correct(call, tool, args), parsed
+
+
+@pytest.mark.parametrize("candidate, repair", [
+    ("{'tool': 'press_enter', 'args': {}}", "single_quotes"),
+    ('{"tool": "scroll", "args": {"amount": 800,},}', "trailing_comma"),
+    ('{"tool": "extract_page_snapshot", "args": {"full": True}}', "python_literals"),
+    ('{tool: "navigate", args: {url: "https://hh.ru"}}', "unquoted_keys"),
+    ('{"tool": "fill_field_by_index", "args": {"value": "a\nb"}}', "newline_in_string"),
+    ('{"tool": "get_current_url", "args": {}', "unclosed"),
+])
+def test_repairs(candidate, repair):
+    value, repairs = repair_json(candidate)
+    assert isinstance(value, dict) and value["tool"]
+    assert repair in repairs
+
+
+def test_apostrophes_inside_double_quotes_are_kept():
+    call, repairs = extract_tool_call('{"tool": "fill_field_by_index", "args": {"index": 1, "value": "rock\'n\'roll"}}')
+    assert call["args"]["value"] == "rock'n'roll"
+    assert repairs == []
+
+
+def test_arguments_are_coerced_and_validated():
+    parsed = parse_tool_reply('{"tool": "click_element_by_index", "args": {"index": "#5"}}', SCHEMAS)
+    assert parsed["call"]["args"] == {"index": 5}
+    parsed = parse_tool_reply('{"tool": "scroll", "args": {"direction": "left"}}', SCHEMAS)
+    assert parsed["errors"]
+
+
+def test_truncated_calls():
+    cut_in_string = parse_tool_reply('{"tool": "extract_element_text", "args": {"index": 1, "x": "об', SCHEMAS, STRICT)
+    assert cut_in_string["truncated"] and cut_in_string["errors"]
+    state_changing = parse_tool_reply('{"tool": "press_enter", "args": {}', SCHEMAS, STRICT)
+    assert state_changing["truncated"]
+    read_only = parse_tool_reply('{"tool": "get_current_url", "args": {}', SCHEMAS, STRICT)
+    assert not read_only["truncated"] and not read_only["errors"]
@@ -0,0 +1,303 @@
+import json
+import re
+from typing import Optional, Dict, Any, List, Tuple
+
+_MARKUP_RE = re.compile(r'<\|[^|]+\|>')
+_FENCE_RE = re.compile(r'```[a-zA-Z]*\s*\n?(.*?)```', re.DOTALL)
+# Символы, на которых меняется состояние сканера; остальное пропускается регуляркой
+_SPECIAL_RE = re.compile(r'[{}\[\]"\'\\]')
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _next_candidate(text: str, pos: int) -> Optional[Tuple[int, int, bool]]:
+    """
+    Следующий объект верхнего уровня: (начало, конец, закрыт ли).
+    Скобки внутри строк (в двойных и одинарных кавычках) не считаются;
+    незакрытый объект (оборванный ответ) возвращается до конца текста.
+    """
+    start = text.find("{", pos)
+    if start == -1:
+        return None
+    depth = 0
+    quote = None
+    skip = -1  # Позиция символа после обратного слэша
+    for match in _SPECIAL_RE.finditer(text, start):
+        i = match.start()
+        ch = match.group()
+        if quote:
+            if i == skip:
+                continue
+            if ch == "\\":
+                skip = i + 1
+            elif ch == quote:
+                quote = None
+            continue
+        if ch in "\"'":
+            quote = ch
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return start, i + 1, True
+    return start, len(text), False
+
+
+def _strip_trailing_comma(out: List[str]) -> bool:
+    end = len(out)
+    while end and out[end - 1].isspace():
+        end -= 1
+    if end and out[end - 1] == ",":
+        del out[end - 1]
+        return True
+    return False
+
+
+def _normalize(candidate: str, repairs: List[str]) -> str:
+    """
+    Точечный ремонт за один проход: одинарные кавычки → двойные (апострофы
+    внутри строк в двойных кавычках не трогаются), висячие запятые,
+    True/False/None, ключи без кавычек, переводы строк внутри строк,
+    незакрытые строки и скобки оборванного ответа.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote = None
+    i, n = 0, len(candidate)
+
+    def note(repair: str):
+        if repair not in repairs:
+            repairs.append(repair)
+
+    while i < n:
+        ch = candidate[i]
+        if quote:
+            if ch == "\\" and i + 1 < n:
+                nxt = candidate[i + 1]
+                # \' недопустим в JSON: внутри одинарных кавычек это просто апостроф
+                out.append("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+                note("newline_in_string")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            if ch == "'":
+                note("single_quotes")
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            if _strip_trailing_comma(out):
+                note("trailing_comma")
+            if stack:
+                stack.pop()
+            out.append(ch)
+        elif ch.isalpha() or ch == "_":
+            end = i
+            while end < n and (candidate[end].isalnum() or candidate[end] == "_"):
+                end += 1
+            word = candidate[i:end]
+            rest = candidate[end:end + 20].lstrip()
+            if word in _PY_LITERALS:
+                out.append(_PY_LITERALS[word])
+                note("python_literals")
+            elif rest.startswith(":") and stack and stack[-1] == "{":
+                out.append(f'"{word}"')
+                note("unquoted_keys")
+            else:
+                out.append(word)
+            i = end
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote or stack:
+        note("unclosed")
+        if quote:
+            # Обрыв внутри значения: строка неполная («котик…», половина URL)
+            note("unclosed_string")
+            out.append('"')
+        _strip_trailing_comma(out)
+        for opener in reversed(stack):
+            out.append(_CLOSERS[opener])
+    return "".join(out)
+
+
+def repair_json(candidate: str) -> Tuple[Optional[Any], List[str]]:
+    """Разбор JSON; при ошибке — точечный ремонт. Возвращает (значение, список починок)"""
+    try:
+        return json.loads(candidate), []
+    except json.JSONDecodeError:
+        pass
+    repairs: List[str] = []
+    try:
+        return json.loads(_normalize(candidate, repairs)), repairs
+    except json.JSONDecodeError:
+        return None, repairs
+
+
+def _find_tool_call(value: Any) -> Optional[Dict[str, Any]]:
+    """Объект с ключом "tool" (или пакет "tools") — сам value или вложенный в него"""
+    if isinstance(value, dict):
+        if "tool" in value or isinstance(value.get("tools"), list):
+            return value
+        for nested in value.values():
+            found = _find_tool_call(nested)
+            if found is not None:
+                return found
+    return None
+
+
+def _clean_strings(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _clean_strings(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_clean_strings(v) for v in obj]
+    if isinstance(obj, str):
+        return obj.strip()
+    return obj
+
+
+def extract_tool_call(text: str) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Первый вызов инструмента в ответе модели и применённые починки.
+    Сначала просматриваются блоки ```...```, затем весь текст; проверяются
+    все кандидаты по порядку, а не только первый.
+    """
+    text = _MARKUP_RE.sub("", text)
+    sources = [m.group(1) for m in _FENCE_RE.finditer(text)] + [text]
+    for position, source in enumerate(sources):
+        pos = 0
+        while True:
+            candidate = _next_candidate(source, pos)
+            if candidate is None:
+                break
+            start, end, closed = candidate
+            value, repairs = repair_json(source[start:end])
+            call = _find_tool_call(value)
+            if call is not None:
+                if position < len(sources) - 1:
+                    repairs = ["code_fence"] + repairs
+                if not closed and "unclosed" not in repairs:
+                    repairs.append("unclosed")
+                return _clean_strings(call), repairs
+            # Неразобранный кандидат может содержать корректный вложенный объект
+            pos = end if value is not None else start + 1
+    return None, []
+
+
+def _coerce(value: Any, expected: str) -> Tuple[Any, bool]:
+    if expected == "string":
+        if isinstance(value, str):
+            return value, True
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value), True
+    elif expected == "integer":
+        if isinstance(value, bool):
+            return value, False
+        if isinstance(value, int):
+            return value, True
+        if isinstance(value, float) and value.is_integer():
+            return int(value), True
+        if isinstance(value, str) and value.strip().lstrip("#").lstrip("-").isdigit():
+            return int(value.strip().lstrip("#")), True
+    elif expected == "boolean":
+        if isinstance(value, bool):
+            return value, True
+        if isinstance(value, str) and value.lower() in ("true", "false", "1", "0"):
+            return value.lower() in ("true", "1"), True
+        if isinstance(value, int):
+            return bool(value), True
+    elif expected == "array":
+        if isinstance(value, list):
+            return value, True
+    return value, False
+
+
+def validate_args(
+    tool_name: str,
+    args: Any,
+    schemas: Dict[str, Dict[str, Dict[str, Any]]]
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Аргументы, приведённые к схеме инструмента, и список ошибок (пустой — всё верно).
+    Схема: {"аргумент": {"type": "string|integer|boolean|array", "required": bool, "enum": [...]}};
+    лишние аргументы отбрасываются, совместимые значения приводятся к типу ("5" → 5).
+    """
+    schema = schemas.get(tool_name)
+    if schema is None:
+        return {}, [f"неизвестный инструмент «{tool_name}»"]
+    if not isinstance(args, dict):
+        args = {}
+    clean: Dict[str, Any] = {}
+    errors: List[str] = []
+    for name, spec in schema.items():
+        if name not in args or args[name] is None:
+            if spec.get("required"):
+                errors.append(f"{tool_name}: нет обязательного аргумента {name} ({spec['type']})")
+            continue
+        value, ok = _coerce(args[name], spec["type"])
+        if not ok:
+            errors.append(f"{tool_name}: {name} должен быть {spec['type']}, получено {args[name]!r}")
+        elif "enum" in spec and value not in spec["enum"]:
+            errors.append(f"{tool_name}: {name} — одно из {spec['enum']}, получено {value!r}")
+        else:
+            clean[name] = value
+    return clean, errors
+
+
+def parse_tool_reply(
+    text: str,
+    schemas: Dict[str, Dict[str, Dict[str, Any]]],
+    strict_tools: Optional[set] = None
+) -> Dict[str, Any]:
+    """
+    Разбор ответа модели: {"call": вызов или None, "repairs": [...], "errors": [...],
+    "truncated": bool}.
+    Аргументы вызова (и каждого действия пакета) проверены по схемам
+    (tool_registry.TOOLS.schemas()) и приведены
+    к нужным типам; ошибки схемы перечислены в errors — по ним модели
+    отправляется точечная подсказка вместо общей «ОШИБКИ ФОРМАТА».
+    
+    Оборванный ответ (починка unclosed) не выполняется, если обрыв пришёлся
+    внутрь строки или вызван инструмент из strict_tools (меняющие страницу):
+    неполный запрос или адрес хуже, чем лишний ход. Тогда truncated=True и
+    причина в errors.
+    """
+    call, repairs = extract_tool_call(text)
+    errors: List[str] = []
+    if call is None:
+        return {"call": None, "repairs": repairs, "errors": errors, "truncated": False}
+
+    calls = ([c for c in call["tools"] if isinstance(c, dict)]
+             if "tool" not in call and isinstance(call.get("tools"), list) else [call])
+    for item in calls:
+        tool_name = str(item.get("tool", "")).strip()
+        item["tool"] = tool_name
+        item["args"], item_errors = validate_args(tool_name, item.get("args", {}), schemas)
+        errors.extend(item_errors)
+
+    truncated = False
+    if "unclosed" in repairs:
+        names = [item["tool"] for item in calls]
+        strict = [name for name in names if name in (strict_tools or ())]
+        if "unclosed_string" in repairs or strict:
+            truncated = True
+            errors.append(f"ответ оборван посреди вызова {', '.join(strict or names)} — "
+                          f"вызов не выполнен, пришли его целиком")
+    return {"call": call, "repairs": repairs, "errors": errors, "truncated": truncated}
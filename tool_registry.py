@@ -0,0 +1,254 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Callable, Awaitable, Dict, Any, Optional, List
+
+from config import Config
+from tool_parser import validate_args
+from utils import url_key
+
+# Верхние границы корзин гистограммы задержек, мс (последняя — всё, что дольше)
+LATENCY_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_PLACEHOLDERS = {"string": "текст", "integer": 0, "boolean": True, "array": []}
+
+
+class ToolSpec:
+    """Описание инструмента: имя, схема аргументов и свойства выполнения"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable,
+        description: str = "",
+        schema: Optional[Dict[str, Dict[str, Any]]] = None,
+        example: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        state_changing: bool = False,
+        retry_safe: bool = False,
+        target: str = "tools",
+        in_prompt: bool = True,
+        timeout_arg_ms: Optional[str] = None
+    ):
+        self.name = name
+        self.handler = handler  # Несвязанный метод; объект подставляет агент (target)
+        self.description = description
+        self.schema = schema or {}
+        self.example = example
+        self.timeout = timeout  # секунд; None — Config.TOOL_TIMEOUT
+        self.state_changing = state_changing
+        self.retry_safe = retry_safe  # Повтор после таймаута безопасен: инструмент читает страницу или идемпотентен
+        self.target = target  # "tools" — AsyncBrowserTools, "agent" — AsyncBrowserAgent
+        self.in_prompt = in_prompt
+        self.timeout_arg_ms = timeout_arg_ms  # Аргумент с собственным таймаутом инструмента (мс)
+
+    def deadline(self, args: Dict[str, Any]) -> float:
+        """Жёсткий срок выполнения, с: объявленный или Config.TOOL_TIMEOUT, но не меньше таймаута из аргументов"""
+        deadline = self.timeout or Config.TOOL_TIMEOUT
+        if self.timeout_arg_ms and isinstance(args.get(self.timeout_arg_ms), (int, float)):
+            deadline = max(deadline, args[self.timeout_arg_ms] / 1000 + 5)
+        return deadline
+
+    @property
+    def uses_index(self) -> bool:
+        """Адресует элемент по id из снимка (после смены страницы id недействительны)"""
+        return "index" in self.schema
+
+    def example_call(self) -> str:
+        args = self.example
+        if args is None:
+            args = {name: _PLACEHOLDERS.get(spec["type"], "")
+                    for name, spec in self.schema.items() if spec.get("required")}
+        return json.dumps({"tool": self.name, "args": args}, ensure_ascii=False)
+
+
+class ToolRegistry:
+    """
+    Реестр инструментов. Заполняется декоратором @tool при определении
+    классов (один раз на процесс), из него строятся диспетчеризация, схемы
+    для tool_parser и раздел инструментов системного промпта. Каждый вызов
+    через call() выполняется с жёстким сроком (ToolSpec.deadline) и
+    учитывается в счётчиках и гистограмме задержек; таймауты дополнительно
+    считаются по страницам (timeout_report). Инструменты с retry_safe после
+    таймаута повторяются (Config.TOOL_TIMEOUT_RETRIES): сторож уже прервал
+    зависший скрипт, а повтор чтения или идемпотентного перехода безопасен.
+    """
+
+    def __init__(self):
+        self.specs: Dict[str, ToolSpec] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self.timeouts_by_page: Dict[str, Dict[str, int]] = {}
+
+    def register(self, spec: ToolSpec):
+        self.specs[spec.name] = spec
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self.specs.get(name)
+
+    def schemas(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        return {name: spec.schema for name, spec in self.specs.items()}
+
+    def names(self, **flags) -> set:
+        """Имена инструментов с заданными свойствами: names(state_changing=True)"""
+        return {name for name, spec in self.specs.items()
+                if all(getattr(spec, flag) == value for flag, value in flags.items())}
+
+    def prompt_section(self) -> str:
+        """Список инструментов для системного промпта: пример вызова и описание"""
+        lines = []
+        for spec in self.specs.values():
+            if not spec.in_prompt:
+                continue
+            line = spec.example_call()
+            if spec.description:
+                line += f"  — {spec.description}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    async def call(
+        self,
+        spec: ToolSpec,
+        target: Any,
+        args: Dict[str, Any],
+        on_timeout: Optional[Callable[[], Awaitable[Any]]] = None,
+        page_url: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Вызов инструмента с проверкой аргументов по схеме, жёстким сроком и учётом
+        задержки. По истечении срока вызов отменяется, вызывается on_timeout
+        (сторож, прерывающий зависший скрипт страницы) и возвращается результат
+        с timeout=True — модель получает его как обычную ошибку инструмента.
+        Инструмент с retry_safe перед этим повторяется до Config.TOOL_TIMEOUT_RETRIES раз.
+        """
+        clean, errors = validate_args(spec.name, args, {spec.name: spec.schema})
+        if errors:
+            result = {"success": False, "error": "; ".join(errors)}
+            self._record(spec.name, 0.0, False)
+            return result
+        deadline = spec.deadline(clean)
+        attempts = 1 + (Config.TOOL_TIMEOUT_RETRIES if spec.retry_safe else 0)
+        started = time.perf_counter()
+        success = False
+        timed_out = False
+        retries = 0
+        try:
+            for attempt in range(attempts):
+                try:
+                    result = await asyncio.wait_for(spec.handler(target, **clean), deadline)
+                except asyncio.TimeoutError:
+                    aborted = bool(await on_timeout()) if on_timeout is not None else False
+                    if attempt + 1 < attempts:
+                        retries += 1
+                        continue
+                    timed_out = True
+                    return {
+                        "success": False,
+                        "timeout": True,
+                        "timeout_s": deadline,
+                        "attempts": attempts,
+                        "aborted_script": aborted,
+                        "error": (f"{spec.name} не уложился в {deadline:g} с "
+                                  f"{'ни с одной из ' + str(attempts) + ' попыток ' if attempts > 1 else ''}"
+                                  f"и был прерван. Страница тяжёлая или зависла: "
+                                  f"попробуй другое действие или сделай новый снимок")
+                    }
+                # У результатов суб-агента нет success — ошибка там передаётся ключом error
+                success = bool(isinstance(result, dict) and result.get("success", "error" not in result))
+                return result
+        finally:
+            self._record(spec.name, (time.perf_counter() - started) * 1000, success, timed_out, page_url, retries)
+
+    def _record(self, name: str, elapsed_ms: float, success: bool, timed_out: bool = False,
+                page_url: str = "", retries: int = 0):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = {
+                    "calls": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "timeouts": 0,
+                    "retries": 0,
+                    "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                }
+            stats["calls"] += 1
+            stats["retries"] += retries
+            if timed_out:
+                stats["timeouts"] += 1
+                page = url_key(page_url) if page_url else "?"
+                by_tool = self.timeouts_by_page.setdefault(page, {})
+                by_tool[name] = by_tool.get(name, 0) + 1
+            stats["errors"] += 0 if success else 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound),
+                          len(LATENCY_BUCKETS_MS))
+            stats["histogram"][bucket] += 1
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Счётчики по инструментам; гистограмма — {"≤100ms": n, ..., ">30000ms": n}"""
+        labels = [f"≤{bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        with self._lock:
+            return {
+                name: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "avg_ms": round(stats["total_ms"] / stats["calls"], 1) if stats["calls"] else 0.0,
+                    "max_ms": round(stats["max_ms"], 1),
+                    "timeouts": stats["timeouts"],
+                    "retries": stats["retries"],
+                    "histogram": {label: count for label, count in zip(labels, stats["histogram"]) if count}
+                }
+                for name, stats in self.stats.items()
+            }
+
+    def timeout_report(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Страницы (домен + путь) с наибольшим числом таймаутов и инструменты, на которых они случились"""
+        with self._lock:
+            pages = sorted(self.timeouts_by_page.items(), key=lambda item: -sum(item[1].values()))
+            return [{"page": page, "timeouts": sum(tools.values()), "tools": dict(tools)}
+                    for page, tools in pages[:limit]]
+
+
+# Реестр процесса: инструменты регистрируются при импорте browser_tools / browser_agent
+TOOLS = ToolRegistry()
+
+
+def tool(
+    name: Optional[str] = None,
+    description: str = "",
+    schema: Optional[Dict[str, Dict[str, Any]]] = None,
+    example: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    state_changing: bool = False,
+    retry_safe: bool = False,
+    target: str = "tools",
+    in_prompt: bool = True,
+    timeout_arg_ms: Optional[str] = None
+) -> Callable:
+    """
+    Объявляет метод инструментом агента:
+
+        @tool(schema={"url": {"type": "string", "required": True}}, state_changing=True)
+        async def navigate(self, url: str) -> Dict[str, Any]: ...
+
+    Аргументы схемы передаются в метод именованными параметрами.
+    """
+    def decorator(fn: Callable) -> Callable:
+        TOOLS.register(ToolSpec(
+            name or fn.__name__, fn,
+            description=description,
+            schema=schema,
+            example=example,
+            timeout=timeout,
+            state_changing=state_changing,
+            retry_safe=retry_safe,
+            target=target,
+            in_prompt=in_prompt,
+            timeout_arg_ms=timeout_arg_ms
+        ))
+        return fn
+    return decorator
@@ -0,0 +1,164 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator, Callable
+
+_current_tracer: contextvars.ContextVar[Optional["Tracer"]] = contextvars.ContextVar("tracer", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    """Отрезок времени с именем, родителем и атрибутами"""
+
+    def __init__(self, name: str, span_id: int, parent_id: Optional[int], start: float, attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = start
+        self.end: Optional[float] = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Сбор span'ов одного прогона агента.
+    Текущий tracer и родительский span хранятся в contextvars, поэтому
+    параллельные сессии в одном event loop не смешивают свои трассы, а
+    инструменты и LLM-вызовы находят tracer без явной передачи.
+    """
+
+    def __init__(self, name: str = "run"):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        parent = _current_span.get()
+        with self._lock:
+            span = Span(name, self._next_id, parent.span_id if parent else None, time.perf_counter(), attrs)
+            self._next_id += 1
+            self.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+
+    # ----- Экспорт -----
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return [{
+            "name": span.name,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "start_ms": round((span.start - self.origin) * 1000, 3),
+            "duration_ms": round(span.duration_ms, 3),
+            "attrs": span.attrs
+        } for span in self.spans]
+
+    def export_jsonl(self, path: str):
+        """Один span на строку"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in self.to_records():
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def export_chrome_trace(self, path: str):
+        """Формат Chrome Trace Event (chrome://tracing, Perfetto)"""
+        events = [{
+            "name": record["name"],
+            "cat": record["name"].split(".")[0],
+            "ph": "X",
+            "ts": record["start_ms"] * 1000,
+            "dur": record["duration_ms"] * 1000,
+            "pid": os.getpid(),
+            "tid": self.name,
+            "args": record["attrs"]
+        } for record in self.to_records()]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Суммарное время и число вызовов по именам span'ов"""
+        result: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            item = result.setdefault(span.name, {"count": 0, "total_ms": 0.0})
+            item["count"] += 1
+            item["total_ms"] = round(item["total_ms"] + span.duration_ms, 3)
+        return result
+
+
+def set_tracer(tracer: Optional[Tracer]) -> contextvars.Token:
+    return _current_tracer.set(tracer)
+
+
+def reset_tracer(token: contextvars.Token):
+    _current_tracer.reset(token)
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Any]:
+    """Span в текущем tracer; без активного tracer ничего не записывает"""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield _NULL_SPAN
+        return
+    with tracer.span(name, **attrs) as current:
+        yield current
+
+
+def traced(fn: Callable) -> Callable:
+    """
+    Декоратор для async-методов BrowserTools: span "tools.<имя>" с итогом
+    вызова (success) и размером ответа инструмента в байтах.
+    """
+    name = f"tools.{fn.__name__}"
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if _current_tracer.get() is None:
+            return await fn(*args, **kwargs)
+        with span(name) as current:
+            result = await fn(*args, **kwargs)
+            if isinstance(result, dict):
+                current.set(
+                    success=result.get("success"),
+                    payload_bytes=len(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8")),
+                    settle_ms=result.get("settle_ms")
+                )
+            return result
+
+    return wrapper
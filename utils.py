@@ -1,7 +1,13 @@
+import asyncio
 import logging
 import json
 import re
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, List, Awaitable, TypeVar
+from urllib.parse import urlparse
+
+from config import Config
+from tool_parser import extract_tool_call
 
 # Настройка логирования
 logging.basicConfig(
@@ -11,58 +17,119 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
+T = TypeVar("T")
+
+class EventLoopThread:
     """
-    Извлекает ПЕРВЫЙ валидный JSON объект с ключом "tool" из текста.
-    Работает с чистым JSON и текстом + JSON.
-    Автоматически очищает строки от пробелов.
+    Фоновый поток с собственным asyncio event loop.
+    Позволяет синхронному коду (BrowserAgent, BrowserTools) вызывать корутины
+    async-движка, не блокируя другие сессии, работающие в том же loop.
     """
-    import json
-    import re
     
-    # Удаляем артефакты разметки
-    text = re.sub(r'<\|[^|]+\|>', '', text)
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
     
-    # Находим первую открывающую скобку
-    start = text.find('{')
-    if start == -1:
-        return None
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Выполняет корутину в фоновом loop и ждёт результат"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout)
     
-    # Находим соответствующую закрывающую скобку (учитываем вложенность)
-    depth = 0
-    for i in range(start, len(text)):
-        if text[i] == '{':
-            depth += 1
-        elif text[i] == '}':
-            depth -= 1
-            if depth == 0:
-                json_str = text[start:i+1]
-                try:
-                    # Пробуем распарсить
-                    parsed = json.loads(json_str)
-                except json.JSONDecodeError:
-                    # Пробуем исправить одинарные кавычки
-                    try:
-                        parsed = json.loads(json_str.replace("'", '"'))
-                    except:
-                        return None
-                
-                # Проверяем наличие обязательного ключа
-                if isinstance(parsed, dict) and "tool" in parsed:
-                    # Рекурсивная очистка всех строковых значений
-                    def clean_strings(obj):
-                        if isinstance(obj, dict):
-                            return {k: clean_strings(v) for k, v in obj.items()}
-                        elif isinstance(obj, list):
-                            return [clean_strings(v) for v in obj]
-                        elif isinstance(obj, str):
-                            return obj.strip()
-                        return obj
-                    
-                    return clean_strings(parsed)
-                break
-    
-    return None
+    def stop(self):
+        """Останавливает loop и дожидается завершения потока"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        if not self.loop.is_running():
+            self.loop.close()
+
+def extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Извлекает первый JSON объект с ключом "tool" (или пакет "tools") из текста.
+    Работает с чистым JSON, текстом + JSON и блоками ```json```; типичные
+    ошибки модели (одинарные кавычки, висячие запятые, оборванный ответ)
+    чинятся точечно (см. tool_parser). Строки очищаются от пробелов.
+    """
+    return extract_tool_call(text)[0]
+
+class ToolCallStreamParser:
+    """
+    Инкрементальный поиск первого вызова инструмента в потоке ответа модели.
+    feed() принимает очередной фрагмент и возвращает True, как только в тексте
+    закрылся первый сбалансированный JSON-объект с ключом "tool" (или пакет
+    "tools") — дальше
+    поток можно прервать. Скобки внутри строк не учитываются; каждый символ
+    просматривается один раз.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.end: Optional[int] = None  # Позиция сразу за найденным объектом
+        self._pos = 0
+        self._depth = 0
+        self._start = -1
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"' and self._depth > 0:
+                self._in_string = True
+            elif ch == '{':
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._is_tool_call(text[self._start:i + 1]):
+                    self.end = i + 1
+                    self._pos = i + 1
+                    return True
+        self._pos = len(text)
+        return False
+
+    @staticmethod
+    def _is_tool_call(candidate: str) -> bool:
+        if '"tool' not in candidate and "'tool" not in candidate:
+            return False
+        return extract_json_from_text(candidate) is not None
+
+    def result(self) -> str:
+        """Текст ответа до конца найденного вызова (или весь текст)"""
+        return self.text[:self.end] if self.done else self.text
+
+def url_key(url: str) -> str:
+    """Домен и путь без query — так сравниваются страницы (макросы, счётчики таймаутов)"""
+    parsed = urlparse(url)
+    return f"{parsed.netloc.lower()}{parsed.path.rstrip('/')}"
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка числа токенов без токенизатора провайдера.
+    Для смешанного русского/английского текста и JSON ≈ 3 символа на токен
+    (оценка с запасом: лучше сжать историю чуть раньше, чем переполнить контекст).
+    """
+    if not text:
+        return 0
+    return len(text) // 3 + 1
 
 def truncate_text(text: str, max_length: int = 1500) -> str:
     """Усекает текст до заданной длины"""
@@ -138,7 +205,7 @@ def confirm_action(action: str, details: str) -> bool:
         if confirm in ["да", "нет", "y", "n"]:
             return confirm in ["да", "y"]
         print("Пожалуйста, введите 'да' или 'нет'")
-    # utils.py
+
 def prioritize_elements(elements: List[Dict], task: str) -> List[Dict]:
     """Приоритизирует элементы на основе задачи (оставляет только релевантные)"""
     # Пример: для задачи "удалить спам" оставляем только чекбоксы и кнопки удаления
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Регистр и пробелы не влияют на вердикт"""
+    return " ".join(str(text).lower().split())
+
+
+def verdict_key(kind: str, text: str, context: str = "") -> str:
+    """
+    Ключ вердикта: тип анализа, нормализованный текст элемента и контекст
+    (для вакансий — профиль кандидата: другой профиль — другая оценка).
+    """
+    payload = "\x1f".join((kind, normalize_text(context), normalize_text(text)))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Постоянный кэш вердиктов суб-агента по отдельным элементам (SQLite).
+    При повторном просмотре почты заново классифицируются только новые или
+    изменившиеся письма, остальные вердикты берутся отсюда.
+    Вместе с вердиктом хранится нормализованный текст (до Config.SUBAGENT_CACHE_TEXT_CHARS
+    символов) — на нём обучается локальный предклассификатор (spam_filter).
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[float] = None):
+        self.path = path or Config.SUBAGENT_CACHE_PATH
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.SUBAGENT_CACHE_TTL
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(verdicts)")}
+        if "text" not in columns:
+            self._db.execute("ALTER TABLE verdicts ADD COLUMN text TEXT")
+        self._db.commit()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0
+        }
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Найденные вердикты по ключам (просроченные не возвращаются)"""
+        unique = list(dict.fromkeys(keys))
+        found: Dict[str, Dict[str, Any]] = {}
+        min_created = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            # Ограничение SQLite на число параметров в запросе
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, verdict FROM verdicts WHERE created_at >= ? "
+                    f"AND key IN ({','.join('?' * len(part))})",
+                    [min_created, *part]
+                ).fetchall()
+                for key, verdict in rows:
+                    found[key] = json.loads(verdict)
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(unique) - len(found)
+        return found
+
+    def put_many(self, kind: str, verdicts: Dict[str, Dict[str, Any]], texts: Optional[Dict[str, str]] = None):
+        now = time.time()
+        texts = texts or {}
+        limit = Config.SUBAGENT_CACHE_TEXT_CHARS
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, kind, verdict, created_at, text) VALUES (?, ?, ?, ?, ?)",
+                [(key, kind, json.dumps(verdict, ensure_ascii=False), now,
+                  normalize_text(texts[key])[:limit] if key in texts and limit else None)
+                 for key, verdict in verdicts.items()]
+            )
+            self._db.commit()
+            self.stats["writes"] += len(verdicts)
+
+    def training_samples(self, kind: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Пары (текст, вердикт) для обучения локального классификатора"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT text, verdict FROM verdicts WHERE kind = ? AND text IS NOT NULL", (kind,)
+            ).fetchall()
+        for text, verdict in rows:
+            yield text, json.loads(verdict)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_shared_cache: Optional[VerdictCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_verdict_cache() -> Optional[VerdictCache]:
+    """Общий кэш вердиктов процесса; None, если Config.SUBAGENT_CACHE_PATH не задан"""
+    global _shared_cache
+    if not Config.SUBAGENT_CACHE_PATH:
+        return None
+    with _shared_lock:
+        if _shared_cache is None or _shared_cache.path != Config.SUBAGENT_CACHE_PATH:
+            _shared_cache = VerdictCache(Config.SUBAGENT_CACHE_PATH)
+        return _shared_cache